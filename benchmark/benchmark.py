@@ -0,0 +1,264 @@
+"""Load test of every route of the app against a local fake of Earth Engine.
+
+Runs each scenario with concurrent requests through the WSGI app, reports
+the p50, p95 and p99 latencies and the requests per second, and fails when
+a scenario is slower than its baseline by more than the tolerance.
+
+  python benchmark/benchmark.py
+  python benchmark/benchmark.py --latency 0.2 --images 500
+  python benchmark/benchmark.py --update-baseline
+
+Baselines depend on the machine, update them on the machine that runs the
+comparison.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+BENCHMARK_PATH = os.path.dirname(os.path.abspath(__file__))
+REPO_PATH = os.path.dirname(BENCHMARK_PATH)
+BASELINE_FILE = os.path.join(BENCHMARK_PATH, 'baseline.json')
+
+MAP_IDS = ['0', '1', '2', '3', '4', '5', '6']
+HOT_COUNTRIES = 20 # Countries requested by the details scenario, so that some requests hit the cache
+CUSTOM_POLYGONS = 10 # Distinct polygons posted by the custom scenario
+
+##################################################################################################
+# SCENARIOS
+##################################################################################################
+
+def customPolygon(i):
+  x = (i % CUSTOM_POLYGONS) * 2.0
+  return json.dumps({
+    'type': 'Feature',
+    'properties': {},
+    'geometry': {'type': 'Polygon', 'coordinates': [[[x, 40], [x + 1.5, 40], [x + 1.5, 41.5], [x, 41.5], [x, 40]]]}
+  })
+
+def customCollection(i, size = 10):
+  """Returns a FeatureCollection of size polygons, the same ones every CUSTOM_POLYGONS requests."""
+  features = list()
+  for j in range(size):
+    feature = json.loads(customPolygon(j))
+    feature['id'] = str(j)
+    feature['geometry']['coordinates'][0] = [[x, y + (i % CUSTOM_POLYGONS) * 2.0]
+      for x, y in feature['geometry']['coordinates'][0]]
+    features.append(feature)
+  return json.dumps({'type': 'FeatureCollection', 'features': features})
+
+def buildScenarios(main, requests):
+  """Returns the scenarios as (name, number of requests, function from index to request)."""
+  countries = main.COUNTRIES_ID[:HOT_COUNTRIES]
+  # Precomputing a layer reduces every country, those scenarios send fewer requests
+  heavy = max(len(MAP_IDS), requests // 20)
+  return [
+    ('index', requests, lambda i: ('GET', '/', None)),
+    ('map', requests, lambda i: ('GET', '/map/' + MAP_IDS[i % len(MAP_IDS)], None)),
+    ('details', requests, lambda i: ('GET', '/details/' + MAP_IDS[i % len(MAP_IDS)] + '/'
+      + countries[i // len(MAP_IDS) % len(countries)], None)),
+    ('details_all', requests, lambda i: ('GET', '/details/' + MAP_IDS[i % len(MAP_IDS)], None)),
+    ('details_stream', heavy, lambda i: ('GET', '/details/' + MAP_IDS[i % len(MAP_IDS)] + '?stream=1', None)),
+    ('custom', requests, lambda i: ('POST', '/custom/' + MAP_IDS[i % len(MAP_IDS)] + '/4',
+      {customPolygon(i // len(MAP_IDS)): ''})),
+    ('custom_batch', heavy, lambda i: ('POST', '/custom/' + MAP_IDS[i % len(MAP_IDS)] + '/4/batch',
+      customCollection(i // len(MAP_IDS)))),
+    ('save', heavy, lambda i: ('GET', '/save/' + MAP_IDS[i % len(MAP_IDS)], None)),
+    ('static', heavy, lambda i: ('GET', '/static/' + MAP_IDS[i % len(MAP_IDS)], None))
+  ]
+
+
+##################################################################################################
+# APP SETUP
+##################################################################################################
+
+class MemoryMemcache(object):
+  """Stand-in for the memcache client, keeping the values in a dict."""
+
+  def __init__(self):
+    self.values = dict()
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    return self.values.get(key)
+
+  def get_many(self, keys):
+    values = self.values
+    return dict((key, values[key]) for key in keys if key in values)
+
+  def set(self, key, value, expire = 0, noreply = None):
+    self.values[key] = value
+    return True
+
+  def add(self, key, value, expire = 0, noreply = None):
+    with self.lock:
+      if key in self.values:
+        return False
+      self.values[key] = value
+    return True
+
+  def set_many(self, values, expire = 0, noreply = None):
+    with self.lock:
+      self.values.update(values)
+    return []
+
+  def delete(self, key, noreply = None):
+    self.values.pop(key, None)
+    return True
+
+def loadApp(args, workdir):
+  """Imports the app with the fake ee module, caching and precomputing in workdir."""
+  sys.path.insert(0, REPO_PATH)
+  # The fake ee package next to this file shadows the real client
+  sys.path.insert(0, BENCHMARK_PATH)
+  os.chdir(REPO_PATH)
+  import ee
+  ee.configure(latency = args.latency, images = args.images, histogram_buckets = args.histogram_buckets)
+  import main
+  from cache import DiskCache
+  from jobs import JobQueue
+  logging.getLogger(main.LOGGER_TYPE).setLevel(logging.WARNING)
+  main.CACHE = 1
+  main.SAVE = 1
+  main.mc.remote = MemoryMemcache()
+  main.custom_cache = DiskCache(os.path.join(workdir, 'custom'))
+  # The save and static scenarios measure queuing the precompute jobs
+  main.jobs = JobQueue(os.path.join(workdir, 'jobs.sqlite'))
+  main.DETAILS_PATH = os.path.join(workdir, 'details') + os.sep
+  os.makedirs(main.DETAILS_PATH)
+  return main
+
+
+##################################################################################################
+# LOAD
+##################################################################################################
+
+def runScenario(app, requests, build, concurrency):
+  clients = threading.local()
+
+  def send(i):
+    client = getattr(clients, 'client', None)
+    if client is None:
+      client = clients.client = app.test_client()
+    method, path, data = build(i)
+    start = time.time()
+    response = client.open(path, method = method, data = data)
+    # Streamed bodies are only produced while they are read
+    response.get_data()
+    return time.time() - start, response.status_code
+
+  start = time.time()
+  with ThreadPoolExecutor(max_workers = concurrency) as executor:
+    results = list(executor.map(send, range(requests)))
+  elapsed = time.time() - start
+  latencies = numpy.array([latency for latency, status in results]) * 1000
+  p50, p95, p99 = numpy.percentile(latencies, [50, 95, 99])
+  return {
+    'requests': requests,
+    'errors': sum(1 for latency, status in results if status >= 400),
+    'p50': round(float(p50), 2),
+    'p95': round(float(p95), 2),
+    'p99': round(float(p99), 2),
+    'rps': round(requests / elapsed, 2)
+  }
+
+def compare(results, baseline, tolerance, slack):
+  """Returns the regressions of the results against the baseline."""
+  failures = list()
+  for name, result in results.items():
+    expected = baseline.get(name)
+    if expected is None:
+      # A new scenario would never be checked, the baseline needs updating
+      failures.append(name + ' missing from the baseline, run with --update-baseline')
+      continue
+    for key in ('p50', 'p95', 'p99'):
+      limit = expected[key] * (1 + tolerance) + slack
+      if result[key] > limit:
+        failures.append(name + ' ' + key + ' ' + str(result[key]) + ' ms > ' + str(round(limit, 2)) + ' ms')
+    limit = expected['rps'] * (1 - tolerance)
+    if result['rps'] < limit:
+      failures.append(name + ' rps ' + str(result['rps']) + ' < ' + str(round(limit, 2)))
+    if result['errors'] > expected['errors']:
+      failures.append(name + ' errors ' + str(result['errors']) + ' > ' + str(expected['errors']))
+  return failures
+
+def formatResults(results):
+  lines = ['%-16s %8s %7s %10s %10s %10s %10s' % ('scenario', 'requests', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'rps')]
+  for name, result in results.items():
+    lines.append('%-16s %8d %7d %10.2f %10.2f %10.2f %10.2f' % (name, result['requests'], result['errors'],
+      result['p50'], result['p95'], result['p99'], result['rps']))
+  return '\n'.join(lines)
+
+def parseArgs():
+  parser = argparse.ArgumentParser(description = 'Load test of the app against a fake Earth Engine.')
+  parser.add_argument('--requests', type = int, default = 200, help = 'requests per scenario')
+  parser.add_argument('--concurrency', type = int, default = 16, help = 'requests in flight')
+  parser.add_argument('--latency', type = float, default = 0.05, help = 'seconds of each EE call')
+  parser.add_argument('--images', type = int, default = 200, help = 'images per EE collection')
+  parser.add_argument('--histogram-buckets', type = int, default = 50, help = 'buckets per EE histogram')
+  parser.add_argument('--scenario', action = 'append', help = 'run only this scenario, can be repeated')
+  parser.add_argument('--baseline', default = BASELINE_FILE, help = 'baseline JSON file')
+  parser.add_argument('--update-baseline', action = 'store_true', help = 'store the results as baseline')
+  parser.add_argument('--tolerance', type = float, default = 0.5, help = 'allowed relative regression')
+  parser.add_argument('--slack', type = float, default = 10, help = 'allowed absolute latency regression, ms')
+  parser.add_argument('--output', help = 'also write the report to this file')
+  return parser.parse_args()
+
+def main():
+  args = parseArgs()
+  settings = {
+    'requests': args.requests, 'concurrency': args.concurrency, 'latency': args.latency,
+    'images': args.images, 'histogram_buckets': args.histogram_buckets
+  }
+  workdir = tempfile.mkdtemp(prefix = 'earthengine-app-benchmark-')
+  try:
+    app_module = loadApp(args, workdir)
+    results = dict()
+    for name, requests, build in buildScenarios(app_module, args.requests):
+      if args.scenario and name not in args.scenario:
+        continue
+      results[name] = runScenario(app_module.app, requests, build, args.concurrency)
+  finally:
+    shutil.rmtree(workdir, ignore_errors = True)
+
+  report = [formatResults(results)]
+  status = 0
+  if args.update_baseline:
+    baseline = {'settings': settings, 'scenarios': results}
+    with open(args.baseline, 'w') as f:
+      json.dump(baseline, f, indent = 2, sort_keys = True)
+      f.write('\n')
+    report.append('Baseline written to ' + args.baseline)
+  elif os.path.exists(args.baseline):
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    if baseline['settings'] != settings:
+      report.append('Baseline settings ' + json.dumps(baseline['settings'], sort_keys = True)
+        + ' differ from this run, not compared')
+    else:
+      failures = compare(results, baseline['scenarios'], args.tolerance, args.slack)
+      for failure in failures:
+        report.append('REGRESSION ' + failure)
+      if failures:
+        status = 1
+      else:
+        report.append('No regression against ' + args.baseline)
+
+  report = '\n'.join(report)
+  print(report)
+  if args.output:
+    with open(args.output, 'w') as f:
+      f.write(report + '\n')
+  return status
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,286 @@
+"""Local stand-in for the Earth Engine client, used by the benchmarks.
+
+Implements the part of the ee API used by main.py. Expressions are not
+evaluated: getInfo and getMapId wait LATENCY seconds and return random
+values shaped like the real responses, with IMAGES images per collection
+and HISTOGRAM_BUCKETS buckets per histogram.
+"""
+import collections
+import random
+import threading
+import time
+
+LATENCY = 0.05 # Seconds of every getInfo and getMapId call
+IMAGES = 200 # Images per collection
+HISTOGRAM_BUCKETS = 50 # Buckets of histogram reductions
+
+START_TIME = 1356998400000 # 2013-01-01, system:time_start of the first image
+IMAGE_INTERVAL = 8 * 24 * 60 * 60 * 1000
+
+# Bands of the assets used by the app, with the range of their random values
+BANDS = {
+  'srtm90_v4': {'elevation': (0, 3000)},
+  'NOAA/DMSP-OLS/NIGHTTIME_LIGHTS': {'stable_lights': (0, 63)},
+  'MODIS/MOD11A2': {'LST_Day_1km': (13000, 16000)},
+  'JRC/GSW1_0/GlobalSurfaceWater': {'occurrence': (0, 100), 'change_abs': (-100, 100)},
+  'JRC/GSW1_0/YearlyHistory': {'waterClass': (0, 3)},
+  'UMD/hansen/global_forest_change_2015': {'treecover2000': (0, 100), 'gain': (0, 1), 'loss': (0, 1)},
+  'MODIS/MCD43A4_NDVI': {'NDVI': (0, 1)}
+}
+
+calls = collections.Counter()
+calls_lock = threading.Lock()
+
+def configure(latency = None, images = None, histogram_buckets = None):
+  global LATENCY, IMAGES, HISTOGRAM_BUCKETS
+  if latency is not None:
+    LATENCY = latency
+  if images is not None:
+    IMAGES = images
+  if histogram_buckets is not None:
+    HISTOGRAM_BUCKETS = histogram_buckets
+
+def call(name):
+  """Counts a call to the EE servers and waits for its simulated latency."""
+  with calls_lock:
+    calls[name] += 1
+  if LATENCY:
+    time.sleep(LATENCY)
+
+
+class EEException(Exception):
+  pass
+
+
+class Credentials(object):
+  access_token_expired = False
+
+  def refresh(self, http):
+    pass
+
+def ServiceAccountCredentials(account, key_file):
+  return Credentials()
+
+def Initialize(credentials = None):
+  call('Initialize')
+
+
+class ComputedObject(object):
+  """Operations that do not change the simulated result return the object."""
+
+  def __getattr__(self, name):
+    if name.startswith('__'):
+      raise AttributeError(name)
+    return lambda *args, **kwargs: self
+
+
+class Number(ComputedObject):
+
+  def __init__(self, value):
+    self.value = value
+
+  def getInfo(self):
+    call('getInfo')
+    return self.value
+
+
+class Date(ComputedObject):
+
+  def __init__(self, value):
+    self.value = value
+
+  def get(self, unit):
+    return Number(2013)
+
+
+class Dictionary(ComputedObject):
+
+  def __init__(self, values):
+    self.values = values
+
+  def get(self, key):
+    return self.values.get(key)
+
+
+class Filter(ComputedObject):
+
+  def __init__(self, name, value):
+    self.name = name
+    self.value = value
+
+  @staticmethod
+  def gt(name, value):
+    return Filter(name, value)
+
+
+class Reducer(ComputedObject):
+
+  def __init__(self, kind, outputs = None):
+    self.kind = kind
+    self.outputs = outputs
+
+  @staticmethod
+  def mean():
+    return Reducer('mean')
+
+  @staticmethod
+  def histogram():
+    return Reducer('histogram')
+
+  @staticmethod
+  def linearFit():
+    return Reducer('linearFit')
+
+  def setOutputs(self, outputs):
+    return Reducer(self.kind, outputs)
+
+  def reduce(self, value_range):
+    low, high = value_range
+    if self.kind != 'histogram':
+      return random.uniform(low, high)
+    width = float(high - low) / HISTOGRAM_BUCKETS
+    return {
+      'bucketMin': low,
+      'bucketWidth': width,
+      'bucketMeans': [low + width * (i + 0.5) for i in range(HISTOGRAM_BUCKETS)],
+      'histogram': [random.randint(0, 1000) for i in range(HISTOGRAM_BUCKETS)]
+    }
+
+
+class Image(ComputedObject):
+
+  def __init__(self, asset = None, time_start = START_TIME, bands = None):
+    if isinstance(asset, Image):
+      asset, time_start, bands = asset.asset, asset.time_start, asset.bands
+    self.asset = asset
+    self.time_start = time_start
+    self.bands = bands if bands is not None else BANDS.get(asset, {'constant': (0, 1)})
+
+  def select(self, *bands):
+    if len(bands) == 1 and isinstance(bands[0], list):
+      bands = bands[0]
+    return Image(self.asset, self.time_start, dict((band, self.bands[band]) for band in bands))
+
+  def get(self, name):
+    if name == 'system:time_start':
+      return self.time_start
+    return None
+
+  def reduceRegion(self, reducer, geometry = None, scale = None):
+    return Dictionary(dict((band, reducer.reduce(r)) for band, r in self.bands.items()))
+
+  def reduceRegions(self, collection, reducer, scale = None):
+    bands = list(self.bands)
+    # Like EE, single band outputs are named after the reducer unless set
+    names = reducer.outputs or (bands if len(bands) > 1 else [reducer.kind])
+    features = list()
+    for feature in collection.features:
+      properties = dict(feature.properties)
+      for name, band in zip(names, bands):
+        properties[name] = reducer.reduce(self.bands[band])
+      features.append(Feature(feature.geom, properties))
+    return FeatureCollection(features)
+
+  def getMapId(self, vis_params = None):
+    call('getMapId')
+    return {'mapid': 'fake-%08x' % random.getrandbits(32), 'token': 'fake-%08x' % random.getrandbits(32)}
+
+
+class ImageCollection(ComputedObject):
+
+  def __init__(self, asset = None, bands = None, since = None):
+    self.asset = asset
+    self.bands = bands if bands is not None else BANDS.get(asset, {'constant': (0, 1)})
+    self.since = since
+
+  def images(self):
+    images = list()
+    for i in range(IMAGES):
+      time_start = START_TIME + i * IMAGE_INTERVAL
+      if self.since is None or time_start > self.since:
+        images.append(Image(self.asset, time_start, self.bands))
+    return images
+
+  def select(self, *bands):
+    if len(bands) == 1 and isinstance(bands[0], list):
+      bands = bands[0]
+    return ImageCollection(self.asset, dict((band, self.bands[band]) for band in bands), self.since)
+
+  def filter(self, condition):
+    return ImageCollection(self.asset, self.bands, condition.value)
+
+  def map(self, function):
+    results = [function(image) for image in self.images()]
+    if results and all(isinstance(result, Image) for result in results):
+      return ImageCollection(self.asset, self.bands, self.since)
+    return FeatureCollection(results)
+
+  def size(self):
+    return Number(len(self.images()))
+
+  def aggregate_max(self, name):
+    images = self.images()
+    return Number(images[-1].time_start if images else None)
+
+  def mean(self):
+    return Image(self.asset, START_TIME, self.bands)
+
+  def median(self):
+    return Image(self.asset, START_TIME, self.bands)
+
+  def reduce(self, reducer):
+    return Image(self.asset, START_TIME, self.bands)
+
+
+class Feature(ComputedObject):
+
+  def __init__(self, geometry = None, properties = None):
+    self.geom = geometry
+    self.properties = dict(properties or {})
+    if isinstance(geometry, dict) and geometry.get('type') == 'Feature':
+      self.geom = geometry.get('geometry')
+      self.properties = dict(geometry.get('properties') or {}, **self.properties)
+
+  def geometry(self):
+    return self.geom
+
+  def get(self, name):
+    return self.properties.get(name)
+
+  def set(self, *args):
+    properties = dict(self.properties)
+    if len(args) == 1:
+      properties.update(args[0])
+    else:
+      properties[args[0]] = args[1]
+    return Feature(self.geom, properties)
+
+  def getInfo(self):
+    call('getInfo')
+    return {'type': 'Feature', 'geometry': None, 'properties': dict(self.properties)}
+
+
+class FeatureCollection(ComputedObject):
+
+  def __init__(self, features):
+    self.features = list(features)
+
+  def map(self, function):
+    return FeatureCollection(function(feature) for feature in self.features)
+
+  def flatten(self):
+    features = list()
+    for feature in self.features:
+      if isinstance(feature, FeatureCollection):
+        features.extend(feature.features)
+      else:
+        features.append(feature)
+    return FeatureCollection(features)
+
+  def getInfo(self):
+    call('getInfo')
+    return {
+      'type': 'FeatureCollection',
+      'features': [{'type': 'Feature', 'geometry': None, 'properties': dict(feature.properties)}
+        for feature in self.features]
+    }
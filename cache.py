@@ -0,0 +1,360 @@
+import os
+import threading
+import time
+import collections
+import logging
+
+logger = logging.getLogger('console')
+
+##################################################################################################
+# IN-PROCESS CACHE
+##################################################################################################
+
+class LRUCache(object):
+  """Bounded in-process cache evicting the least recently used entries.
+
+  Entries also expire after ttl seconds, so values refreshed in memcache by
+  other workers are eventually seen by this one.
+  """
+
+  def __init__(self, max_items = 2048, ttl = 300):
+    self.max_items = max_items
+    self.ttl = ttl
+    self.lock = threading.Lock()
+    self.items = collections.OrderedDict()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.items.get(key)
+      if entry is None:
+        return None
+      value, expires = entry
+      if expires <= time.time():
+        del self.items[key]
+        return None
+      # Move the key to the end, the most recently used position
+      del self.items[key]
+      self.items[key] = entry
+      return value
+
+  def set(self, key, value, ttl = None):
+    if ttl is None:
+      ttl = self.ttl
+    with self.lock:
+      self.items.pop(key, None)
+      self.items[key] = (value, time.time() + ttl)
+      while len(self.items) > self.max_items:
+        self.items.popitem(last = False)
+
+  def delete(self, key):
+    with self.lock:
+      self.items.pop(key, None)
+
+  def __len__(self):
+    return len(self.items)
+
+
+##################################################################################################
+# ACCESS FREQUENCY
+##################################################################################################
+
+class AccessCounter(object):
+  """Recent access frequency of keys.
+
+  Every hit adds one to the score of a key, and scores halve every
+  half_life seconds, so keys accessed often lately rank first. At most
+  max_keys keys are tracked, the lowest scores are dropped beyond that.
+  """
+
+  def __init__(self, half_life = 3600, max_keys = 10000):
+    self.half_life = float(half_life)
+    self.max_keys = max_keys
+    self.lock = threading.Lock()
+    self.scores = dict() # key -> (score, time of the score)
+
+  def decayed(self, entry, now):
+    score, updated = entry
+    return score * 0.5 ** ((now - updated) / self.half_life)
+
+  def hit(self, key):
+    now = time.time()
+    with self.lock:
+      entry = self.scores.get(key)
+      self.scores[key] = ((self.decayed(entry, now) if entry is not None else 0) + 1, now)
+      if len(self.scores) > self.max_keys:
+        # Drops a tenth of the keys at once, so pruning is not paid on every hit
+        ranked = sorted(self.scores, key = lambda k: self.decayed(self.scores[k], now))
+        for k in ranked[:len(ranked) - self.max_keys * 9 // 10]:
+          del self.scores[k]
+
+  def top(self, n, min_score = 0):
+    """Returns up to n (key, score) with the highest scores, at least min_score."""
+    now = time.time()
+    with self.lock:
+      scores = [(key, self.decayed(entry, now)) for key, entry in self.scores.items()]
+    scores = [item for item in scores if item[1] >= min_score]
+    scores.sort(key = lambda item: item[1], reverse = True)
+    return scores[:n]
+
+  def __len__(self):
+    return len(self.scores)
+
+
+##################################################################################################
+# TWO TIER CACHE
+##################################################################################################
+
+class Flight(object):
+  """A computation in progress that other requests for the same key wait for."""
+
+  def __init__(self):
+    self.event = threading.Event()
+    self.value = None
+    self.error = None
+
+
+class TwoTierCache(object):
+  """In-process LRU tier in front of a memcache client.
+
+  Remote errors are logged and counted as misses, so the local tier keeps
+  working when memcached is down. get_or_compute runs a single computation
+  per missing key, the other callers wait for its result. observe, when
+  given, is called with the operation and seconds of every remote call.
+  """
+
+  def __init__(self, remote, max_items = 2048, ttl = 300, observe = None):
+    self.remote = remote
+    self.observe = observe
+    self.local = LRUCache(max_items, ttl)
+    self.flights = dict()
+    self.flights_lock = threading.Lock()
+    self.counters_lock = threading.Lock()
+    self.counters = {
+      'local_hits': 0,
+      'remote_hits': 0,
+      'misses': 0,
+      'coalesced': 0,
+      'computed': 0,
+      'remote_errors': 0
+    }
+
+  def count(self, name, n = 1):
+    with self.counters_lock:
+      self.counters[name] += n
+
+  def callRemote(self, operation, *args):
+    start = time.time()
+    try:
+      return getattr(self.remote, operation)(*args)
+    finally:
+      if self.observe is not None:
+        self.observe(operation, time.time() - start)
+
+  def get(self, key):
+    value = self.local.get(key)
+    if value is not None:
+      self.count('local_hits')
+      return value
+    try:
+      value = self.callRemote('get', key)
+    except Exception as e:
+      self.count('remote_errors')
+      logger.debug('Error cache get ' + key + ' : ' + str(e))
+      value = None
+    if value is None:
+      self.count('misses')
+      return None
+    self.count('remote_hits')
+    self.local.set(key, value)
+    return value
+
+  def set(self, key, value, expire = 0):
+    self.local.set(key, value)
+    try:
+      return self.callRemote('set', key, value, expire)
+    except Exception as e:
+      self.count('remote_errors')
+      logger.debug('Error cache set ' + key + ' : ' + str(e))
+      return False
+
+  def add(self, key, value, expire = 0):
+    """Stores a value only if the key is missing from the remote tier, returns
+    whether it was stored, None when the remote tier failed. Skips the local
+    tier, so it can be used to claim work among processes."""
+    try:
+      return self.callRemote('add', key, value, expire, False)
+    except Exception as e:
+      self.count('remote_errors')
+      logger.debug('Error cache add ' + key + ' : ' + str(e))
+      return None
+
+  def get_many(self, keys, local = True):
+    """Returns a dict with the values found for keys, fetching the ones
+    missing from the local tier in a single remote call. With local False
+    every key is fetched, so entries expired in the remote tier are missing."""
+    keys = list(collections.OrderedDict.fromkeys(keys))
+    values = dict()
+    missing = list()
+    for key in keys:
+      value = self.local.get(key) if local else None
+      if value is not None:
+        values[key] = value
+      else:
+        missing.append(key)
+    self.count('local_hits', len(values))
+    if not missing:
+      return values
+    try:
+      found = self.callRemote('get_many', missing)
+    except Exception as e:
+      self.count('remote_errors')
+      logger.debug('Error cache get_many ' + str(len(missing)) + ' keys : ' + str(e))
+      found = dict()
+    for key in missing:
+      value = found.get(key)
+      if value is not None:
+        self.local.set(key, value)
+        values[key] = value
+    hits = len(values) - (len(keys) - len(missing))
+    self.count('remote_hits', hits)
+    self.count('misses', len(missing) - hits)
+    return values
+
+  def set_many(self, values, expire = 0):
+    if not values:
+      return True
+    for key, value in values.items():
+      self.local.set(key, value)
+    try:
+      return self.callRemote('set_many', values, expire)
+    except Exception as e:
+      self.count('remote_errors')
+      logger.debug('Error cache set_many ' + str(len(values)) + ' keys : ' + str(e))
+      return False
+
+  def delete(self, key):
+    self.local.delete(key)
+    try:
+      return self.callRemote('delete', key)
+    except Exception as e:
+      self.count('remote_errors')
+      logger.debug('Error cache delete ' + key + ' : ' + str(e))
+      return False
+
+  def get_or_compute(self, key, compute, encode = None, cacheable = None, expire = 0):
+    """Returns the cached value of key, or the encoded result of compute().
+
+    The result is only stored when cacheable(result) is true. Exceptions of
+    compute() are raised to every caller waiting for that key.
+    """
+    value = self.get(key)
+    if value is not None:
+      return value
+    with self.flights_lock:
+      flight = self.flights.get(key)
+      leader = flight is None
+      if leader:
+        flight = self.flights[key] = Flight()
+    if not leader:
+      self.count('coalesced')
+      flight.event.wait()
+      if flight.error is not None:
+        raise flight.error
+      return flight.value
+    try:
+      result = compute()
+      self.count('computed')
+      value = encode(result) if encode is not None else result
+      if cacheable is None or cacheable(result):
+        self.set(key, value, expire)
+      flight.value = value
+      return value
+    except Exception as e:
+      flight.error = e
+      raise
+    finally:
+      with self.flights_lock:
+        del self.flights[key]
+      flight.event.set()
+
+  def stats(self):
+    with self.counters_lock:
+      stats = dict(self.counters)
+    lookups = stats['local_hits'] + stats['remote_hits'] + stats['misses']
+    stats['hit_ratio'] = round(float(stats['local_hits'] + stats['remote_hits']) / lookups, 4) if lookups else 0
+    stats['local_size'] = len(self.local)
+    stats['in_flight'] = len(self.flights)
+    return stats
+
+
+##################################################################################################
+# DISK CACHE
+##################################################################################################
+
+class DiskCache(object):
+  """Persistent cache storing each value in a file named after its key.
+
+  The total size of the files is kept under max_bytes by removing the least
+  recently read entries. Keys must be safe file names, like hex digests.
+  Values are read back as bytes, served as they are stored.
+  """
+
+  def __init__(self, path, max_bytes = 64 * 1024 * 1024):
+    self.path = path
+    self.max_bytes = max_bytes
+    self.lock = threading.Lock()
+    if not os.path.isdir(path):
+      os.makedirs(path)
+    self.size = sum(os.path.getsize(f) for f in self.files())
+
+  def files(self):
+    return [os.path.join(self.path, name) for name in os.listdir(self.path)
+      if not name.endswith('.tmp')]
+
+  def get(self, key):
+    path = os.path.join(self.path, key)
+    try:
+      with open(path, 'rb') as f:
+        value = f.read()
+      # The modification time tracks the last read for eviction
+      os.utime(path, None)
+      return value
+    except (IOError, OSError):
+      return None
+
+  def set(self, key, value):
+    """Stores value, bytes or text encoded as UTF-8."""
+    data = value if isinstance(value, bytes) else value.encode('utf-8')
+    path = os.path.join(self.path, key)
+    tmp_path = path + '.' + str(threading.current_thread().ident) + '.tmp'
+    with self.lock:
+      try:
+        previous = os.path.getsize(path)
+      except OSError:
+        previous = 0
+      with open(tmp_path, 'wb') as f:
+        f.write(data)
+      os.replace(tmp_path, path)
+      self.size += len(data) - previous
+      if self.size > self.max_bytes:
+        self.evict()
+
+  def evict(self):
+    """Removes the least recently read files until the cache fits in 90% of max_bytes."""
+    entries = list()
+    for path in self.files():
+      try:
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, stat.st_size, path))
+      except OSError:
+        pass
+    entries.sort()
+    self.size = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+      if self.size <= self.max_bytes * 0.9:
+        break
+      try:
+        os.remove(path)
+        self.size -= size
+      except OSError:
+        pass
@@ -0,0 +1,35 @@
+import os
+
+from readiness import expectedWorkers
+
+# Serving mode of the app. With gevent workers, requests waiting for Earth
+# Engine yield to the others, so one worker holds hundreds of EE queries in
+# flight. Set GUNICORN_WORKER_CLASS=sync to go back to blocking workers.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+
+if worker_class == 'gevent':
+  # Patch before the app is preloaded, so its locks and sockets cooperate
+  from gevent import monkey
+  monkey.patch_all()
+
+# /_ah/ready waits for the warm-up of this many workers
+workers = expectedWorkers()
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '500'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+preload_app = True
+
+def post_fork(server, worker):
+  # Every worker warms up its own EE session, map ids and caches
+  import main
+  main.StartWarmUp()
+
+def worker_exit(server, worker):
+  # A worker respawned in its place is not ready until it warmed up
+  import main
+  main.RemoveReadyFile(worker.pid)
+
+def on_starting(server):
+  # Ready files left by a previous run would mark this one ready too early,
+  # removed here and not when main is imported, as worker.py imports it too
+  import main
+  main.ClearReadyFiles()
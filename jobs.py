@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import sqlite3
+
+##################################################################################################
+# JOB QUEUE
+##################################################################################################
+
+# States of a job, in the order they go through
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind TEXT NOT NULL,
+  params TEXT NOT NULL,
+  state TEXT NOT NULL,
+  progress TEXT,
+  result TEXT,
+  error TEXT,
+  worker INTEGER,
+  created REAL NOT NULL,
+  started REAL,
+  updated REAL,
+  finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+'''
+
+class JobQueue(object):
+  """Queue of background jobs kept in a SQLite file, shared by the web
+  workers that enqueue jobs and the worker processes that run them.
+
+  Every call opens its own connection, so a queue can be used from any
+  thread or process. A job is a kind and JSON params, run once by the first
+  worker that claims it. Enqueuing a job equal to a queued or running one
+  returns the id of that one instead.
+  """
+
+  def __init__(self, path, timeout = 30):
+    self.path = path
+    self.timeout = timeout
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+      os.makedirs(directory)
+    with self.connect() as db:
+      db.executescript(SCHEMA)
+
+  def connect(self):
+    db = sqlite3.connect(self.path, timeout = self.timeout, isolation_level = None)
+    db.row_factory = sqlite3.Row
+    return Connection(db)
+
+  def enqueue(self, kind, params):
+    params = json.dumps(params, sort_keys = True)
+    with self.connect() as db:
+      db.execute('BEGIN IMMEDIATE')
+      row = db.execute('SELECT id FROM jobs WHERE kind = ? AND params = ? AND state IN (?, ?) ORDER BY id LIMIT 1',
+        (kind, params, QUEUED, RUNNING)).fetchone()
+      if row is not None:
+        db.execute('COMMIT')
+        return row['id']
+      job_id = db.execute('INSERT INTO jobs (kind, params, state, created) VALUES (?, ?, ?, ?)',
+        (kind, params, QUEUED, time.time())).lastrowid
+      db.execute('COMMIT')
+    return job_id
+
+  def claim(self, worker = None):
+    """Marks the oldest queued job as running and returns it, None when the queue is empty."""
+    with self.connect() as db:
+      db.execute('BEGIN IMMEDIATE')
+      row = db.execute('SELECT id FROM jobs WHERE state = ? ORDER BY id LIMIT 1', (QUEUED,)).fetchone()
+      if row is None:
+        db.execute('COMMIT')
+        return None
+      now = time.time()
+      db.execute('UPDATE jobs SET state = ?, worker = ?, started = ?, updated = ? WHERE id = ?',
+        (RUNNING, worker, now, now, row['id']))
+      db.execute('COMMIT')
+    return self.get(row['id'])
+
+  def update(self, job_id, progress):
+    with self.connect() as db:
+      db.execute('UPDATE jobs SET progress = ?, updated = ? WHERE id = ?',
+        (json.dumps(progress), time.time(), job_id))
+
+  def finish(self, job_id, result = None, error = None):
+    now = time.time()
+    with self.connect() as db:
+      db.execute('UPDATE jobs SET state = ?, result = ?, error = ?, updated = ?, finished = ? WHERE id = ?',
+        (FAILED if error is not None else DONE, json.dumps(result), error, now, now, job_id))
+
+  def requeueStale(self, max_age):
+    """Puts back in the queue the running jobs without progress for max_age
+    seconds, whose worker probably died. Returns the number of jobs requeued."""
+    with self.connect() as db:
+      return db.execute('UPDATE jobs SET state = ?, worker = NULL, started = NULL WHERE state = ? AND updated < ?',
+        (QUEUED, RUNNING, time.time() - max_age)).rowcount
+
+  def get(self, job_id):
+    """Returns a job as a dict, None when it does not exist."""
+    with self.connect() as db:
+      row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+      return None
+    job = dict(row)
+    for key in ('params', 'progress', 'result'):
+      job[key] = json.loads(job[key]) if job[key] is not None else None
+    return job
+
+  def counts(self):
+    """Returns the number of jobs in each state."""
+    with self.connect() as db:
+      rows = db.execute('SELECT state, COUNT(*) AS n FROM jobs GROUP BY state').fetchall()
+    counts = dict((state, 0) for state in (QUEUED, RUNNING, DONE, FAILED))
+    counts.update((row['state'], row['n']) for row in rows)
+    return counts
+
+  def purge(self, max_age):
+    """Removes the jobs finished more than max_age seconds ago."""
+    with self.connect() as db:
+      return db.execute('DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?',
+        (time.time() - max_age,)).rowcount
+
+
+class Connection(object):
+  """SQLite connection closed at the end of a with block."""
+
+  def __init__(self, db):
+    self.db = db
+
+  def __enter__(self):
+    return self.db
+
+  def __exit__(self, *args):
+    if self.db.in_transaction:
+      self.db.rollback()
+    self.db.close()
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request
+from flask import Flask, Response, g, has_request_context, render_template, request, send_file, stream_with_context
 
 import config
 import os
@@ -8,10 +8,35 @@ import time
 import calendar
 import datetime
 import threading
+import types
+import math
+import random
+import hashlib
+import gzip
+import email.utils
+import collections
+import numpy
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed, wait
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
 
 import logging, logging.config, yaml
+import httplib2
 
-from pymemcache.client.hash import Client
+from pymemcache.client.hash import HashClient
+from cache import LRUCache, TwoTierCache, DiskCache, AccessCounter
+from metrics import Metrics
+from jobs import JobQueue
+from readiness import expectedWorkers, readyWorkers
 #from google.appengine.api import memcache as mc
 
 ##################################################################################################
@@ -32,7 +57,66 @@ DETAILS_PATH = 'static/details/'
 
 CACHE = 0 # When use memcache
 SAVE = 0 # When we save data to precompute it in details folder
+MEMCACHE_SERVERS = os.environ.get('MEMCACHE_SERVERS', 'localhost:11211') # Comma separated host:port nodes
+MEMCACHE_POOL_SIZE = 32 # Connections per memcached node shared by the threads of a process
+MEMCACHE_TIMEOUT = 1 # Seconds to connect to, or wait for, a memcached node
+LOCAL_CACHE_SIZE = 2048 # Entries kept in the in-process tier in front of memcache
+LOCAL_CACHE_TTL = 5 * 60 # Seconds an entry is served from the in-process tier
+GZIP_MIN_SIZE = 1024 # Responses smaller than this are not compressed
+GZIP_ETAG_SUFFIX = '-gz' # Appended to the ETag of gzip bodies
+DEFAULT_MAX_AGE = 60 * 60 # Seconds browsers and CDNs may reuse a response
+COUNTRY_MAX_AGE = 7 * 24 * 60 * 60
+CUSTOM_CACHE_PATH = '/tmp/earthengine-app/custom/' # Disk cache of custom polygon results
+CUSTOM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+CUSTOM_KEY_PRECISION = 5 # Decimals of the coordinates hashed in custom polygon keys
+CUSTOM_BATCH_MAX_POLYGONS = 50 # Polygons accepted by one request to the custom batch endpoint
+
+METERS_PER_DEGREE = 111320
+SIMPLIFY_TOLERANCE = 0.5 # Fraction of the reduction scale a simplified geometry may move
 INITIAL_MAP = '5'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+EE_INIT_RETRIES = 3 # Attempts to initialize Earth Engine before giving up
+EE_INIT_BACKOFF = 1 # Seconds to wait after the first failed attempt, doubled on each retry
+EE_MAX_CONCURRENCY = 64 # EE calls in flight per process, further calls wait for a slot
+EE_REQUEST_DEADLINE = 55 # Seconds a request waits for EE, below the gunicorn timeout
+
+BULK_BATCH_SIZE = 20 # Countries reduced together by one reduceRegions call
+EE_MAX_ELEMENTS = 5000 # Features EE returns at most from a collection in one getInfo
+LAYER_SIZE_TTL = 24 * 60 * 60 # Seconds the image count of a time series layer is reused
+
+COMPACT_PRECISION = 4 # Decimals kept for the values of compact details files
+
+PRECOMPUTE_WORKERS = 8 # Batches of countries computed in parallel by one precompute run
+PRECOMPUTE_MAX_CONCURRENCY = 8 # EE calls in flight across all precompute runs of a process
+PRECOMPUTE_RETRIES = 5 # Attempts per country when EE rejects a call for quota reasons
+PRECOMPUTE_BACKOFF = 2 # Seconds to wait after the first quota error, doubled on each retry
+
+MAPID_TTL = 60 * 60 # Seconds a map id is served, kept below the EE token lifetime
+MAPID_REFRESH_AHEAD = 10 * 60 # Refresh map ids this many seconds before they expire
+MAPID_REFRESH_INTERVAL = 60 # Seconds between refresher checks
+
+METRICS_PREFIX = 'earthengine_app_' # Prefix of the metric names served by /metrics
+
+WARMUP_READY_PATH = '/tmp/earthengine-app/ready' # Directory of the <pid>.json files of warmed up workers, see readiness.py
+WARMUP_PRELOAD_MAX = 2000 # Precomputed details loaded into cache by the warm-up
+
+JOBS_DB = os.environ.get('JOBS_DB', '/tmp/earthengine-app/jobs.sqlite') # Queue of the precompute jobs run by worker.py
+JOB_POLL_INTERVAL = 2 # Seconds a worker waits for new jobs when the queue is empty
+JOB_STALE_AGE = 30 * 60 # Seconds without progress after which a running job is given to another worker
+JOB_KEEP_AGE = 7 * 24 * 60 * 60 # Seconds finished jobs are kept for /jobs
+
+REFRESH_INTERVAL = 60 # Seconds between passes of the refresh-ahead scheduler
+REFRESH_HOT_KEYS = 500 # Most accessed country details kept warm by the scheduler
+REFRESH_MIN_SCORE = 2 # Recent accesses for country details to count as hot
+REFRESH_HALF_LIFE = 60 * 60 # Seconds for the access counts of the scheduler to halve
+REFRESH_TRACKED_KEYS = 10000 # Country details whose accesses are counted
+REFRESH_MAX_CONCURRENCY = 4 # Details computed at once by the scheduler, leaving EE slots to requests
+REFRESH_EXPIRE_CADENCES = 2 # Cadences the details of an updated layer are cached, refreshed after one
+
+AGGREGATION_PERIODS = ('monthly', 'seasonal', 'yearly') # Periods a time series can be averaged by
+AGGREGATION_MIN_POINTS = 3 # Bounds of the number of points a time series can be downsampled to
+AGGREGATION_MAX_POINTS = 1000
 
 #logging
 #LOGGER_TYPE = 'file'
@@ -43,19 +127,92 @@ logger = logging.getLogger(LOGGER_TYPE)
 ##################################################################################################
 # FUNCTIONS 
 ##################################################################################################
+# An encoded response body with its content type, ETag, gzip body (None when
+# too small) and time of encoding. Computed once by MakePayload, cached with
+# the body and served as is.
+Payload = collections.namedtuple('Payload', ['body', 'mimetype', 'etag', 'gzipped', 'last_modified'])
+
 def json_serializer(key, value):
   if type(value) == str:
      return value, 1
+  if isinstance(value, Payload):
+    # A JSON header line, then the body and the gzip body stored untouched
+    header = {'mimetype': value.mimetype, 'etag': value.etag, 'last_modified': value.last_modified,
+      'size': len(value.body)}
+    return json.dumps(header).encode('utf-8') + b'\n' + value.body + (value.gzipped or b''), 3
   return json.dumps(value), 2
 
 def json_deserializer(key, value, flags):
   if flags == 1:
-      return value
+      return value.decode('utf-8')
   if flags == 2:
       return json.loads(value)
+  if flags == 3:
+      header, data = value.split(b'\n', 1)
+      header = json.loads(header.decode('utf-8'))
+      body, gzipped = data[:header['size']], data[header['size']:]
+      return Payload(body, header['mimetype'], header['etag'], gzipped or None, header['last_modified'])
   raise Exception('Unknown serialization format')
 
-mc = Client(('localhost', 11211), serializer = json_serializer, deserializer = json_deserializer)
+def MakePayload(body, mimetype = 'application/json'):
+  """Returns the Payload of a body, text or bytes, with its ETag and gzip body."""
+  if not isinstance(body, bytes):
+    body = body.encode('utf-8')
+  gzipped = None
+  if len(body) >= GZIP_MIN_SIZE:
+    with Stage('gzip'):
+      gzipped = gzip.compress(body, 6)
+  return Payload(body, mimetype, hashlib.sha1(body).hexdigest(), gzipped, time.time())
+
+def AsPayload(value, mimetype = 'application/json'):
+  """Returns a cached value as a Payload, values cached as text included."""
+  if value is None or isinstance(value, Payload):
+    return value
+  return MakePayload(value, mimetype)
+
+# Timings and counters of this process, served by /metrics
+metrics = Metrics(METRICS_PREFIX)
+
+def MetricLabels():
+  """Returns the route and layer labels of the current request."""
+  if not has_request_context() or request.url_rule is None:
+    return {'route': 'none', 'layer': 'none'}
+  args = request.view_args or dict()
+  layer = args.get('map_id', args.get('id'))
+  # Unknown layers share a label, so that arbitrary URLs do not add series
+  return {'route': request.url_rule.rule, 'layer': layer if layer in LAYERS else 'none'}
+
+def Stage(stage):
+  """Times a stage of the current request in the stage_seconds histogram."""
+  return metrics.timer('stage_seconds', stage = stage, **MetricLabels())
+
+def ObserveCache(operation, seconds):
+  metrics.observe('stage_seconds', seconds, stage = 'memcache_' + operation, **MetricLabels())
+
+def EncodeJSON(value):
+  """Returns the compact JSON encoding of a value as bytes, with orjson when installed."""
+  with Stage('serialize'):
+    if orjson is not None:
+      return orjson.dumps(value)
+    return json.dumps(value, separators = (',', ':')).encode('utf-8')
+
+def JSONPayload(value):
+  return MakePayload(EncodeJSON(value), 'application/json')
+
+def createMemcacheClient(servers):
+  """Returns a thread-safe client of the memcached nodes, with a connection
+  pool per node. Keys are spread over the nodes by rendezvous hashing, so
+  adding or removing a node only moves its own keys."""
+  nodes = list()
+  for server in servers.split(','):
+    host, port = server.strip().rsplit(':', 1)
+    nodes.append((host, int(port)))
+  return HashClient(nodes, serializer = json_serializer, deserializer = json_deserializer,
+    connect_timeout = MEMCACHE_TIMEOUT, timeout = MEMCACHE_TIMEOUT,
+    use_pooling = True, max_pool_size = MEMCACHE_POOL_SIZE)
+
+mc = TwoTierCache(createMemcacheClient(MEMCACHE_SERVERS), LOCAL_CACHE_SIZE, LOCAL_CACHE_TTL,
+  observe = ObserveCache)
 
 def createCountries(filename):
   file  = open(filename, 'r')
@@ -64,11 +221,216 @@ def createCountries(filename):
 COUNTRIES_ID = createCountries(COUNTRIES_FILE)
 
 
+# Earth Engine is initialized lazily, once per process, by the first request
+# that needs it. Requests answered from cache or disk never pay for it.
+EE_INIT_LOCK = threading.Lock()
+EE_INITIALIZED = False
+
+def CredentialsExpired():
+  return getattr(EE_CREDENTIALS, 'access_token_expired', False)
+
+def InitializeEE():
+  """Initializes Earth Engine if needed and refreshes expired credentials."""
+  global EE_INITIALIZED
+  if EE_INITIALIZED and not CredentialsExpired():
+    return
+  with EE_INIT_LOCK:
+    if EE_INITIALIZED and not CredentialsExpired():
+      return
+    delay = EE_INIT_BACKOFF
+    for attempt in range(EE_INIT_RETRIES):
+      try:
+        if EE_INITIALIZED:
+          EE_CREDENTIALS.refresh(httplib2.Http())
+        else:
+          ee.Initialize(EE_CREDENTIALS)
+          EE_INITIALIZED = True
+        return
+      except Exception as e:
+        logger.debug('Error InitializeEE, attempt ' + str(attempt + 1) + ' : ' + str(e))
+        if attempt == EE_INIT_RETRIES - 1:
+          raise
+        time.sleep(delay)
+        delay *= 2
+
+# Blocking EE calls run on a bounded executor. With gevent workers its
+# threads are greenlets, so hundreds of requests can wait for EE at once
+# while the ones exceeding their deadline give up with an EEException.
+EE_EXECUTOR = ThreadPoolExecutor(max_workers = EE_MAX_CONCURRENCY)
+
+def RequestTimeout():
+  """Returns the seconds left before the request deadline, None without one."""
+  if has_request_context() and getattr(g, 'deadline', None) is not None:
+    return max(0, g.deadline - time.time())
+  return None
+
+def RunEE(function, *args):
+  """Runs a blocking EE call on the EE executor, until the request deadline if any."""
+  timeout = RequestTimeout()
+  future = EE_EXECUTOR.submit(function, *args)
+  try:
+    with Stage('ee'):
+      return future.result(timeout)
+  except FuturesTimeoutError:
+    future.cancel()
+    metrics.inc('ee_errors_total', kind = 'deadline')
+    raise ee.EEException('Earth Engine request exceeded the deadline')
+  except Exception as e:
+    metrics.inc('ee_errors_total', kind = 'quota' if IsQuotaError(e) else 'error')
+    raise
+
+def RunEEAll(functions):
+  """Runs blocking EE calls at once on the EE executor, until the request
+  deadline if any. Returns the result of each call or the exception it raised."""
+  timeout = RequestTimeout()
+  # Past the deadline nothing is sent to EE
+  futures = [EE_EXECUTOR.submit(function) if timeout != 0 else None for function in functions]
+  with Stage('ee'):
+    wait([future for future in futures if future is not None], timeout)
+  results = list()
+  for future in futures:
+    if future is None or not future.done():
+      if future is not None:
+        future.cancel()
+      metrics.inc('ee_errors_total', kind = 'deadline')
+      results.append(ee.EEException('Earth Engine request exceeded the deadline'))
+    elif future.exception() is not None:
+      e = future.exception()
+      metrics.inc('ee_errors_total', kind = 'quota' if IsQuotaError(e) else 'error')
+      results.append(e)
+    else:
+      results.append(future.result())
+  return results
+
 def change_dict(dct):
   if 'features' in dct:
     return dct['features'][0]
   return dct
 
+
+##################################################################################################
+# COUNTRY INDEX
+##################################################################################################
+
+# Country geometries and names are parsed once at import time. With gunicorn
+# --preload the index is built in the master and shared by the forked workers.
+Country = collections.namedtuple('Country', ['name', 'bbox', 'type', 'coordinates'])
+
+def freezeCoordinates(coords):
+  """Converts nested coordinate lists into nested tuples."""
+  if coords and isinstance(coords[0], (int, float)):
+    return tuple(coords)
+  return tuple(freezeCoordinates(c) for c in coords)
+
+def getBoundingBox(coords):
+  """Returns [west, south, east, north] of nested coordinates."""
+  points = coords
+  while points and not isinstance(points[0][0], (int, float)):
+    points = [point for part in points for point in part]
+  xs = [point[0] for point in points]
+  ys = [point[1] for point in points]
+  return (min(xs), min(ys), max(xs), max(ys))
+
+def loadCountry(country_id):
+  path = COUNTRIES_PATH + country_id + '.geo.json'
+  path = os.path.join(os.path.split(__file__)[0], path)
+  with open(path, 'r') as f:
+    elem = json.load(f, object_hook = change_dict)
+  geometry = elem['geometry']
+  coords = freezeCoordinates(geometry['coordinates'])
+  return Country(elem['properties']['name'], getBoundingBox(coords), geometry['type'], coords)
+
+def createCountryIndex(country_ids):
+  """Returns a read-only mapping from country id to Country."""
+  index = dict()
+  for country_id in country_ids:
+    try:
+      index[country_id] = loadCountry(country_id)
+    except Exception as e:
+      logger.debug('Error createCountryIndex, country: ' + country_id + ' : ' + str(e))
+  return types.MappingProxyType(index)
+
+COUNTRIES = createCountryIndex(COUNTRIES_ID)
+COUNTRIES_JSON = json.dumps(COUNTRIES_ID)
+
+
+##################################################################################################
+# GEOMETRY SIMPLIFICATION
+##################################################################################################
+
+# Geometries are reduced at 14-50 km scales, or scale / zoom for custom
+# polygons, so vertices closer than a fraction of that scale do not change
+# the results. Simplifying and quantizing them shrinks every EE request.
+SIMPLIFIED_COUNTRIES = dict()
+
+def simplifyLine(points, tolerance):
+  """Douglas-Peucker simplification keeping points further than tolerance."""
+  if len(points) < 3:
+    return list(points)
+  keep = [False] * len(points)
+  keep[0] = keep[-1] = True
+  stack = [(0, len(points) - 1)]
+  while stack:
+    first, last = stack.pop()
+    x1, y1 = points[first][0], points[first][1]
+    dx, dy = points[last][0] - x1, points[last][1] - y1
+    norm = dx * dx + dy * dy
+    max_distance, index = 0, None
+    for i in range(first + 1, last):
+      x, y = points[i][0] - x1, points[i][1] - y1
+      t = 0 if norm == 0 else min(1, max(0, (x * dx + y * dy) / norm))
+      distance = (x - t * dx) ** 2 + (y - t * dy) ** 2
+      if distance > max_distance:
+        max_distance, index = distance, i
+    if index is not None and max_distance > tolerance * tolerance:
+      keep[index] = True
+      stack.append((first, index))
+      stack.append((index, last))
+  return [point for point, kept in zip(points, keep) if kept]
+
+def simplifyRing(ring, tolerance, decimals):
+  """Returns the simplified and quantized ring, or the ring when it would collapse."""
+  points = list()
+  for point in simplifyLine(ring, tolerance):
+    point = (round(point[0], decimals), round(point[1], decimals))
+    if not points or points[-1] != point:
+      points.append(point)
+  if len(set(points)) < 3:
+    return tuple(tuple(point) for point in ring)
+  return tuple(points)
+
+def simplifyGeometry(geometry, scale):
+  """Returns a Polygon or MultiPolygon GeoJSON geometry simplified for a reduction scale."""
+  tolerance = scale * SIMPLIFY_TOLERANCE / METERS_PER_DEGREE
+  decimals = max(0, int(math.ceil(-math.log10(tolerance / 10))))
+  coordinates = geometry['coordinates']
+  if geometry['type'] == 'Polygon':
+    coordinates = tuple(simplifyRing(ring, tolerance, decimals) for ring in coordinates)
+  elif geometry['type'] == 'MultiPolygon':
+    coordinates = tuple(tuple(simplifyRing(ring, tolerance, decimals) for ring in polygon)
+      for polygon in coordinates)
+  return {'type': geometry['type'], 'coordinates': coordinates}
+
+def GetCountryGeometry(country_id, scale = None):
+  """Returns the GeoJSON geometry of a country, simplified and cached per scale."""
+  country = COUNTRIES[country_id]
+  geometry = {'type': country.type, 'coordinates': country.coordinates}
+  if scale is None:
+    return geometry
+  key = (country_id, scale)
+  if key not in SIMPLIFIED_COUNTRIES:
+    with Stage('geometry'):
+      SIMPLIFIED_COUNTRIES[key] = simplifyGeometry(geometry, scale)
+  return SIMPLIFIED_COUNTRIES[key]
+
+def countryToGeoJSON(country_id, country, scale = None):
+  return {
+    'type': 'Feature',
+    'id': country_id,
+    'properties': {'name': country.name},
+    'geometry': GetCountryGeometry(country_id, scale)
+  }
+
 # Add a band containing image date as years since 1991.
 def CreateTimeBand(img):
   year = ee.Date(img.get('system:time_start')).get('year').subtract(1991)
@@ -79,377 +441,1329 @@ def CreateTimeBandTemp(img):
   return ee.Image(year).byte().addBands(img)
 
 
-def GetFeature(country_id):
-  """Returns an ee.Feature for the country with the given ID."""
-  if CACHE:
-    try:
-      geojson = mc.get('geojson_' + country_id)
-      if geojson is not None:
-        return ee.Feature(geojson)
-    except Exception as e:
-      logger.debug('Error GetFeature cache: '  + str(e))
-
-  # Note: The country IDs are read from the filesystem in the initialization
-  path = COUNTRIES_PATH + country_id + '.geo.json'
-  path = os.path.join(os.path.split(__file__)[0], path)
-  try:
-    with open(path, 'r') as f:
-      t = f.read()
-      elem = json.loads(t, object_hook = change_dict)
-      if CACHE:
-        mc.set('geojson_' + country_id, elem)
-      f.close()
-      return ee.Feature(elem)
-  except Exception as e:
-    logger.debug('Error GetFeature reading file ' + path)
+def GetFeature(country_id, scale = None):
+  """Returns an ee.Feature for the country with the given ID, simplified
+  for the reduction scale when given."""
+  country = COUNTRIES.get(country_id)
+  if country is None:
+    logger.debug('Error GetFeature unknown country ' + country_id)
+    return None
+  InitializeEE()
+  return ee.Feature(countryToGeoJSON(country_id, country, scale))
 
-def coordsToFeature(coords):
-  feature = json.loads(coords, object_hook = change_dict)
+def coordsToFeature(feature):
+  InitializeEE()
   return ee.Feature(feature)
-  
-def GetMapFromId(id):
-  if id == '0':
-    return GetHighMap()
-  elif id == '1':
-    return GetLightsMap()
-  elif id == '2':
-    return GetTemperatureMap()
-  elif id == '3':
-    return GetWaterOccurrenceMap()
-  elif id == '4':
-    return GetWaterChangeMap()
-  elif id == '5':
-    return GetForestChangeMap()
-  elif id == '6':
-    return GetVegetationMap()
-  else:
-    raise Exception("Map does not exists")
 
 
 ##################################################################################################
-# HIGH MAP 
+# MAP ID CACHE
 ##################################################################################################
 
-def GetHighMap():
-  return ee.Image(HIGH_COLLECTION_ID).getMapId({
-    'min': '0',
-    'max': '1000',
-    'palette': '0000ff, 008000, ff0000'
-  })
-
-def ComputeCountryTimeSeriesHigh(country_id, feature = None, zoom = 1):
-  """Returns mean elevation for the country."""
-  img = ee.Image(HIGH_COLLECTION_ID)
-  img = img.select('elevation')
-
-  scale = 50000
-  if feature is None:
-    feature = GetFeature(country_id)
-  else:
-    scale = scale / zoom
-  
-  reduction = img.reduceRegion(ee.Reducer.mean(), feature.geometry(), scale)
-  
-  feature = ee.Feature(None, {
-    'elevation': reduction.get('elevation')
-  })
-  chart_data = feature.getInfo()
+# Map ids and tokens are the same for every visitor, so they are computed once
+# per layer and refreshed in background before the token expires.
+MAPID_CACHE = dict()
+MAPID_LOCK = threading.Lock()
+MAPID_LAYER_LOCKS = collections.defaultdict(threading.Lock) # map id -> lock held while computing it
+MAPID_REFRESHER = None
 
-  return chart_data['properties']
+def RefreshMapId(id):
+  """Computes the map id of a layer and stores it in the map id cache."""
+  mapid = GetMapFromId(id)
+  entry = {
+    'mapid': mapid['mapid'],
+    'token': mapid['token'],
+    'expires': time.time() + MAPID_TTL
+  }
+  MAPID_CACHE[id] = entry
+  return entry
+
+def MapIdRefresher():
+  """Refreshes cached map ids ahead of their expiration."""
+  while True:
+    time.sleep(MAPID_REFRESH_INTERVAL)
+    for id, entry in list(MAPID_CACHE.items()):
+      if entry['expires'] - time.time() > MAPID_REFRESH_AHEAD:
+        continue
+      try:
+        RefreshMapId(id)
+      except Exception as e:
+        logger.debug('Error MapIdRefresher, map: ' + id + ' : ' + str(e))
+
+def StartMapIdRefresher():
+  global MAPID_REFRESHER
+  if MAPID_REFRESHER is not None:
+    return
+  with MAPID_LOCK:
+    if MAPID_REFRESHER is None:
+      MAPID_REFRESHER = threading.Thread(target = MapIdRefresher, name = 'mapid-refresher')
+      MAPID_REFRESHER.daemon = True
+      MAPID_REFRESHER.start()
+
+def GetCachedMapFromId(id):
+  """Returns the map id and token of a layer, only calling EE on a cold cache."""
+  if id not in LAYERS:
+    raise Exception("Map does not exists")
+  entry = MAPID_CACHE.get(id)
+  if entry is None or entry['expires'] <= time.time():
+    # Only requests for the same cold layer wait for its EE call
+    with MAPID_LAYER_LOCKS[id]:
+      entry = MAPID_CACHE.get(id)
+      if entry is None or entry['expires'] <= time.time():
+        entry = RefreshMapId(id)
+  StartMapIdRefresher()
+  return entry
 
 
 ##################################################################################################
-# LIGHTS MAP 
+# LAYERS
 ##################################################################################################
 
-def GetLightsMap():
-  """Returns the MapID for the night-time lights trend map."""
-  collection = ee.ImageCollection(LIGHTS_COLLECTION_ID)
-
-  collection = collection.select('stable_lights').map(CreateTimeBand)
-  # Fit a linear trend to the nighttime lights collection.
-  fit = collection.reduce(ee.Reducer.linearFit())
-
-  return fit.getMapId({
-      'min': '0',
-      'max': '0.18,20,-0.18',
-      'bands': 'scale,offset,scale',
-  })
-
-def ComputeCountryTimeSeriesLights(country_id, feature = None, zoom = 1):
-  """Returns a series of brightness over time for the country."""
-  collection = ee.ImageCollection(LIGHTS_COLLECTION_ID)
-  collection = collection.select('stable_lights').sort('system:time_start')
-  
-  scale = REDUCTION_SCALE_METERS
-  if feature is None:
-    feature = GetFeature(country_id)
-  else:
-    scale = scale / zoom
+def KelvinToCelsius(kelvin):
+  return kelvin * 0.02 - 273.15
+
+def DecodeTimeSeries(layer, times, values):
+  """Returns [[time, value], ...] sorted by time from the values reduced per image.
+
+  Missing values are dropped, values of repeated times are averaged and the
+  'convert' of the layer is applied to the whole array at once.
+  """
+  times = numpy.array(times, dtype = numpy.float64)
+  values = numpy.array(values, dtype = numpy.float64)
+  valid = ~(numpy.isnan(times) | numpy.isnan(values))
+  if not valid.any():
+    return []
+  # unique sorts the times, the inverse indices group the values of each time
+  times, inverse = numpy.unique(times[valid], return_inverse = True)
+  values = numpy.bincount(inverse, weights = values[valid]) / numpy.bincount(inverse)
+  if 'convert' in layer:
+    values = layer['convert'](values)
+  return [list(point) for point in zip(times.astype(numpy.int64).tolist(), values.tolist())]
+
+# Every layer is described here once:
+#  - 'map' builds the image shown on the map and 'vis' its visualization
+#  - 'source' builds the image or collection reduced for the details, with
+#    the 'bands', 'reducer' and 'scale' of the reduction
+#  - 'kind' is the shape of its details:
+#    'value': {band: mean}
+#    'histogram': the histogram dictionary of the band
+#    'forestChange': {'forestChange': [treecover2000, gain, loss]}
+#    'timeSeries': {'timeSeries': [[time, mean], ...]}, values passed through 'convert'
+#  - 'max_age' is the lifetime of its responses in browser and CDN caches
+#  - 'cadence' is how often, in seconds, its dataset may gain new data, None
+#    when it never changes. Cached details of a layer with a cadence expire,
+#    and the hot ones are refreshed ahead every cadence, see REFRESH AHEAD
+#  - 'incremental' layers only gain new images, their details are refreshed
+#    reducing the images added since
+# The builders run once per process, see GetLayerObject.
+LAYERS = {
+  '0': {
+    'name': 'elevation',
+    'map': lambda: ee.Image(HIGH_COLLECTION_ID),
+    'vis': {'min': '0', 'max': '1000', 'palette': '0000ff, 008000, ff0000'},
+    'source': lambda: ee.Image(HIGH_COLLECTION_ID).select('elevation'),
+    'bands': ['elevation'], 'reducer': lambda: ee.Reducer.mean(), 'scale': 50000, 'kind': 'value',
+    'cadence': None, # SRTM is a single 2000 acquisition
+    'max_age': 7 * 24 * 60 * 60
+  },
+  '1': {
+    'name': 'lights',
+    # Linear trend of the nighttime lights, years since 1991 as time band
+    'map': lambda: ee.ImageCollection(LIGHTS_COLLECTION_ID).select('stable_lights')
+      .map(CreateTimeBand).reduce(ee.Reducer.linearFit()),
+    'vis': {'min': '0', 'max': '0.18,20,-0.18', 'bands': 'scale,offset,scale'},
+    'source': lambda: ee.ImageCollection(LIGHTS_COLLECTION_ID).select('stable_lights').sort('system:time_start'),
+    'bands': ['stable_lights'], 'reducer': lambda: ee.Reducer.mean(), 'scale': REDUCTION_SCALE_METERS,
+    'kind': 'timeSeries',
+    'cadence': None, # DMSP-OLS ended in 2013
+    'max_age': 7 * 24 * 60 * 60
+  },
+  '2': {
+    'name': 'temperature',
+    'map': lambda: ee.ImageCollection(TEMPERATURE_COLLECTION_ID).select('LST_Day_1km')
+      .median().toFloat().multiply(ee.Image(0.02)).subtract(ee.Image(273.15)),
+    'vis': {'min': '0', 'max': '40', 'palette': '0000ff,32cd32,ffff00,ff8c00,ff0000'},
+    'source': lambda: ee.ImageCollection(TEMPERATURE_COLLECTION_ID).select('LST_Day_1km'),
+    'bands': ['LST_Day_1km'], 'reducer': lambda: ee.Reducer.mean(), 'scale': 30000, 'kind': 'timeSeries',
+    'convert': KelvinToCelsius,
+    'cadence': 24 * 60 * 60, # 8-day composites, published on any day
+    'incremental': True,
+    'max_age': 6 * 60 * 60
+  },
+  '3': {
+    'name': 'water_occurrence',
+    'map': lambda: ee.Image('JRC/GSW1_0/GlobalSurfaceWater').select('occurrence'),
+    'vis': {'min': '0', 'max': '100', 'palette': 'ff0000,0000ff'},
+    'source': lambda: ee.Image('JRC/GSW1_0/GlobalSurfaceWater').select('change_abs'),
+    'bands': ['change_abs'], 'reducer': lambda: ee.Reducer.histogram(), 'scale': REDUCTION_SCALE_METERS,
+    'kind': 'histogram',
+    'cadence': None, # Fixed release of the surface water dataset
+    'max_age': 7 * 24 * 60 * 60
+  },
+  '4': {
+    'name': 'water_change',
+    'map': lambda: ee.Image('JRC/GSW1_0/GlobalSurfaceWater').select('change_abs'),
+    'vis': {'min': '-50', 'max': '50', 'palette': 'ff0000,000000,00ff00'},
+    'source': lambda: ee.ImageCollection('JRC/GSW1_0/YearlyHistory').select('waterClass'),
+    'bands': ['waterClass'], 'reducer': lambda: ee.Reducer.mean(), 'scale': REDUCTION_SCALE_METERS,
+    'kind': 'timeSeries',
+    'cadence': None, # Fixed release of the surface water dataset
+    'max_age': 7 * 24 * 60 * 60
+  },
+  '5': {
+    'name': 'forest_change',
+    'map': lambda: ee.Image('UMD/hansen/global_forest_change_2015'),
+    'vis': {'bands': 'loss, treecover2000, gain', 'max': '1, 255, 1'},
+    'source': lambda: ee.Image('UMD/hansen/global_forest_change_2015').select(['treecover2000', 'gain', 'loss']),
+    'bands': ['treecover2000', 'gain', 'loss'], 'reducer': lambda: ee.Reducer.mean(), 'scale': 14000,
+    'kind': 'forestChange',
+    'cadence': None, # Hansen 2015 release
+    'max_age': 7 * 24 * 60 * 60
+  },
+  '6': {
+    'name': 'vegetation',
+    'map': lambda: ee.Image(ee.ImageCollection('MODIS/MCD43A4_NDVI').mean()),
+    'vis': {'min': '0', 'max': '1', 'palette': 'FFFFFF,CC9966,CC9900,996600,33CC00,009900,006600,000000'},
+    'source': lambda: ee.ImageCollection('MODIS/MCD43A4_NDVI').select('NDVI'),
+    'bands': ['NDVI'], 'reducer': lambda: ee.Reducer.mean(), 'scale': REDUCTION_SCALE_METERS,
+    'kind': 'timeSeries',
+    'cadence': 6 * 60 * 60, # Daily images
+    'incremental': True,
+    'max_age': 6 * 60 * 60
+  }
+}
+
+LAYER_OBJECTS = dict() # (map id, 'map' | 'source' | 'reducer') -> ee object
+LAYER_OBJECTS_LOCK = threading.Lock()
+
+def GetLayerObject(map_id, part):
+  """Returns the ee object built by one part of a layer.
+
+  The objects are built once per process and shared by every request, which
+  only binds its own geometry and scale to them.
+  """
+  key = (map_id, part)
+  obj = LAYER_OBJECTS.get(key)
+  if obj is None:
+    InitializeEE()
+    with LAYER_OBJECTS_LOCK:
+      obj = LAYER_OBJECTS.get(key)
+      if obj is None:
+        obj = LAYER_OBJECTS[key] = LAYERS[map_id][part]()
+  return obj
+
+def BuildLayers():
+  """Builds the ee objects of every layer ahead of the first request."""
+  for map_id in LAYERS:
+    for part in ('map', 'source', 'reducer'):
+      GetLayerObject(map_id, part)
 
-  # Compute the mean brightness in the region in each image.
-  def ComputeMeanLights(img):
-    reduction = img.reduceRegion(ee.Reducer.mean(), feature.geometry(), scale)
+def GetMapFromId(id):
+  """Returns the map id and token of a layer."""
+  if id not in LAYERS:
+    raise Exception("Map does not exists")
+  return RunEE(GetLayerObject(id, 'map').getMapId, LAYERS[id]['vis'])
+
+def ReduceRegion(map_id, geometry, scale, since = None):
+  """Reduces the source of a layer over a geometry, a single getInfo call.
+
+  Time series only reduce the images after since, in milliseconds, when given.
+  """
+  layer = LAYERS[map_id]
+  source = GetLayerObject(map_id, 'source')
+  reducer = GetLayerObject(map_id, 'reducer')
+  bands = layer['bands']
+  kind = layer['kind']
+
+  if kind != 'timeSeries':
+    reduction = source.reduceRegion(reducer, geometry, scale)
+    properties = ee.Feature(None, dict((band, reduction.get(band)) for band in bands)).getInfo()['properties']
+    if kind == 'value':
+      return properties
+    elif kind == 'histogram':
+      return properties.get(bands[0])
+    elif properties.get('loss') is not None:
+      return [properties.get(band) for band in bands]
+    return None
+
+  band = bands[0]
+  if since is not None:
+    source = source.filter(ee.Filter.gt('system:time_start', since))
+  def ComputeMean(img):
+    reduction = img.reduceRegion(reducer, geometry, scale)
     return ee.Feature(None, {
-        'stable_lights': reduction.get('stable_lights'),
+        band: reduction.get(band),
         'system:time_start': img.get('system:time_start')
     })
 
-  chart_data = collection.map(ComputeMeanLights).getInfo()
-
-  # Extract the results as a list of lists.
-  def ExtractMeanLights(feature):
-    if 'stable_lights' in feature['properties'] and feature['properties']['stable_lights'] is not None:
-      return [
-          feature['properties']['system:time_start'],
-          feature['properties']['stable_lights']
-      ]
-  
-  return map(ExtractMeanLights, chart_data['features'])
-
-
-##################################################################################################
-# TEMPERATURE MAP 
-##################################################################################################
-
-def GetTemperatureMap():
-  """Returns the MapID for the temperature map"""
-  collection = ee.ImageCollection(TEMPERATURE_COLLECTION_ID)
-  collection = collection.select('LST_Day_1km')#.map(CreateTimeBand)
-
-  fit = collection.median().toFloat().multiply(ee.Image(0.02)).subtract(ee.Image(273.15))
+  chart_data = source.map(ComputeMean).getInfo()
 
-  return fit.getMapId({
-    'min': '0',
-    'max': '40',
-    'palette':'0000ff,32cd32,ffff00,ff8c00,ff0000'
-  })
-  
-def ComputeCountryTimeSeriesTemp(country_id, feature = None, zoom = 1):
-  """Returns a series of surface temperature over time for the country."""
-  collection = ee.ImageCollection(TEMPERATURE_COLLECTION_ID)
-  collection = collection.select('LST_Day_1km')
+  properties = [feature['properties'] for feature in chart_data['features']]
+  return DecodeTimeSeries(layer,
+    [props.get('system:time_start') for props in properties],
+    [props.get(band) for props in properties])
 
-  scale = 30000
+def ComputeCountryTimeSeries(map_id, country_id, feature = None, zoom = 1, since = None):
+  """Returns a series of the specific map over time for the country."""
+  if map_id not in LAYERS:
+    raise Exception("Map type does not exists")
+  scale = LAYERS[map_id]['scale']
   if feature is None:
-    feature = GetFeature(country_id)
+    feature = GetFeature(country_id, scale)
   else:
     scale = scale / zoom
-  # Compute the mean temperature in the region in each image.
-  def ComputeMeanTemp(img):
-    reduction = img.reduceRegion(ee.Reducer.mean(),feature.geometry(), scale)
-    return ee.Feature(None, {
-        'temperature': reduction.get('LST_Day_1km'),
-        'system:time_start': img.get('system:time_start')
-    })
-
-  chart_data = collection.map(ComputeMeanTemp).getInfo()
+  return RunEE(ReduceRegion, map_id, feature.geometry(), scale, since)
 
-  def toCelsius(kelvin):
-    scale = 0.02
-    return kelvin * scale - 273.15
-
-  # Extract the results as a list of lists.
-  def ExtractMeanTemp(feature):
-    if 'temperature' in feature['properties'] and feature['properties']['temperature'] is not None:
-      tempInCelsius = toCelsius(feature['properties']['temperature'])
-      return [
-        feature['properties']['system:time_start'],
-        tempInCelsius
-      ]
+def ComputeCountryDetails(map_id, country_id, feature = None, zoom = 1, since = None):
+  """Returns the details of a country in the shape sent to the browser."""
+  if map_id not in LAYERS:
+    raise Exception("Map type does not exists")
+  kind = LAYERS[map_id]['kind']
+  details = dict()
+  if kind == 'value' or kind == 'histogram':
+    details = ComputeCountryTimeSeries(map_id, country_id, feature, zoom)
+  elif kind == 'forestChange':
+    details['forestChange'] = ComputeCountryTimeSeries(map_id, country_id, feature, zoom)
+  else:
+    details['timeSeries'] = ComputeCountryTimeSeries(map_id, country_id, feature, zoom, since)
+  return details
+
+def DetailsKey(map_id, country_id = None, aggregation = None):
+  """Returns the cache key of the details of a country, or of all countries."""
+  key = 'details' + '_'+ map_id
+  if country_id is not None:
+    key = key + '_' + country_id
+  if aggregation is not None:
+    key = key + '_' + aggregation
+  return key
+
+def SeriesKey(map_id, country_id):
+  return 'series' + '_' + map_id + '_' + country_id
+
+def ComputeCountryDetailsIncrementally(map_id, country_id):
+  """Returns the details of a country, reducing only the images newer than
+  the series kept in cache for incremental layers."""
+  if map_id not in LAYERS or not LAYERS[map_id].get('incremental'):
+    return ComputeCountryDetails(map_id, country_id)
+  cached = mc.get(SeriesKey(map_id, country_id))
+  if cached is None:
+    series = ComputeCountryDetails(map_id, country_id)['timeSeries']
+    last = None
+  else:
+    cached = json.loads(cached)
+    last = cached['last']
+    new_series = ComputeCountryDetails(map_id, country_id, since = last)['timeSeries']
+    logger.debug('Incremental refresh ' + map_id + ' ' + country_id + ': ' + str(len(new_series)) + ' new images')
+    series = cached['timeSeries'] + new_series
+  if series:
+    last = series[-1][0]
+  if last is not None:
+    mc.set(SeriesKey(map_id, country_id), json.dumps({'last': last, 'timeSeries': series}))
+  return {'timeSeries': series}
+
+def DetailsExpire(map_id):
+  """Returns the seconds the cached details of a layer are kept, 0 to keep them."""
+  if map_id in LAYERS and LAYERS[map_id].get('cadence'):
+    return LAYERS[map_id]['cadence'] * REFRESH_EXPIRE_CADENCES
+  return 0
+
+def IsEmptyDetails(details):
+  return details is None or ('forestChange' in details and details['forestChange'] is None)
 
-  return map(ExtractMeanTemp, chart_data['features'])
 
 ##################################################################################################
-# WATER OCCURRENCE MAP
+# TEMPORAL AGGREGATION
 ##################################################################################################
 
-def GetWaterOccurrenceMap():
-  img = ee.Image('JRC/GSW1_0/GlobalSurfaceWater')
-  img = img.select('occurrence')
-  return img.getMapId({
-    'min': '0',
-    'max': '100',
-    'palette': 'ff0000,0000ff'
-  })
-
-
-def ComputeCountryTimeSeriesWaterOccurence(country_id, feature = None, zoom = 1):
-  """Returns a series of water occurrence over time for the country."""
-  image = ee.Image('JRC/GSW1_0/GlobalSurfaceWater')
-  image = image.select('change_abs')
-
-  scale = REDUCTION_SCALE_METERS
-  if feature is None:
-    feature = GetFeature(country_id)
+# Long series are aggregated on the server from the full series, which is
+# computed and cached once, instead of running one EE reduction per level.
+# An aggregation is one of AGGREGATION_PERIODS, the mean of the values of
+# each period, or a maximum number of points picked by LTTB.
+
+def RequestAggregation(map_id):
+  """Returns the aggregation asked by the request, None for the full series."""
+  aggregation = request.args.get('aggregate')
+  if not aggregation or map_id not in LAYERS or LAYERS[map_id]['kind'] != 'timeSeries':
+    return None
+  if aggregation in AGGREGATION_PERIODS:
+    return aggregation
+  if aggregation.isdigit() and AGGREGATION_MIN_POINTS <= int(aggregation) <= AGGREGATION_MAX_POINTS:
+    return str(int(aggregation))
+  raise ValueError('Aggregation ' + aggregation + ' not supported')
+
+def PeriodStarts(times, period):
+  """Returns the start, in milliseconds, of the period of each time."""
+  months = times.astype('datetime64[ms]').astype('datetime64[M]')
+  if period == 'yearly':
+    starts = months.astype('datetime64[Y]')
+  elif period == 'seasonal':
+    # Meteorological seasons, winter starts in December
+    index = months.astype(numpy.int64)
+    starts = ((index + 1) // 3 * 3 - 1).astype('datetime64[M]')
   else:
-    scale = scale / zoom 
-
-  # Compute the mean temperature in the region in each image.
-  def ComputeMeanWaterOccurence(img):
-    reduction = img.reduceRegion(ee.Reducer.histogram(), feature.geometry(), scale)
-    
-    return ee.Feature(None, {
-        'system:time_start' : img.get('system:time_start'),
-        'water': reduction.get('change_abs')
-    })
+    starts = months
+  return starts.astype('datetime64[ms]').astype(numpy.int64)
+
+def DownsampleLTTB(times, values, threshold):
+  """Returns the indices of the threshold points kept by Largest-Triangle-Three-Buckets."""
+  n = len(times)
+  if n <= threshold:
+    return numpy.arange(n)
+  # The first and last points are kept, the others are split in threshold - 2 buckets
+  edges = numpy.linspace(1, n - 1, threshold - 1).astype(numpy.int64)
+  selected = [0]
+  previous = 0
+  for i in range(threshold - 2):
+    start, end = edges[i], edges[i + 1]
+    next_end = edges[i + 2] if i + 2 < len(edges) else n
+    next_time = times[end:next_end].mean()
+    next_value = values[end:next_end].mean()
+    # Twice the area of the triangles formed with the previous point and the next bucket average
+    area = numpy.abs((times[previous] - next_time) * (values[start:end] - values[previous])
+      - (times[previous] - times[start:end]) * (next_value - values[previous]))
+    previous = start + int(area.argmax())
+    selected.append(previous)
+  selected.append(n - 1)
+  return numpy.array(selected)
+
+def AggregateDetails(details, aggregation):
+  """Returns the details with their time series aggregated."""
+  if aggregation is None or not isinstance(details, dict) or not details.get('timeSeries'):
+    return details
+  times = numpy.array([point[0] for point in details['timeSeries']], dtype = numpy.float64)
+  values = numpy.array([point[1] for point in details['timeSeries']], dtype = numpy.float64)
+  if aggregation in AGGREGATION_PERIODS:
+    starts, inverse = numpy.unique(PeriodStarts(times, aggregation), return_inverse = True)
+    values = numpy.bincount(inverse, weights = values) / numpy.bincount(inverse)
+    times = starts
+  else:
+    kept = DownsampleLTTB(times, values, int(aggregation))
+    times, values = times[kept], values[kept]
+  series = zip(times.astype(numpy.int64).tolist(), values.tolist())
+  return {'timeSeries': [list(point) for point in series]}
 
-  chart_data = ComputeMeanWaterOccurence(image).getInfo()
-  
-  return chart_data['properties']['water']
+def AggregateEncodedDetails(encoded_details, aggregation):
+  """Returns the JSON details with their time series aggregated."""
+  if aggregation is None:
+    return encoded_details
+  return EncodeJSON(AggregateDetails(json.loads(encoded_details), aggregation))
 
 
 ##################################################################################################
-# WATER CHANGE MAP 
+# BULK COMPUTE
 ##################################################################################################
 
-def GetWaterChangeMap():
-  img = ee.Image('JRC/GSW1_0/GlobalSurfaceWater')
-  img = img.select('change_abs')
-  return img.getMapId({
-    'min': '-50',
-    'max': '50',
-    'palette': 'ff0000,000000,00ff00'
-  })
-def ComputeCountryTimeSeriesWaterChange(country_id, feature = None, zoom = 1):
-  """Returns a series of water change over time for the country."""
-  collection = ee.ImageCollection('JRC/GSW1_0/YearlyHistory')
-  collection = collection.select('waterClass')
- 
-  scale = REDUCTION_SCALE_METERS
-  if feature is None:
-    feature = GetFeature(country_id)
+# Reduces many countries at once with reduceRegions instead of one
+# reduceRegion per country, with the sources and reducers of LAYERS.
+
+def GetCountriesFeatureCollection(country_ids, scale = None):
+  """Returns an ee.FeatureCollection with one feature per country."""
+  features = list()
+  for country_id in country_ids:
+    features.append(ee.Feature(GetCountryGeometry(country_id, scale), {'country': country_id}))
+  return ee.FeatureCollection(features)
+
+def ReduceRegions(map_id, regions, scale = None):
+  """Returns the properties of the reduced regions, a single getInfo call."""
+  return RegionsProperties(RunEE(ReduceRegionsQuery(map_id, regions, scale).getInfo))
+
+def RegionsProperties(result):
+  return [feature['properties'] for feature in result['features']]
+
+def ReduceRegionsQuery(map_id, regions, scale = None):
+  """Returns the EE collection of the regions reduced by a layer, one
+  feature per region, or per region and image for time series."""
+  layer = LAYERS[map_id]
+  if scale is None:
+    scale = layer['scale']
+  reducer = GetLayerObject(map_id, 'reducer')
+  if len(layer['bands']) == 1:
+    # reduceRegions names single band outputs after the reducer, not the band
+    reducer = reducer.setOutputs(layer['bands'])
+  source = GetLayerObject(map_id, 'source')
+  if layer['kind'] != 'timeSeries':
+    result = source.reduceRegions(regions, reducer, scale)
   else:
-    scale = scale / zoom
-  # Compute the mean temperature in the region in each image.
-  def ComputeMeanWaterChange(img):
-    reduction = img.reduceRegion(ee.Reducer.mean(), feature.geometry(), scale)
-
-    return ee.Feature(None, {
-        'system:time_start' : img.get('system:time_start'),
-        'water': reduction.get('waterClass')
-    })
+    def ReduceImage(img):
+      time_start = img.get('system:time_start')
+      reduced = img.reduceRegions(regions, reducer, scale)
+      return reduced.map(lambda feature: feature.set('system:time_start', time_start))
+    result = source.map(ReduceImage).flatten()
+  return result
+
+def SplitRegionsDetails(layer, properties, region = 'country'):
+  """Groups the reduced properties by the id of their region, the given
+  property, in the shape of ComputeCountryDetails."""
+  details = dict()
+  series = dict() # region id -> (times, values) of time series layers
+  kind = layer['kind']
+  band = layer['bands'][0]
+  for props in properties:
+    country_id = props[region]
+    if kind == 'value':
+      details[country_id] = {band: props.get(band)}
+    elif kind == 'histogram':
+      if props.get(band) is not None:
+        details[country_id] = props[band]
+    elif kind == 'forestChange':
+      if props.get('loss') is not None:
+        details[country_id] = {'forestChange': [props.get(b) for b in layer['bands']]}
+      else:
+        details[country_id] = {'forestChange': None}
+    else:
+      times, values = series.setdefault(country_id, ([], []))
+      times.append(props.get('system:time_start'))
+      values.append(props.get(band))
+  for country_id, (times, values) in series.items():
+    details[country_id] = {'timeSeries': DecodeTimeSeries(layer, times, values)}
+  return details
+
+LAYER_SIZES = dict() # map id -> (images of its source, time they expire)
+
+def LayerImageCount(map_id):
+  """Returns the images reduced per region by a layer, 1 for single images."""
+  if LAYERS[map_id]['kind'] != 'timeSeries':
+    return 1
+  entry = LAYER_SIZES.get(map_id)
+  if entry is None or entry[1] <= time.time():
+    InitializeEE()
+    images = RunEE(GetLayerObject(map_id, 'source').size().getInfo)
+    entry = LAYER_SIZES[map_id] = (images, time.time() + LAYER_SIZE_TTL)
+  return entry[0]
+
+def LayerBatchSize(map_id, limit = BULK_BATCH_SIZE):
+  """Returns the regions of a layer reduced per EE call, at most limit.
+
+  Time series return one feature per image and region, batches are sized
+  so that a getInfo stays under EE_MAX_ELEMENTS features.
+  """
+  try:
+    images = LayerImageCount(map_id)
+  except Exception as e:
+    logger.debug('Error LayerBatchSize, map: ' + map_id + ' : ' + str(e))
+    return 1
+  return max(1, min(limit, EE_MAX_ELEMENTS // max(1, images)))
+
+def ComputeAllCountriesDetails(map_id, country_ids = None, batch_size = None):
+  """Returns a dict from country id to details, reducing batch_size
+  countries per EE call, sized by LayerBatchSize when not given."""
+  if map_id not in LAYERS:
+    raise Exception("Map type does not exists")
+  layer = LAYERS[map_id]
+  if batch_size is None:
+    batch_size = LayerBatchSize(map_id)
+  if country_ids is None:
+    country_ids = COUNTRIES_ID
+  country_ids = [c for c in collections.OrderedDict.fromkeys(country_ids) if c in COUNTRIES]
+  InitializeEE()
+  details = dict()
+  for start in range(0, len(country_ids), batch_size):
+    regions = GetCountriesFeatureCollection(country_ids[start:start + batch_size], layer['scale'])
+    details.update(SplitRegionsDetails(layer, ReduceRegions(map_id, regions)))
+  return details
+
+def ComputeCustomRegionsDetails(map_id, geometries, zoom = 1):
+  """Returns a dict from polygon id to details or to the exception raised,
+  for a dict from polygon id to GeoJSON geometry.
+
+  The polygons are reduced in batches sized by LayerBatchSize, with one
+  reduceRegions call per batch, all of them at once on the EE executor. The
+  polygons of a failed batch are then reduced one per call the same way, so
+  a single bad polygon only fails its own details.
+  """
+  layer = LAYERS[map_id]
+  InitializeEE()
+  batch_size = LayerBatchSize(map_id, CUSTOM_BATCH_MAX_POLYGONS)
+  polygon_ids = list(geometries)
+  batches = [polygon_ids[i:i + batch_size] for i in range(0, len(polygon_ids), batch_size)]
+  details = dict()
+  while batches:
+    single = list()
+    for batch, result in zip(batches, ReduceCustomRegions(map_id, geometries, batches, layer['scale'] / zoom)):
+      if not isinstance(result, Exception):
+        result = SplitRegionsDetails(layer, RegionsProperties(result), 'polygon')
+        for polygon_id in batch:
+          details[polygon_id] = result.get(polygon_id)
+      elif len(batch) > 1:
+        logger.debug('Error ComputeCustomRegionsDetails, falling back to single polygons: ' + str(result))
+        single.extend(batch)
+      else:
+        details[batch[0]] = result
+    batches = [[polygon_id] for polygon_id in single]
+  return details
+
+def ReduceCustomRegions(map_id, geometries, batches, scale):
+  """Returns the getInfo result of each batch of polygons or the exception it raised."""
+  results = list()
+  queries = list()
+  for batch in batches:
+    try:
+      regions = ee.FeatureCollection([ee.Feature(geometries[polygon_id], {'polygon': polygon_id})
+        for polygon_id in batch])
+      queries.append(ReduceRegionsQuery(map_id, regions, scale).getInfo)
+      results.append(None)
+    except Exception as e:
+      results.append(e)
+  computed = iter(RunEEAll(queries))
+  return [next(computed) if result is None else result for result in results]
 
-  chart_data = collection.map(ComputeMeanWaterChange).getInfo()
+##################################################################################################
+# PRECOMPUTE
+##################################################################################################
 
-  # Extract the results as a list of lists.
-  def ExtractMeanWaterChange(feature):
-    if 'water' in feature['properties'] and feature['properties']['water'] is not None:
-      return [
-        feature['properties']['system:time_start'],
-        feature['properties']['water']
-      ]
+# Bounds the EE calls in flight for the whole process, so concurrent
+# precompute runs do not multiply the load sent to Earth Engine.
+PRECOMPUTE_SEMAPHORE = threading.BoundedSemaphore(PRECOMPUTE_MAX_CONCURRENCY)
 
-  return map(ExtractMeanWaterChange, chart_data['features'])
+def IsQuotaError(e):
+  """Returns whether an EE error is worth retrying after a while."""
+  message = str(e).lower()
+  return isinstance(e, ee.EEException) and (
+    'quota' in message or 'too many' in message or 'rate limit' in message)
 
+def CallWithRetry(function, *args):
+  """Calls an EE computation, backing off on EE quota errors."""
+  delay = PRECOMPUTE_BACKOFF
+  for attempt in range(PRECOMPUTE_RETRIES):
+    try:
+      with PRECOMPUTE_SEMAPHORE:
+        return function(*args)
+    except Exception as e:
+      if not IsQuotaError(e) or attempt == PRECOMPUTE_RETRIES - 1:
+        raise
+      logger.debug('Quota error ' + function.__name__ + ', retrying in ' + str(delay) + 's')
+      time.sleep(delay + random.uniform(0, delay))
+      delay *= 2
+
+def ComputeBatchDetails(map_id, country_ids):
+  """Returns a dict from country id to details or to the exception raised.
+
+  The batch is reduced with a single reduceRegions call. If that fails the
+  countries are computed one by one, so a single bad geometry only fails
+  its own country.
+  """
+  try:
+    details = CallWithRetry(ComputeAllCountriesDetails, map_id, country_ids)
+    for country_id in country_ids:
+      details.setdefault(country_id, None)
+    return details
+  except Exception as e:
+    logger.debug('Error ComputeBatchDetails, falling back to single countries: ' + str(e))
+  details = dict()
+  for country_id in country_ids:
+    try:
+      details[country_id] = CallWithRetry(ComputeCountryDetails, map_id, country_id)
+    except Exception as e:
+      details[country_id] = e
+  return details
+
+def PrecomputeLayer(map_id, store, countries = None, workers = PRECOMPUTE_WORKERS,
+    batch_size = None, report = None):
+  """Computes the details of every country of a layer on a thread pool.
+
+  Countries are reduced in batches of batch_size, sized by LayerBatchSize
+  when not given. A failed batch falls back to single countries. store(country_id, details)
+  is called from the calling thread for each computed country, as soon as
+  its batch is ready, with None as details when the country has no data.
+  report(progress), when given, is called after each batch. Returns a
+  progress report.
+  """
+  if countries is None:
+    countries = COUNTRIES_ID
+  countries = list(collections.OrderedDict.fromkeys(countries))
+  if batch_size is None:
+    batch_size = LayerBatchSize(map_id)
+  progress = {'total': len(countries), 'done': 0, 'failed': 0, 'message': '', 'elapsed': 0}
+  start = time.time()
+  executor = ThreadPoolExecutor(max_workers = workers)
+  try:
+    futures = list()
+    for i in range(0, len(countries), batch_size):
+      futures.append(executor.submit(ComputeBatchDetails, map_id, countries[i:i + batch_size]))
+    for future in as_completed(futures):
+      for country_id, details in future.result().items():
+        if isinstance(details, Exception):
+          progress['failed'] += 1
+          progress['message'] = str(details)
+          logger.debug('Error PrecomputeLayer, country: ' + country_id + ' : ' + str(details))
+          continue
+        store(country_id, None if IsEmptyDetails(details) else details)
+        progress['done'] += 1
+      logger.debug('PrecomputeLayer map ' + map_id + ': ' + str(progress['done'] + progress['failed'])
+        + '/' + str(progress['total']))
+      if report is not None:
+        progress['elapsed'] = round(time.time() - start, 3)
+        report(dict(progress))
+  finally:
+    executor.shutdown(wait = True)
+  progress['elapsed'] = round(time.time() - start, 3)
+  return progress
 
 ##################################################################################################
-# FOREST CHANGE MAP
+# PRECOMPUTED DETAILS FILES
 ##################################################################################################
 
-def GetForestChangeMap():
-  img = ee.Image('UMD/hansen/global_forest_change_2015')
-  return img.getMapId({
-    'bands': 'loss, treecover2000, gain',
-    'max': '1, 255, 1'
-  })
+# A precompute run appends each country to a checkpoint file as soon as it is
+# computed, one JSON line per country with the fingerprint of its inputs.
+# A crashed or failed run resumes from the checkpoint, countries whose inputs
+# have not changed are skipped, and the details file is written atomically
+# from the checkpoint once every country is done.
+PRECOMPUTE_LOCKS = collections.defaultdict(threading.Lock)
+COUNTRY_DIGESTS = dict()
+
+def DetailsPath(map_id, extension):
+  """Returns the path of a file of the details of a layer, next to the app
+  whatever the working directory, where /static/details serves them."""
+  return os.path.join(os.path.split(__file__)[0], DETAILS_PATH + 'mapid_' + map_id + extension)
+
+def DetailsFilePath(map_id):
+  return DetailsPath(map_id, '.json')
+
+def CheckpointPath(map_id):
+  return DetailsPath(map_id, '.checkpoint')
+
+def GetCountryDigest(country_id):
+  if country_id not in COUNTRY_DIGESTS:
+    country = COUNTRIES[country_id]
+    geometry = json.dumps([country.type, country.coordinates])
+    COUNTRY_DIGESTS[country_id] = hashlib.sha1(geometry.encode('utf-8')).hexdigest()
+  return COUNTRY_DIGESTS[country_id]
+
+def GetLayerVersion(map_id):
+  """Returns what identifies the inputs of a layer, the latest image for collections."""
+  if map_id not in LAYERS:
+    raise Exception("Map type does not exists")
+  layer = LAYERS[map_id]
+  version = [map_id, layer['bands'], layer['scale']]
+  if layer['kind'] == 'timeSeries':
+    InitializeEE()
+    version.append(RunEE(GetLayerObject(map_id, 'source').aggregate_max('system:time_start').getInfo))
+  return json.dumps(version)
+
+def GetInputFingerprints(map_id, country_ids):
+  version = GetLayerVersion(map_id)
+  fingerprints = dict()
+  for country_id in country_ids:
+    key = version + GetCountryDigest(country_id)
+    fingerprints[country_id] = hashlib.sha1(key.encode('utf-8')).hexdigest()
+  return fingerprints
+
+def ReadCheckpoint(map_id):
+  """Returns a dict from country id to (fingerprint, offset) of its latest line."""
+  entries = dict()
+  path = CheckpointPath(map_id)
+  if not os.path.exists(path):
+    return entries
+  with open(path, 'rb') as f:
+    offset = 0
+    for line in f:
+      try:
+        entry = json.loads(line.decode('utf-8'))
+        entries[entry['country']] = (entry['input'], offset)
+      except ValueError:
+        # A line cut by a crash, the country is computed again
+        pass
+      offset += len(line)
+  return entries
+
+def TruncateCheckpoint(map_id):
+  """Cuts the checkpoint after its last complete line, so lines appended
+  on resume do not continue a line cut by a crash."""
+  path = CheckpointPath(map_id)
+  if not os.path.exists(path):
+    return
+  with open(path, 'rb+') as f:
+    end = f.seek(0, os.SEEK_END)
+    size = end
+    while end > 0:
+      start = max(0, end - 64 * 1024)
+      f.seek(start)
+      newline = f.read(end - start).rfind(b'\n')
+      if newline >= 0:
+        end = start + newline + 1
+        break
+      end = start
+    if end != size:
+      logger.debug('Checkpoint of map ' + map_id + ' cut, truncated from ' + str(size) + ' to ' + str(end) + ' bytes')
+      f.truncate(end)
+
+def WriteFileAtomically(path, write, mode = 'w'):
+  """Calls write(f) on a temporary file that then replaces path."""
+  tmp_path = path + '.tmp'
+  with open(tmp_path, mode) as f:
+    write(f)
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(tmp_path, path)
+
+def WriteDetailsFileFromCheckpoint(map_id, country_ids, compact = False, entries = None):
+  """Writes the details file streaming the latest checkpoint line of each
+  country, and its compact variants when asked or when they exist, so they
+  are never older than the details file. entries are the result of
+  ReadCheckpoint, read again when not given."""
+  if entries is None:
+    entries = ReadCheckpoint(map_id)
+  with open(CheckpointPath(map_id), 'rb') as checkpoint:
+    def readEntry(country_id):
+      checkpoint.seek(entries[country_id][1])
+      return json.loads(checkpoint.readline().decode('utf-8'))
+
+    def writeCountries(f, transform):
+      first = True
+      for country_id in sorted(set(country_ids) & set(entries)):
+        details = readEntry(country_id)['details']
+        if details is None:
+          continue
+        if not first:
+          f.write(',')
+        f.write(json.dumps(country_id) + ':' + json.dumps(transform(details), separators = (',', ':')))
+        first = False
+
+    def writeDetails(f):
+      f.write('{')
+      writeCountries(f, lambda details: details)
+      f.write('}')
+
+    def writeCompact(f):
+      f.write('{"version":1,"map":' + json.dumps(map_id) + ',"countries":{')
+      writeCountries(f, CompactDetails)
+      f.write('}}')
+
+    def writeCheckpoint(f):
+      for country_id in sorted(entries):
+        f.write(json.dumps(readEntry(country_id), separators = (',', ':')) + '\n')
+
+    WriteFileAtomically(DetailsFilePath(map_id), writeDetails)
+    if compact or os.path.exists(CompactPath(map_id)):
+      WriteFileAtomically(CompactPath(map_id), writeCompact)
+      WriteCompressedVariants(CompactPath(map_id))
+    # Compact the checkpoint to the latest line of each country
+    WriteFileAtomically(CheckpointPath(map_id), writeCheckpoint)
+
+def PrecomputeDetailsFile(map_id, store = None, resume = True, compact = False, report = None):
+  """Precomputes the details file of a layer through its checkpoint.
+
+  With resume, countries already in the checkpoint with the same input
+  fingerprint are skipped. store(country_id, details) is also called for
+  every computed country. With compact, the compact variants of the file
+  are written too, existing ones are always written again. report is passed
+  to PrecomputeLayer. Returns the progress report of PrecomputeLayer.
+  """
+  lock = PRECOMPUTE_LOCKS[map_id]
+  if not lock.acquire(False):
+    return {'failed': 1, 'message': 'Precompute of map ' + map_id + ' already running'}
+  try:
+    countries = list(collections.OrderedDict.fromkeys(COUNTRIES_ID))
+    try:
+      fingerprints = GetInputFingerprints(map_id, countries)
+    except Exception as e:
+      logger.debug('Error PrecomputeDetailsFile: ' + str(e))
+      return {'failed': 1, 'message': str(e)}
+    if resume:
+      TruncateCheckpoint(map_id)
+    entries = ReadCheckpoint(map_id) if resume else dict()
+    pending = [c for c in countries if entries.get(c, (None, 0))[0] != fingerprints[c]]
+    with open(CheckpointPath(map_id), 'a' if resume else 'w') as checkpoint:
+      def storeCheckpoint(country_id, details):
+        entry = {'country': country_id, 'input': fingerprints[country_id], 'details': details}
+        checkpoint.write(json.dumps(entry, separators = (',', ':')) + '\n')
+        checkpoint.flush()
+        if store is not None:
+          store(country_id, details)
+
+      progress = PrecomputeLayer(map_id, storeCheckpoint, pending, report = report)
+    progress['skipped'] = len(countries) - len(pending)
+    if progress['failed']:
+      return progress
+    # Every country needs a readable line for the current inputs, else the
+    # details file would silently miss it
+    entries = ReadCheckpoint(map_id)
+    missing = [c for c in countries if entries.get(c, (None, 0))[0] != fingerprints[c]]
+    if missing:
+      progress['failed'] += len(missing)
+      progress['message'] = 'Checkpoint of map ' + map_id + ' misses ' + ', '.join(missing[:10])
+      logger.debug('Error PrecomputeDetailsFile: ' + progress['message'])
+      return progress
+    WriteDetailsFileFromCheckpoint(map_id, countries, compact, entries)
+    return progress
+  finally:
+    lock.release()
 
-def ComputeCountryTimeSeriesForestChange(country_id, feature = None, zoom = 1):
-  """Returns country forest change."""
-  collection = ee.Image('UMD/hansen/global_forest_change_2015')
-  
-  scale = 14000
-  if feature is None:
-    feature = GetFeature(country_id)
-  else:
-    scale = scale / zoom
-  # Compute the mean temperature in the region in each image.
-  def ComputeMeanForestChange(img):
-    reduction = img.reduceRegion(ee.Reducer.mean(), feature.geometry(), scale)
+##################################################################################################
+# COMPACT DETAILS FILES
+##################################################################################################
 
-    return ee.Feature(None, {
-        'treecover2000' : reduction.get('treecover2000'),
-        'loss': reduction.get('loss'),
-        'gain': reduction.get('gain')
-    })
+# Compact details files keep time series as columns, with delta encoded
+# timestamps without duplicates and values rounded to COMPACT_PRECISION.
+# They are written with gzip and brotli variants, and single countries are
+# served from them so clients do not download every country.
+COMPACT_DETAILS = dict()
+
+def CompactPath(map_id):
+  return DetailsPath(map_id, '.compact.json')
+
+def roundValues(value):
+  if isinstance(value, float):
+    return round(value, COMPACT_PRECISION)
+  if isinstance(value, list):
+    return [roundValues(v) for v in value]
+  if isinstance(value, dict):
+    return dict((k, roundValues(v)) for k, v in value.items())
+  return value
+
+def CompactDetails(details):
+  """Returns the details with the time series as {'t': deltas, 'v': values}."""
+  if 'timeSeries' not in details:
+    return roundValues(details)
+  times = list()
+  values = list()
+  previous = 0
+  for time_start, value in sorted(details['timeSeries'], key = lambda point: point[0]):
+    if times and time_start == previous:
+      continue
+    times.append(time_start - previous)
+    values.append(roundValues(value))
+    previous = time_start
+  return {'timeSeries': {'t': times, 'v': values}}
+
+def ExpandDetails(compact):
+  """Returns compact details in the shape of ComputeCountryDetails."""
+  if not isinstance(compact.get('timeSeries'), dict):
+    return compact
+  series = list()
+  time_start = 0
+  for delta, value in zip(compact['timeSeries']['t'], compact['timeSeries']['v']):
+    time_start += delta
+    series.append([time_start, value])
+  return {'timeSeries': series}
+
+def WriteCompressedVariants(path):
+  """Writes the gzip and, when available, brotli variants of a file."""
+  with open(path, 'rb') as f:
+    data = f.read()
+  WriteFileAtomically(path + '.gz', lambda f: f.write(gzip.compress(data, 9)), 'wb')
+  if brotli is not None:
+    WriteFileAtomically(path + '.br', lambda f: f.write(brotli.compress(data)), 'wb')
+  elif os.path.exists(path + '.br'):
+    # Left by a run with brotli, it would be served instead of the new file
+    os.remove(path + '.br')
+
+def LoadCompactDetails(map_id):
+  """Returns the countries of a compact details file, reloaded when it changes."""
+  path = CompactPath(map_id)
+  mtime = os.path.getmtime(path)
+  entry = COMPACT_DETAILS.get(map_id)
+  if entry is None or entry[0] != mtime:
+    with open(path, 'r') as f:
+      entry = (mtime, json.load(f)['countries'])
+    COMPACT_DETAILS[map_id] = entry
+  return entry[1]
 
-  chart_data = ComputeMeanForestChange(collection).getInfo()
+##################################################################################################
+# HTTP CACHING
+##################################################################################################
 
-  # Extract the results as a list of lists.
-  def ExtractMeanForestChange(feature):
-    if 'loss' in feature['properties'] and feature['properties']['loss'] is not None:
-      return [
-        feature['properties']['treecover2000'],
-        feature['properties']['gain'],
-        feature['properties']['loss']
-      ]
+# Responses of cached payloads carry an ETag and a lifetime, so browsers and
+# CDNs revalidate them with If-None-Match instead of downloading them again.
+# Cached Payloads carry their ETag and gzip body, computed once when they
+# were encoded and shared by every process through memcache. Pages rendered
+# per request are turned into a Payload once per version, kept in process.
+RESPONSES = LRUCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_TTL)
+
+def GetResponseEntry(key, body, mimetype):
+  """Returns the Payload of a rendered page, encoded again when it changes."""
+  entry = RESPONSES.get(key)
+  data = body if isinstance(body, bytes) else body.encode('utf-8')
+  if entry is None or entry.body != data:
+    entry = MakePayload(data, mimetype)
+    RESPONSES.set(key, entry)
+  return entry
+
+def CachedResponse(key, body, max_age = DEFAULT_MAX_AGE, mimetype = 'application/json'):
+  """Returns a conditional, compressed when accepted, response for a cached
+  Payload, or for text of the given mimetype."""
+  entry = body if isinstance(body, Payload) else GetResponseEntry(key, body, mimetype)
+  gzipped = entry.gzipped is not None and 'gzip' in request.accept_encodings
+  # Each content coding has its own strong ETag
+  etag = entry.etag + GZIP_ETAG_SUFFIX if gzipped else entry.etag
+  if request.if_none_match.contains(etag):
+    response = Response(status = 304)
+  elif gzipped:
+    response = Response(entry.gzipped, mimetype = entry.mimetype)
+    response.headers['Content-Encoding'] = 'gzip'
+  else:
+    response = Response(entry.body, mimetype = entry.mimetype)
+  response.set_etag(etag)
+  response.headers['Cache-Control'] = 'public, max-age=' + str(int(max_age))
+  response.headers['Last-Modified'] = email.utils.formatdate(entry.last_modified, usegmt = True)
+  response.headers['Vary'] = 'Accept-Encoding'
+  return response
+
+def LayerMaxAge(map_id):
+  if map_id in LAYERS:
+    return LAYERS[map_id]['max_age']
+  return DEFAULT_MAX_AGE
 
-  return ExtractMeanForestChange(chart_data)
+##################################################################################################
+# CUSTOM POLYGONS CACHE
+##################################################################################################
 
+# Results of custom polygons are stored on disk under a hash of the normalized
+# geometry, the layer and the effective scale. Redrawing the same polygon,
+# even from another vertex or in the other direction, is answered from cache.
+custom_cache = DiskCache(CUSTOM_CACHE_PATH, CUSTOM_CACHE_MAX_BYTES)
+
+def normalizeRing(ring, clockwise):
+  """Returns the rounded ring, open, oriented and starting at its lowest point."""
+  points = list()
+  for point in ring:
+    point = (round(point[0], CUSTOM_KEY_PRECISION), round(point[1], CUSTOM_KEY_PRECISION))
+    if not points or points[-1] != point:
+      points.append(point)
+  if len(points) > 1 and points[0] == points[-1]:
+    points.pop()
+  area = 0
+  for i in range(len(points)):
+    x1, y1 = points[i - 1]
+    x2, y2 = points[i]
+    area += x1 * y2 - x2 * y1
+  if (area < 0) != clockwise:
+    points.reverse()
+  start = points.index(min(points))
+  return points[start:] + points[:start]
+
+def normalizeGeometry(geometry):
+  """Returns a canonical form of a Polygon or MultiPolygon GeoJSON geometry."""
+  if geometry['type'] == 'Polygon':
+    polygons = [geometry['coordinates']]
+  elif geometry['type'] == 'MultiPolygon':
+    polygons = geometry['coordinates']
+  else:
+    raise Exception('Geometry type ' + str(geometry['type']) + ' not supported')
+  normalized = list()
+  for polygon in polygons:
+    # Outer rings counterclockwise and holes clockwise, as in GeoJSON
+    holes = sorted(normalizeRing(ring, True) for ring in polygon[1:])
+    normalized.append([normalizeRing(polygon[0], False)] + holes)
+  return sorted(normalized)
+
+def CustomSeriesKey(map_id, geometry, zoom, aggregation = None):
+  if map_id not in LAYERS:
+    raise Exception("Map type does not exists")
+  scale = LAYERS[map_id]['scale'] / zoom
+  key = [map_id, scale, normalizeGeometry(geometry)]
+  if aggregation is not None:
+    key.append(aggregation)
+  # Results of updated layers are kept for the current cadence
+  cadence = LAYERS[map_id].get('cadence')
+  if cadence:
+    key.append(int(time.time() // cadence))
+  key = json.dumps(key)
+  return hashlib.sha256(key.encode('utf-8')).hexdigest()
 
 ##################################################################################################
-# VEGETATION INDEX MAP 
+# BACKGROUND JOBS
 ##################################################################################################
 
-def GetVegetationMap():
-  img = ee.Image(ee.ImageCollection('MODIS/MCD43A4_NDVI').mean())
-  return img.getMapId({
-    'min': '0',
-    'max': '1',
-    'palette' : 'FFFFFF,CC9966,CC9900,996600,33CC00,009900,006600,000000'
-  })
+# Precomputing a layer takes minutes, /save and /static queue it as a job in
+# a SQLite file and a worker.py process runs it, reporting its progress
+# after each batch of countries. The job handlers return the response the
+# routes used to send when they ran the precompute themselves.
+jobs = JobQueue(JOBS_DB)
+
+def RunSaveJob(params, report):
+  """Precomputes the details of every country of a layer into cache, and
+  into its details file when SAVE is set."""
+  map_id = params['map_id']
+  # Computed details are written to memcache a batch at a time
+  pending = dict()
+  def flush():
+    mc.set_many(pending, DetailsExpire(map_id))
+    pending.clear()
+
+  def store(country_id, details):
+    if details is not None:
+      pending[DetailsKey(map_id, country_id)] = JSONPayload(details)
+      if len(pending) >= BULK_BATCH_SIZE:
+        flush()
 
-def ComputeCountryTimeSeriesVegetation(country_id, feature = None, zoom = 1):
-  """Returns a series of vegetation over time for the country."""
-  collection = ee.ImageCollection('MODIS/MCD43A4_NDVI')
-  collection = collection.select('NDVI')
-  
-  scale = REDUCTION_SCALE_METERS
-  if feature is None:
-    feature = GetFeature(country_id)
+  if SAVE:
+    progress = PrecomputeDetailsFile(map_id, store, resume = False, compact = params['compact'], report = report)
   else:
-    scale = scale / zoom
+    progress = PrecomputeLayer(map_id, store, report = report)
+  flush()
+  return progress
+
+def RunStaticJob(params, report):
+  """Precomputes the details file of a layer."""
+  return PrecomputeDetailsFile(params['map_id'], compact = params['compact'], report = report)
+
+JOB_HANDLERS = {
+  'save': RunSaveJob,
+  'static': RunStaticJob
+}
+
+def RunJob(job, report):
+  """Runs a claimed job, returns its result and its error message or None."""
+  handler = JOB_HANDLERS.get(job['kind'])
+  if handler is None:
+    return None, 'Unknown job kind ' + job['kind']
+  try:
+    with metrics.timer('job_seconds', kind = job['kind']):
+      progress = handler(job['params'], report)
+  except Exception as e:
+    logger.debug('Error RunJob ' + str(job['id']) + ': ' + str(e))
+    return None, str(e)
+  result = {'status' : 0, 'message' : '', 'progress' : progress}
+  if progress['failed']:
+    result['status'] = 1
+    result['message'] = progress['message']
+    return result, progress['message']
+  return result, None
+
+def EnqueueJob(kind, map_id):
+  """Queues a precompute job of a layer, returns the response with its id."""
+  if map_id not in LAYERS:
+    return json.dumps({'status' : 1, 'message' : 'Map type does not exists'}), 404
+  params = {'map_id': map_id, 'compact': request.args.get('format') == 'compact'}
+  try:
+    job_id = jobs.enqueue(kind, params)
+  except Exception as e:
+    logger.debug('Error EnqueueJob: ' + str(e))
+    return json.dumps({'status' : 1, 'message' : str(e)}), 503
+  metrics.inc('jobs_enqueued_total', kind = kind)
+  return json.dumps({'status' : 0, 'message' : '', 'job' : job_id, 'url' : '/jobs/' + str(job_id)}), 202
 
-  # Compute the mean temperature in the region in each image.
-  def ComputeMeanVegetation(img):
-    reduction = img.reduceRegion(ee.Reducer.mean(), feature.geometry(), scale)
 
-    return ee.Feature(None, {
-        'system:time_start' : img.get('system:time_start'),
-        'NDVI': reduction.get('NDVI')
-    })
+##################################################################################################
+# REFRESH AHEAD
+##################################################################################################
 
-  chart_data = collection.map(ComputeMeanVegetation).getInfo()
+# Requests count the accesses to the details of each country. Every
+# REFRESH_INTERVAL the scheduler takes the hot ones and computes those
+# missing from memcache, and those of layers with a cadence computed a
+# cadence ago or more. Details of those layers are cached for
+# REFRESH_EXPIRE_CADENCES cadences, so hot details are refreshed before they
+# expire. The age of details is the time their Payload was made, so it holds
+# across processes and restarts. A process claims the details it recomputes
+# with a memcache add, and skips those another process claimed within the
+# last half cadence. Map ids are kept fresh by the map id refresher.
+details_access = AccessCounter(REFRESH_HALF_LIFE, REFRESH_TRACKED_KEYS)
+REFRESH_STARTED = None
+REFRESH_LOCK = threading.Lock()
+
+def RecordDetailsAccess(map_id, country_id, aggregation = None):
+  if map_id in LAYERS and country_id in COUNTRIES:
+    details_access.hit((map_id, country_id, aggregation))
+
+def RefreshKey(map_id, country_id, aggregation = None):
+  return 'refresh' + '_' + DetailsKey(map_id, country_id, aggregation)
+
+def DetailsRefreshDue(map_id, details, now):
+  """Returns whether cached details were computed a cadence of their layer ago."""
+  cadence = LAYERS[map_id].get('cadence')
+  if not cadence:
+    return False
+  if not isinstance(details, Payload):
+    # Cached as text, when is unknown
+    return True
+  return now - details.last_modified >= cadence
+
+def ClaimRefresh(map_id, country_id, aggregation, now):
+  """Returns whether this process is the one to recompute some details in
+  this cadence. Every process goes on when memcache fails."""
+  expire = max(1, int(LAYERS[map_id]['cadence'] // 2))
+  return mc.add(RefreshKey(map_id, country_id, aggregation), now, expire) is not False
+
+def RefreshCountryDetails(map_id, country_id, aggregations):
+  """Computes and caches the details of a country, with the aggregations asked for them."""
+  with Stage('refresh'):
+    details = ComputeCountryDetailsIncrementally(map_id, country_id)
+  if IsEmptyDetails(details):
+    return
+  values = {DetailsKey(map_id, country_id): JSONPayload(details)}
+  for aggregation in aggregations:
+    if aggregation is not None:
+      values[DetailsKey(map_id, country_id, aggregation)] = JSONPayload(AggregateDetails(details, aggregation))
+  mc.set_many(values, DetailsExpire(map_id))
+
+def HotDetailsToRefresh(now):
+  """Returns the (map id, country id, aggregations) of the hot details to
+  compute, the most accessed first."""
+  hot = collections.OrderedDict()
+  for (map_id, country_id, aggregation), score in details_access.top(REFRESH_HOT_KEYS, REFRESH_MIN_SCORE):
+    hot.setdefault((map_id, country_id), list()).append(aggregation)
+  # From memcache, the local tier would hide the details expired there
+  found = mc.get_many([DetailsKey(map_id, country_id, aggregation)
+    for (map_id, country_id), aggregations in hot.items() for aggregation in aggregations], local = False)
+  refresh = list()
+  for (map_id, country_id), aggregations in hot.items():
+    details = [found.get(DetailsKey(map_id, country_id, a)) for a in aggregations]
+    claimed = [a for a, d in zip(aggregations, details)
+      if d is not None and DetailsRefreshDue(map_id, d, now) and ClaimRefresh(map_id, country_id, a, now)]
+    if claimed or None in details:
+      refresh.append((map_id, country_id, aggregations))
+  return refresh
+
+def RefreshHotDetails(executor):
+  """One pass of the scheduler, returns the number of details refreshed."""
+  refresh = HotDetailsToRefresh(time.time())
+  futures = [(map_id, country_id, aggregations, executor.submit(RefreshCountryDetails, map_id, country_id, aggregations))
+    for map_id, country_id, aggregations in refresh]
+  for map_id, country_id, aggregations, future in futures:
+    try:
+      future.result()
+      metrics.inc('refresh_total', layer = map_id, result = 'ok')
+    except Exception as e:
+      metrics.inc('refresh_total', layer = map_id, result = 'error')
+      logger.debug('Error RefreshHotDetails, map: ' + map_id + ' : ' + str(e))
+      # Lets another process, or the next pass, retry them
+      for aggregation in aggregations:
+        mc.delete(RefreshKey(map_id, country_id, aggregation))
+  return len(refresh)
+
+def RefreshScheduler():
+  executor = ThreadPoolExecutor(max_workers = REFRESH_MAX_CONCURRENCY)
+  while True:
+    time.sleep(REFRESH_INTERVAL)
+    try:
+      count = RefreshHotDetails(executor)
+      if count:
+        logger.debug('Refreshed ' + str(count) + ' hot details')
+    except Exception as e:
+      logger.debug('Error RefreshScheduler: ' + str(e))
 
-  # Extract the results as a list of lists.
-  def ExtractMeanVegetation(feature):
-    if 'NDVI' in feature['properties'] and feature['properties']['NDVI'] is not None:
-      return [
-        feature['properties']['system:time_start'],
-        feature['properties']['NDVI']
-      ]
+def StartRefreshScheduler():
+  """Starts the refresh-ahead scheduler of this process in background, once."""
+  global REFRESH_STARTED
+  with REFRESH_LOCK:
+    if REFRESH_STARTED is not None:
+      return
+    REFRESH_STARTED = time.time()
+  thread = threading.Thread(target = RefreshScheduler, name = 'refresh-scheduler')
+  thread.daemon = True
+  thread.start()
 
-  return map(ExtractMeanVegetation, chart_data['features'])
 
+##################################################################################################
+# WARM-UP
+##################################################################################################
 
-def ComputeCountryTimeSeries(map_id, country_id, feature = None, zoom = 1):
-  """Returns a series of the specific map over time for the country."""
-  if map_id == '0':
-    return ComputeCountryTimeSeriesHigh(country_id, feature, zoom)
-  elif map_id == '1':
-    return ComputeCountryTimeSeriesLights(country_id, feature, zoom)
-  elif map_id == '2':
-    return ComputeCountryTimeSeriesTemp(country_id, feature, zoom)
-  elif map_id == '3':
-    return ComputeCountryTimeSeriesWaterOccurence(country_id, feature, zoom)
-  elif map_id == '4':
-    return ComputeCountryTimeSeriesWaterChange(country_id, feature, zoom)
-  elif map_id == '5':
-    return ComputeCountryTimeSeriesForestChange(country_id, feature, zoom)
-  elif map_id == '6':
-    return ComputeCountryTimeSeriesVegetation(country_id, feature, zoom)
-  else:
-    raise Exception("Map type does not exists")
+# Each worker initializes Earth Engine, fetches the map ids, simplifies the
+# country geometries and fills the cache from the precomputed details files
+# before it reports ready, so the first visitors after a deploy do not pay
+# for it. Each worker writes its own file in WARMUP_READY_PATH when done,
+# named after its PID, and the instance is ready once every live worker has one.
+WARMUP = {'ready': False, 'started': None, 'elapsed': None, 'steps': collections.OrderedDict(),
+  'preloaded': 0, 'errors': []}
+WARMUP_LOCK = threading.Lock()
+
+def WarmUpGeometries():
+  """Simplifies the geometry of every country for the scale of every layer."""
+  for scale in sorted(set(layer['scale'] for layer in LAYERS.values())):
+    for country_id in COUNTRIES:
+      GetCountryGeometry(country_id, scale)
+
+def WarmUpMapIds():
+  for map_id in sorted(LAYERS):
+    GetCachedMapFromId(map_id)
+
+def PreloadDetails():
+  """Loads the precomputed details files missing from cache, the initial map first."""
+  if not CACHE:
+    return
+  map_ids = [INITIAL_MAP] + sorted(map_id for map_id in LAYERS if map_id != INITIAL_MAP)
+  for map_id in map_ids:
+    path = DetailsFilePath(map_id)
+    if not os.path.exists(path):
+      continue
+    with open(path, 'r') as f:
+      countries = json.load(f)
+    keys = dict((DetailsKey(map_id, country_id), details) for country_id, details in countries.items()
+      if country_id in COUNTRIES and not IsEmptyDetails(details))
+    cached = mc.get_many(list(keys))
+    values = dict()
+    # Details are as old as the file, so the refresh scheduler sees their age
+    computed = os.path.getmtime(path)
+    for key in sorted(keys):
+      if key not in cached and WARMUP['preloaded'] + len(values) < WARMUP_PRELOAD_MAX:
+        values[key] = JSONPayload(keys[key])._replace(last_modified = computed)
+    mc.set_many(values, DetailsExpire(map_id))
+    WARMUP['preloaded'] += len(values)
+    if WARMUP['preloaded'] >= WARMUP_PRELOAD_MAX:
+      return
+
+def ReadyFilePath(pid = None):
+  return os.path.join(WARMUP_READY_PATH, str(pid or os.getpid()) + '.json')
+
+def WriteReadyFile():
+  if not os.path.isdir(WARMUP_READY_PATH):
+    os.makedirs(WARMUP_READY_PATH)
+  path = ReadyFilePath()
+  tmp_path = path + '.tmp'
+  with open(tmp_path, 'w') as f:
+    json.dump(WarmUpStatus(), f)
+  os.replace(tmp_path, path)
+
+def RemoveReadyFile(pid = None):
+  """Removes the ready file of a worker, this process by default."""
+  try:
+    os.remove(ReadyFilePath(pid))
+  except OSError:
+    pass
+
+def ClearReadyFiles():
+  """Removes the ready files left by the workers of a previous run."""
+  if not os.path.isdir(WARMUP_READY_PATH):
+    return
+  for name in os.listdir(WARMUP_READY_PATH):
+    try:
+      os.remove(os.path.join(WARMUP_READY_PATH, name))
+    except OSError:
+      pass
+
+def RunWarmUp():
+  """Runs the warm-up steps and marks the worker ready, also when some step failed."""
+  steps = [
+    ('geometries', WarmUpGeometries),
+    ('earth_engine', InitializeEE),
+    ('layers', BuildLayers),
+    ('map_ids', WarmUpMapIds),
+    ('details', PreloadDetails)
+  ]
+  for name, step in steps:
+    start = time.time()
+    try:
+      step()
+    except Exception as e:
+      # Requests retry what failed here when they need it
+      WARMUP['errors'].append(name + ': ' + str(e))
+      logger.debug('Error warm-up ' + name + ': ' + str(e))
+    WARMUP['steps'][name] = round(time.time() - start, 3)
+  WARMUP['elapsed'] = round(time.time() - WARMUP['started'], 3)
+  WARMUP['ready'] = True
+  StartRefreshScheduler()
+  logger.info('Warm-up finished in ' + str(WARMUP['elapsed']) + 's')
+  try:
+    WriteReadyFile()
+  except (IOError, OSError) as e:
+    logger.debug('Error WriteReadyFile: ' + str(e))
+
+def StartWarmUp():
+  """Starts the warm-up of this process in background, once."""
+  with WARMUP_LOCK:
+    if WARMUP['started'] is not None:
+      return
+    WARMUP['started'] = time.time()
+  thread = threading.Thread(target = RunWarmUp, name = 'warm-up')
+  thread.daemon = True
+  thread.start()
+
+def WarmUpStatus():
+  status = dict(WARMUP)
+  status['steps'] = dict(WARMUP['steps'])
+  status['errors'] = list(WARMUP['errors'])
+  return status
 
 ##################################################################################################
 # APP ROUTES
@@ -466,17 +1780,22 @@ app.config.update(
 
 @app.before_request
 def before_request():
-  # When you import jinja2 macros, they get cached which is annoying for local
-  # development, so wipe the cache every request.
-  #app.jinja_env.cache = dict()
-  # Initialize Earth Engine
-  ee.Initialize(EE_CREDENTIALS)
-  #ee.Initialize()
+  # Requests stop waiting for Earth Engine after EE_REQUEST_DEADLINE seconds
+  g.started = time.time()
+  g.deadline = g.started + EE_REQUEST_DEADLINE
+
+@app.after_request
+def after_request(response):
+  # Streamed responses are timed until their first chunk
+  labels = MetricLabels()
+  metrics.observe('request_seconds', time.time() - g.started, **labels)
+  metrics.inc('requests_total', status = str(response.status_code), **labels)
+  return response
 
 # Define root route
 @app.route('/')
 def main():
-  mapid = GetMapFromId(INITIAL_MAP)
+  mapid = GetCachedMapFromId(INITIAL_MAP)
   
   # Add variables to the template
   template_values = {
@@ -484,7 +1803,7 @@ def main():
     'mapid': mapid['mapid'],
     'token': mapid['token'],
     'API_KEY': config.API_KEY,
-    'countries' : json.dumps(COUNTRIES_ID)
+    'countries' : COUNTRIES_JSON
   }
 
   # Render the template index.html
@@ -493,116 +1812,84 @@ def main():
 
 @app.route('/map/<id>')
 def get(id):
-  mapid = GetMapFromId(id)
+  mapid = GetCachedMapFromId(id)
   # Add variables to the template
   template_values = {
     'map' : id,
     'mapid': mapid['mapid'],
     'token': mapid['token'],
     'API_KEY': config.API_KEY,
-    'countries' : json.dumps(COUNTRIES_ID)
+    'countries' : COUNTRIES_JSON
   }
-  # Render the template reload.html
-  return render_template('reload.html', values = template_values)
+  # Render the template reload.html, reusable until the token is refreshed
+  max_age = max(0, mapid['expires'] - MAPID_REFRESH_AHEAD - time.time())
+  return CachedResponse('map_' + id, render_template('reload.html', values = template_values),
+    max_age, 'text/html')
 
 
 @app.route('/save/<map_id>')
 def saveCountryTimeSeries(map_id):
-  error = 0
-  message = ''
+  """Queues the precompute of the details of every country into cache"""
   if CACHE:
-    elems = dict()
-    if SAVE:
-      path = DETAILS_PATH + 'mapid_' + map_id + '.json'
-      details_file = open(path, 'w')
-    else:
-      thread = threading.Thread()
-      thread.start()
-    for country_id in COUNTRIES_ID:  
-      key = 'details' + '_'+ map_id + '_' + country_id
-      details = dict()
-      try:
-        if map_id == '0' or map_id == '3':
-          details = ComputeCountryTimeSeries(map_id, country_id)
-          if details is not None:
-            mc.set(key, json.dumps(details))
-        elif map_id == '5':
-          details['forestChange'] = ComputeCountryTimeSeries(map_id, country_id)
-          if details['forestChange'] is not None:
-            mc.set(key, json.dumps(details))
-        else:
-          details['timeSeries'] = list(ComputeCountryTimeSeries(map_id, country_id))
-          if details['timeSeries'] is not None:
-            mc.set(key, json.dumps(details))
-        elems[country_id] = details
-      except Exception as e:
-        error = 1
-        message = str(e)
-        logger.debug('Error saveCountryTimeSeries: ' + message)
-    if SAVE and not error:
-      json.dump(elems, details_file , separators = (',', ':'))
-      details_file.close()
-  return json.dumps({'status' : error, 'message' : message})
+    return EnqueueJob('save', map_id)
+  return json.dumps({'status' : 0, 'message' : ''})
 
 @app.route('/static/<map_id>')
 def staticCountryTimeSeries(map_id):
-  error = 0
-  message = ''
+  """Queues the precompute of the details file of a map"""
   if SAVE:
-    elems = dict()
-    path = DETAILS_PATH + 'mapid_' + map_id + '.json'
-    details_file = open(path, 'w')
-    for country_id in COUNTRIES_ID:  
-      key = 'details' + '_'+ map_id + '_' + country_id
-      details = dict()
-      try:
-        if map_id == '0' or map_id == '3':
-          details = ComputeCountryTimeSeries(map_id, country_id)
-          if details is not None:
-            elems[country_id] = details
-        elif map_id == '5':
-          details['forestChange'] = ComputeCountryTimeSeries(map_id, country_id)
-          if details['forestChange'] is not None:
-            elems[country_id] = details
-        else:
-          details['timeSeries'] = list(ComputeCountryTimeSeries(map_id, country_id))
-          if details['timeSeries'] is not None:
-            elems[country_id] = details
-      except Exception as e:
-        error = 1
-        message = str(e)
-        logger.debug('Error saveCountryTimeSeries: ' + message)
-    if not error:
-      json.dump(elems, details_file , separators = (',', ':'))
-      details_file.close()
-  return json.dumps({'status' : error, 'message' : message})
+    return EnqueueJob('static', map_id)
+  return json.dumps({'status' : 0, 'message' : ''})
+
+@app.route('/jobs/<int:job_id>')
+def GetJobStatus(job_id):
+  """State and progress of a queued precompute job"""
+  job = jobs.get(job_id)
+  if job is None:
+    return json.dumps({'error': 'Job ' + str(job_id) + ' not found'}), 404
+  return Response(json.dumps(job), mimetype = 'application/json')
+
+@app.route('/compact/<map_id>')
+def GetCompactDetailsFile(map_id):
+  """Serves the compact details file of a map, precompressed when accepted"""
+  path = CompactPath(map_id)
+  for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+    if encoding in request.accept_encodings and os.path.exists(path + suffix):
+      response = send_file(path + suffix, mimetype = 'application/json')
+      response.headers['Content-Encoding'] = encoding
+      response.headers['Vary'] = 'Accept-Encoding'
+      return response
+  if not os.path.exists(path):
+    return json.dumps({'error': 'Map ' + map_id + ' not precomputed'}), 404
+  return send_file(path, mimetype = 'application/json')
+
+@app.route('/compact/<map_id>/<country_id>')
+def GetCompactCountryDetails(map_id, country_id):
+  """Serves the precomputed details of a single country"""
+  try:
+    countries = LoadCompactDetails(map_id)
+  except (IOError, OSError):
+    return json.dumps({'error': 'Map ' + map_id + ' not precomputed'}), 404
+  details = countries.get(country_id)
+  if details is None:
+    return json.dumps({'error': 'Country ' + country_id + ' not precomputed'}), 404
+  if request.args.get('format') != 'compact':
+    details = ExpandDetails(details)
+  return json.dumps(details)
 
 @app.route('/details/<map_id>/<country_id>')
 def GetCountryTimeSeries(map_id, country_id):
-  if CACHE:
-    try:
-      key = 'details' + '_'+ map_id + '_' + country_id
-      details = mc.get(key)
-      if details is not None:
-        return details
-    except Exception as e:
-      logger.debug('Error cache GetCountryTimeSeries: ' + str(e))
-
   details = dict()
   try:
-    if map_id == '0' or map_id == '3':
-      details = ComputeCountryTimeSeries(map_id, country_id)
-      if CACHE and details is not None:
-        mc.set(key, json.dumps(details))
-    elif map_id == '5':
-      details['forestChange'] = ComputeCountryTimeSeries(map_id, country_id)
-      if CACHE and details['forestChange'] is not None:
-        mc.set(key, json.dumps(details))
-    else:
-      details['timeSeries'] = list(ComputeCountryTimeSeries(map_id, country_id))
-      if CACHE and details['timeSeries'] is not None:
-        mc.set(key, json.dumps(details))
-
+    aggregation = RequestAggregation(map_id)
+    if CACHE:
+      RecordDetailsAccess(map_id, country_id, aggregation)
+      body = GetCachedCountryDetails(map_id, country_id, aggregation)
+      return CachedResponse(DetailsKey(map_id, country_id, aggregation), body, LayerMaxAge(map_id))
+    details = AggregateDetails(ComputeCountryDetails(map_id, country_id), aggregation)
+
+  except ValueError as e:
+    details['error'] = str(e)
   except ee.EEException as e:
     # Handle exceptions from the EE client library.
     details['error'] = str(e)
@@ -610,37 +1897,176 @@ def GetCountryTimeSeries(map_id, country_id):
   # Send the results to the browser.
   return json.dumps(details)
 
+def GetCachedCountryDetails(map_id, country_id, aggregation = None):
+  """Returns the JSON Payload of the details of a country from cache,
+  computing them when missing.
+
+  Aggregated details are cached under their own key and computed from the
+  cached full series. Details of incremental layers expire after their
+  max_age and are then refreshed with the images added since.
+  """
+  key = DetailsKey(map_id, country_id, aggregation)
+  if aggregation is None:
+    compute = lambda: ComputeCountryDetailsIncrementally(map_id, country_id)
+  else:
+    compute = lambda: AggregateDetails(json.loads(GetCachedCountryDetails(map_id, country_id).body), aggregation)
+  # Concurrent requests for a missing country share a single computation
+  return AsPayload(mc.get_or_compute(key, compute, encode = JSONPayload,
+    cacheable = lambda details: not IsEmptyDetails(details), expire = DetailsExpire(map_id)))
+
+def CountryElement(country_id, encoded_details):
+  """Returns the JSON object of a country in the all countries details, from
+  its already encoded details."""
+  prefix = '{"id":' + json.dumps(country_id) + ',"name":' + json.dumps(getCountryName(country_id)) + ',"data":'
+  return prefix.encode('utf-8') + encoded_details + b'}'
+
+def DetailsLine(country_id, encoded_details):
+  """Returns the NDJSON line of a country from its already encoded details."""
+  return CountryElement(country_id, encoded_details) + b'\n'
+
+def StreamAllCountriesDetails(map_id, aggregation = None):
+  """Yields one JSON line per country, cached countries first and then the
+  rest as soon as their batch is computed."""
+  if map_id not in LAYERS:
+    yield json.dumps({'error': 'Map type does not exists'}) + '\n'
+    return
+  missing = list()
+  cached = dict()
+  if CACHE:
+    cached = mc.get_many([DetailsKey(map_id, country_id) for country_id in COUNTRIES_ID])
+  for country_id in COUNTRIES_ID:
+    details = AsPayload(cached.get(DetailsKey(map_id, country_id)))
+    if details is None:
+      missing.append(country_id)
+    else:
+      yield DetailsLine(country_id, AggregateEncodedDetails(details.body, aggregation))
+  if not missing:
+    return
+  batch_size = LayerBatchSize(map_id)
+  executor = ThreadPoolExecutor(max_workers = PRECOMPUTE_WORKERS)
+  futures = list()
+  try:
+    for i in range(0, len(missing), batch_size):
+      futures.append(executor.submit(ComputeBatchDetails, map_id, missing[i:i + batch_size]))
+    for future in as_completed(futures):
+      computed = dict()
+      for country_id, details in future.result().items():
+        if isinstance(details, Exception):
+          yield json.dumps({'id': country_id, 'error': str(details)}) + '\n'
+          continue
+        if IsEmptyDetails(details):
+          continue
+        details = JSONPayload(details)
+        computed[DetailsKey(map_id, country_id)] = details
+        yield DetailsLine(country_id, AggregateEncodedDetails(details.body, aggregation))
+      if CACHE:
+        mc.set_many(computed, DetailsExpire(map_id))
+  finally:
+    # Stop computing when the client goes away
+    for future in futures:
+      future.cancel()
+    executor.shutdown(wait = False)
+
 @app.route('/details/<map_id>')
 def GetAllCountriesDetails(map_id):
+  try:
+    aggregation = RequestAggregation(map_id)
+  except ValueError as e:
+    return json.dumps({'error': str(e)})
+  if request.args.get('stream') == '1' or request.accept_mimetypes.best == NDJSON_MIMETYPE:
+    return Response(stream_with_context(StreamAllCountriesDetails(map_id, aggregation)), mimetype = NDJSON_MIMETYPE)
   if CACHE:
+    key = DetailsKey(map_id, aggregation = aggregation)
+    return CachedResponse(key, GetCachedAllCountriesDetails(map_id, aggregation), LayerMaxAge(map_id))
+  countries = dict()
+  countries['error'] = 'Not implemented yet'
+  return json.dumps(countries)
+
+def GetCachedAllCountriesDetails(map_id, aggregation = None):
+  """Returns the JSON Payload of the details of all countries from cache,
+  building it when missing."""
+  # Only complete lists are cached, a list missing failed countries is
+  # built again by the next request
+  return AsPayload(mc.get_or_compute(DetailsKey(map_id, aggregation = aggregation),
+    lambda: BuildAllCountriesDetails(map_id, aggregation),
+    encode = lambda built: built[0], cacheable = lambda built: built[1], expire = DetailsExpire(map_id)))
+
+def BuildAllCountriesDetails(map_id, aggregation = None):
+  """Returns the JSON Payload of the details of all countries, a list of
+  {'id', 'name', 'data'} objects built from the encoded details of each one,
+  and whether every country was computed."""
+  if aggregation is not None:
+    # Aggregated from the cached details of all countries
+    payload = AsPayload(mc.get(DetailsKey(map_id)))
+    complete = True
+    if payload is None:
+      payload, complete = BuildAllCountriesDetails(map_id)
+      if complete:
+        mc.set(DetailsKey(map_id), payload, DetailsExpire(map_id))
+    countries = json.loads(payload.body)
+    for country in countries:
+      country['data'] = AggregateDetails(country['data'], aggregation)
+    return JSONPayload(countries), complete and bool(countries)
+  # A single round trip per memcached node for the whole layer
+  found = mc.get_many([DetailsKey(map_id, country_id) for country_id in COUNTRIES_ID])
+  cached = dict()
+  for country_id in COUNTRIES_ID:
+    cached[country_id] = found.get(DetailsKey(map_id, country_id))
+  # The countries missing from cache are reduced together in a few EE calls
+  missing = [country_id for country_id in COUNTRIES_ID if cached.get(country_id) is None]
+  computed = dict()
+  failed = 0
+  if missing:
     try:
-     key = 'details' + '_' + map_id
-     countries = mc.get(key)
-     if countries is not None:
-       return countries
+      failed = PrecomputeLayer(map_id, computed.__setitem__, missing)['failed']
     except Exception as e:
-      logger.debug('Error cache GetAllCountriesDetails' + str(e))
-    countries = list()
-    for country_id in COUNTRIES_ID: 
-      try: 
-        key = 'details' + '_'+ map_id + '_' + country_id
-        country = mc.get(key)
-      except Exception as e:
-        logger.debug('Error cache GetAllCountriesDetails: ' + country_id)
-      try:
-        if country is None:
-          elem = {'name' : getCountryName(country_id), 'data' : ComputeCountryTimeSeries(map_id, country_id) }
-        else:
-          elem = {'name' : getCountryName(country_id), 'data' : country }
-        countries.append(json.dumps(elem))
-      except Exception as e:
-        logger.debug('Error GetAllCountriesDetails, country: ' + country_id + ' : ' + str(e))
-    key = 'details' + '_'+ map_id
-    mc.set(key, json.dumps(countries))
-  else:
-    countries = dict()
-    countries['error'] = 'Not implemented yet'
-  return json.dumps(countries)
+      logger.debug('Error GetAllCountriesDetails: ' + str(e))
+      failed = len(missing)
+  countries = list()
+  new_details = dict()
+  for country_id in COUNTRIES_ID:
+    country = AsPayload(cached.get(country_id))
+    if country is None:
+      if IsEmptyDetails(computed.get(country_id)):
+        continue
+      country = JSONPayload(computed[country_id])
+      new_details[DetailsKey(map_id, country_id)] = country
+    countries.append(CountryElement(country_id, country.body))
+  mc.set_many(new_details, DetailsExpire(map_id))
+  return MakePayload(b'[' + b','.join(countries) + b']', 'application/json'), not failed and bool(countries)
+
+@app.route('/cache/stats')
+def GetCacheStats():
+  """Hit and miss counters of the details cache"""
+  return json.dumps(mc.stats())
+
+@app.route('/_ah/ready')
+def GetReadiness():
+  """Whether the warm-up of every worker of the instance finished, and how
+  long it took to each, with the status of the worker answering"""
+  StartWarmUp()
+  workers = readyWorkers(WARMUP_READY_PATH)
+  status = {'ready': len(workers) >= expectedWorkers(), 'expected': expectedWorkers(), 'workers': workers,
+    'worker': WarmUpStatus()}
+  return Response(json.dumps(status), status = 200 if status['ready'] else 503, mimetype = 'application/json')
+
+@app.route('/metrics')
+def GetMetrics():
+  """Timings and counters of this process in the Prometheus text format"""
+  stats = mc.stats()
+  for result in ('local_hits', 'remote_hits', 'misses'):
+    metrics.set('cache_lookups_total', stats[result], kind = 'counter', result = result)
+  for name in ('coalesced', 'computed', 'remote_errors'):
+    metrics.set('cache_' + name + '_total', stats[name], kind = 'counter')
+  metrics.set('cache_local_items', stats['local_size'])
+  metrics.set('cache_in_flight', stats['in_flight'])
+  metrics.set('refresh_tracked_details', len(details_access))
+  try:
+    for state, count in jobs.counts().items():
+      metrics.set('jobs', count, state = state)
+  except Exception as e:
+    logger.debug('Error GetMetrics jobs: ' + str(e))
+  return Response(metrics.render(), mimetype = 'text/plain; version=0.0.4')
 
 
 @app.route('/custom/<map_id>/<zoom>', methods = ['POST'])
@@ -649,16 +2075,34 @@ def GetCustomSeries(map_id, zoom):
   key = list(request.form.keys())[0]
   details = dict()
   try:
-    feature = coordsToFeature(key)
+    geojson = json.loads(key, object_hook = change_dict)
+    zoom = int(zoom)
+    aggregation = RequestAggregation(map_id)
+    # Aggregated results have their own entry, next to the full series
+    aggregated_key = CustomSeriesKey(map_id, geojson['geometry'], zoom, aggregation)
+    cached = custom_cache.get(aggregated_key)
+    metrics.inc('custom_cache_total', result = 'miss' if cached is None else 'hit')
+    if cached is not None:
+      return cached
+    cache_key = CustomSeriesKey(map_id, geojson['geometry'], zoom)
+    cached = custom_cache.get(cache_key) if aggregation is not None else None
+    if cached is not None:
+      details = AggregateEncodedDetails(cached, aggregation)
+      custom_cache.set(aggregated_key, details)
+      return details
+    with Stage('geometry'):
+      geojson['geometry'] = simplifyGeometry(geojson['geometry'], LAYERS[map_id]['scale'] / zoom)
+    feature = coordsToFeature(geojson)
     if feature is not None:
       try:
-        zoom = int(zoom)
-        if map_id == '0' or map_id == '3':
-          details = ComputeCountryTimeSeries(map_id, None, feature, zoom)
-        elif map_id == '5':
-          details['forestChange'] = ComputeCountryTimeSeries(map_id, None, feature, zoom)
-        else:
-          details['timeSeries'] = list(ComputeCountryTimeSeries(map_id, None, feature, zoom))
+        details = ComputeCountryDetails(map_id, None, feature, zoom)
+        if not IsEmptyDetails(details):
+          details = EncodeJSON(details)
+          custom_cache.set(cache_key, details)
+          if aggregation is not None:
+            details = AggregateEncodedDetails(details, aggregation)
+            custom_cache.set(aggregated_key, details)
+          return details
       except ee.EEException as e:
         # Handle exceptions from the EE client library.
         details['error'] = str(e)
@@ -669,31 +2113,103 @@ def GetCustomSeries(map_id, zoom):
   # Send the results to the browser.
   return json.dumps(details)
 
-@app.route('/country/<country_id>')
-def getCountryName(country_id):
-  """Get country name from country id"""
-  if CACHE:
+def CustomBatchPolygons(collection):
+  """Returns the (id, geometry, error) of the polygons of a GeoJSON
+  FeatureCollection. Polygons are identified by the id of their feature, or
+  its 'id' property, or else their position, which must be unique."""
+  if not isinstance(collection, dict) or collection.get('type') != 'FeatureCollection':
+    raise ValueError('A FeatureCollection is expected')
+  features = collection.get('features')
+  if not isinstance(features, list) or not features:
+    raise ValueError('The FeatureCollection has no features')
+  if len(features) > CUSTOM_BATCH_MAX_POLYGONS:
+    raise ValueError('At most ' + str(CUSTOM_BATCH_MAX_POLYGONS) + ' polygons are accepted')
+  polygons = list()
+  seen = set()
+  for i, feature in enumerate(features):
+    feature = feature if isinstance(feature, dict) else dict()
+    properties = feature.get('properties') or dict()
+    polygon_id = str(feature.get('id', properties.get('id', i)))
+    geometry = feature.get('geometry')
+    # Results are keyed by id, a repeated one could not be told apart
+    if polygon_id in seen:
+      raise ValueError('Duplicate polygon id ' + polygon_id)
+    seen.add(polygon_id)
+    error = None
+    if not isinstance(geometry, dict) or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+      error = 'Polygon or MultiPolygon geometry expected'
+    polygons.append((polygon_id, geometry, error))
+  return polygons
+
+@app.route('/custom/<map_id>/<zoom>/batch', methods = ['POST'])
+def GetCustomSeriesBatch(map_id, zoom):
+  """Get time series from the polygons of a FeatureCollection, reduced together"""
+  try:
+    if map_id not in LAYERS:
+      raise ValueError('Map type does not exists')
+    zoom = int(zoom)
+    if zoom < 1:
+      raise ValueError('Zoom must be at least 1')
+    aggregation = RequestAggregation(map_id)
+    polygons = CustomBatchPolygons(json.loads(request.get_data(as_text = True)))
+  except ValueError as e:
+    logger.debug('Error GetCustomSeriesBatch: ' + str(e))
+    return json.dumps({'error': str(e)}), 400
+  results = dict()
+  errors = dict()
+  pending = collections.OrderedDict() # polygon id -> simplified geometry
+  cache_keys = dict()
+  for polygon_id, geometry, error in polygons:
+    if error is not None:
+      errors[polygon_id] = error
+      continue
     try:
-      key = 'name_' + country_id
-      name = mc.get(key)
-      if name is not None:
-        return name
+      cache_keys[polygon_id] = CustomSeriesKey(map_id, geometry, zoom)
+      cached = custom_cache.get(cache_keys[polygon_id])
+      metrics.inc('custom_cache_total', result = 'miss' if cached is None else 'hit')
+      if cached is not None:
+        results[polygon_id] = json.loads(cached)
+        continue
+      with Stage('geometry'):
+        pending[polygon_id] = simplifyGeometry(geometry, LAYERS[map_id]['scale'] / zoom)
     except Exception as e:
-      logger.debug('Error cache getCountryName:' + str(e))
-  path = COUNTRIES_PATH + country_id + '.geo.json'
-  path = os.path.join(os.path.split(__file__)[0], path)
-  try:
-    with open(path, 'r') as f:
-      t = f.read()
-      elem = json.loads(t, object_hook = change_dict)
-      name = elem['properties']['name']
-      if CACHE and name is not None:
-        mc.set(key, name)
-      f.close()
-      return name
-  except Exception as e:
-    logger.debug('Error getCountryName reading file ' + path + ' : ' + str(e))
+      errors[polygon_id] = 'Invalid geometry: ' + str(e)
+  if pending:
+    try:
+      computed = ComputeCustomRegionsDetails(map_id, pending, zoom)
+    except Exception as e:
+      logger.debug('Error GetCustomSeriesBatch: ' + str(e))
+      computed = dict((polygon_id, e) for polygon_id in pending)
+    for polygon_id, details in computed.items():
+      if isinstance(details, Exception):
+        errors[polygon_id] = str(details)
+      elif IsEmptyDetails(details):
+        errors[polygon_id] = 'No data for the polygon'
+      else:
+        custom_cache.set(cache_keys[polygon_id], EncodeJSON(details))
+        results[polygon_id] = details
+  for polygon_id in results:
+    results[polygon_id] = AggregateDetails(results[polygon_id], aggregation)
+  return Response(EncodeJSON({'results': results, 'errors': errors}), mimetype = 'application/json')
+
+def getCountryName(country_id):
+  country = COUNTRIES.get(country_id)
+  if country is None:
+    logger.debug('Error getCountryName unknown country ' + country_id)
+    return None
+  return country.name
+
+@app.route('/country/<country_id>')
+def GetCountryName(country_id):
+  """Get country name from country id"""
+  name = getCountryName(country_id)
+  if name is None:
+    return 'Country ' + country_id + ' not found', 404
+  return CachedResponse('name_' + country_id, name, COUNTRY_MAX_AGE, 'text/html')
 
 # Run application in selected port
 if __name__ == '__main__':
+  # Ready files left by a previous run would mark this one ready too early
+  ClearReadyFiles()
+  StartWarmUp()
   app.run('0.0.0.0', 8080, threaded=True)
\ No newline at end of file
@@ -0,0 +1,113 @@
+import bisect
+import threading
+import time
+import contextlib
+
+##################################################################################################
+# METRICS
+##################################################################################################
+
+# Upper bounds, in seconds, of the buckets of timing histograms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Histogram(object):
+  """Counts of observed values per bucket, with their sum and count."""
+
+  def __init__(self, buckets):
+    self.buckets = buckets
+    # The last count is for the values above every bucket, +Inf
+    self.counts = [0] * (len(buckets) + 1)
+    self.sum = 0.0
+    self.count = 0
+
+  def observe(self, value):
+    self.counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.sum += value
+    self.count += 1
+
+
+def escapeLabel(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def formatLabels(labels, extra = None):
+  pairs = list(labels)
+  if extra is not None:
+    pairs.append(extra)
+  if not pairs:
+    return ''
+  return '{' + ','.join(name + '="' + escapeLabel(value) + '"' for name, value in pairs) + '}'
+
+def formatValue(value):
+  if value == float('inf'):
+    return '+Inf'
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics(object):
+  """Thread-safe counters, gauges and histograms of one process.
+
+  Every series is a metric name and a set of labels, render returns them in
+  the Prometheus text exposition format.
+  """
+
+  def __init__(self, prefix = '', buckets = DEFAULT_BUCKETS):
+    self.prefix = prefix
+    self.buckets = tuple(buckets)
+    self.lock = threading.Lock()
+    self.kinds = dict() # name -> 'counter' | 'gauge' | 'histogram'
+    self.series = dict() # name -> {labels: value or Histogram}
+
+  def getSeries(self, name, kind):
+    if self.kinds.setdefault(name, kind) != kind:
+      raise ValueError('Metric ' + name + ' is a ' + self.kinds[name])
+    return self.series.setdefault(name, dict())
+
+  def inc(self, name, n = 1, **labels):
+    key = tuple(sorted(labels.items()))
+    with self.lock:
+      series = self.getSeries(name, 'counter')
+      series[key] = series.get(key, 0) + n
+
+  def set(self, name, value, kind = 'gauge', **labels):
+    """Sets a gauge, or a counter kept by another object."""
+    key = tuple(sorted(labels.items()))
+    with self.lock:
+      self.getSeries(name, kind)[key] = value
+
+  def observe(self, name, value, **labels):
+    key = tuple(sorted(labels.items()))
+    with self.lock:
+      series = self.getSeries(name, 'histogram')
+      histogram = series.get(key)
+      if histogram is None:
+        histogram = series[key] = Histogram(self.buckets)
+      histogram.observe(value)
+
+  @contextlib.contextmanager
+  def timer(self, name, **labels):
+    """Observes the seconds spent in the with block, also when it raises."""
+    start = time.time()
+    try:
+      yield
+    finally:
+      self.observe(name, time.time() - start, **labels)
+
+  def render(self):
+    lines = list()
+    with self.lock:
+      for name in sorted(self.series):
+        kind = self.kinds[name]
+        full_name = self.prefix + name
+        lines.append('# TYPE ' + full_name + ' ' + kind)
+        for labels, value in sorted(self.series[name].items()):
+          if kind != 'histogram':
+            lines.append(full_name + formatLabels(labels) + ' ' + formatValue(value))
+            continue
+          cumulative = 0
+          for bound, count in zip(self.buckets + (float('inf'),), value.counts):
+            cumulative += count
+            lines.append(full_name + '_bucket' + formatLabels(labels, ('le', formatValue(bound)))
+              + ' ' + str(cumulative))
+          lines.append(full_name + '_sum' + formatLabels(labels) + ' ' + formatValue(value.sum))
+          lines.append(full_name + '_count' + formatLabels(labels) + ' ' + str(value.count))
+    return '\n'.join(lines) + '\n'
@@ -12,15 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
+import json
 import sys
 
 from flask import Flask
 
+from readiness import expectedWorkers, readyWorkers
+
 
 # The app checks this file for the PID of the process to monitor.
 PID_FILE = None
 
+# Each web app worker writes <pid>.json in this directory when its warm-up
+# finished.
+READY_PATH = '/tmp/earthengine-app/ready'
+
+# Web app workers run by gunicorn, see gunicorn.conf.py.
+WORKERS = expectedWorkers()
+
 
 # Create app to handle health checks and monitor the queue worker. This will
 # run alongside the worker, see procfile.
@@ -44,6 +53,18 @@ def health():
     return 'healthy', 200
 
 
+# The readiness check reads the files written by the web app workers after
+# their warm-up, the same rule as the /_ah/ready route of the app.
+@monitor_app.route('/_ah/ready')
+def ready():
+    workers = readyWorkers(READY_PATH)
+
+    if len(workers) < WORKERS:
+        return 'Warm-up finished in {} of {} workers'.format(len(workers), WORKERS), 503
+
+    return json.dumps(workers), 200, {'Content-Type': 'application/json'}
+
+
 @monitor_app.route('/')
 def index():
     return health()
@@ -51,4 +72,6 @@ def index():
 
 if __name__ == '__main__':
     PID_FILE = sys.argv[1]
+    if len(sys.argv) > 2:
+        READY_PATH = sys.argv[2]
     monitor_app.run('0.0.0.0', 8080)
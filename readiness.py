@@ -0,0 +1,32 @@
+import os
+import json
+
+##################################################################################################
+# READINESS
+##################################################################################################
+
+# Each web app worker writes <pid>.json in a directory when its warm-up
+# finished, with the duration of each step. An instance is ready once every
+# worker gunicorn runs has one. Files of workers that are not running anymore
+# are ignored, so a respawned worker is waited for. Shared by the /_ah/ready
+# route of the app and by monitor.py.
+
+def readyWorkers(path):
+  """Returns a dict from PID to the warm-up status of the live ready workers."""
+  workers = dict()
+  if not os.path.isdir(path):
+    return workers
+  for name in os.listdir(path):
+    pid, extension = os.path.splitext(name)
+    if extension != '.json' or not os.path.exists('/proc/' + pid):
+      continue
+    try:
+      with open(os.path.join(path, name), 'r') as f:
+        workers[pid] = json.load(f)
+    except (IOError, ValueError):
+      continue
+  return workers
+
+def expectedWorkers():
+  """Returns the number of web app workers run by gunicorn, see gunicorn.conf.py."""
+  return int(os.environ.get('GUNICORN_WORKERS', '1'))
@@ -202,7 +202,8 @@ function getDetails(countryId, mapid) {
     var that = this;
     var static = this.getStatic(countryId, mapid);
     if (!static) {
-        $.get("/details/" + mapid + "/" + countryId)
+        // As text, cached details are sent as application/json and jQuery would parse them
+        $.get("/details/" + mapid + "/" + countryId, null, null, "text")
             .done((function(data) {
                 $("#spinner").hide();
                 if (data) {
@@ -274,30 +275,51 @@ function getStaticAllDetails(mapid) {
 }
 
 /**
- * Asyncronously get details from all countries
+ * Asyncronously get details from all countries, streaming one country per line
  * @param mapid 
  */
 function getAllDetails(mapid) {
     $("#spinner").show();
     var details = getStaticAllDetails(mapid);
     if (!details) {
-        $.get("/details/" + mapid)
-            .done((function(data) {
-                var json = JSON.parse(data);
-                var error = false;
-                if (json["error"]) {
-                    $("#dialog-text").text(json["error"]);
-                    $("#dialog").show();
-                } else {
-                    this.showAllCharts(mapid, json);
+        var that = this;
+        var countries = [];
+        var parsed = 0;
+        var xhr = new XMLHttpRequest();
+        var readLines = function() {
+            var text = xhr.responseText;
+            var end = text.lastIndexOf("\n");
+            if (end < parsed) {
+                return;
+            }
+            text.substring(parsed, end).split("\n").forEach(function(line) {
+                if (line) {
+                    var json = JSON.parse(line);
+                    if (json["error"] && !json["id"]) {
+                        $("#dialog-text").text(json["error"]);
+                        $("#dialog").show();
+                    } else if (!json["error"]) {
+                        countries.push(json);
+                    }
                 }
-            }).bind(this))
-            .fail(function(xhr, status, error) {
-                console.log("Error getAllDetails: " + error + " status: " + status);
-                $("#spinner").hide();
-                $("#dialog-text").text("Request error");
-                $("#dialog").show();
             });
+            parsed = end + 1;
+            that.showAllCharts(mapid, countries);
+        };
+        xhr.open("GET", "/details/" + mapid + "?stream=1");
+        xhr.setRequestHeader("Accept", "application/x-ndjson");
+        xhr.onprogress = readLines;
+        xhr.onload = function() {
+            readLines();
+            $("#spinner").hide();
+        };
+        xhr.onerror = function() {
+            console.log("Error getAllDetails status: " + xhr.status);
+            $("#spinner").hide();
+            $("#dialog-text").text("Request error");
+            $("#dialog").show();
+        };
+        xhr.send();
     }
 }
 
@@ -496,7 +518,10 @@ function showAllCharts(mapid, data) {
             if (e != null && e != undefined) {
                 var elem = [];
                 elem[0] = e["name"];
-                var dElem = JSON.parse(e["data"]);
+                var dElem = e["data"];
+                if (typeof dElem === "string") {
+                    dElem = JSON.parse(dElem);
+                }
                 if (mapid == '0') {
                     elem[1] = dElem["elevation"];
                 }
@@ -1 +1 @@
-function createMap(t,e){var o=sessionStorage.getItem("lat"),a=sessionStorage.getItem("lng");o&&a||(o=49.61,a=6.13);var i=new google.maps.LatLng(parseFloat(o),parseFloat(a)),n=sessionStorage.getItem("zoom");n||(n=4);var s={center:i,zoom:parseInt(n),maxZoom:30,streetViewControl:!1},r=new google.maps.Map(document.getElementById("map"),s),h={getTileUrl:function(o,a){var i=["https://earthengine.googleapis.com/map",t,a,o.x,o.y].join("/");return i+="?token="+e},tileSize:new google.maps.Size(256,256)},l=new google.maps.ImageMapType(h);return r.overlayMapTypes.push(l),r}function useGeolocalization(t){var e=new google.maps.InfoWindow({map:t});navigator.geolocation?navigator.geolocation.getCurrentPosition(function(o){var a={lat:o.coords.latitude,lng:o.coords.longitude};e.setPosition(a),e.setContent("Location found"),t.setCenter(a)},function(){console.log("Error with geolocation current position"+e)}):console.log("Browser does not allow HTML geolocalization"+e)}function findRandomColor(t){t||(t=1+6*(1+Math.floor(100*Math.random())));var e=["aqua","black","blue","fuchsia","gray","green","lime","maroon","navy","olive","orange","purple","red","silver","teal","white","yellow"];return e[t%e.length]}function addCountries(t){t.forEach(function(t){var e=sessionStorage.getItem(t);if(e)this.map.data.addGeoJson(JSON.parse(e));else{var o="static/countries/"+t+".geo.json";this.map.data.loadGeoJson(o),$.get(o,function(e){try{sessionStorage.setItem(t,JSON.stringify(e))}catch(t){}})}this.map.data.setStyle(function(t){id=t.j;for(var e=0,o=0;o<id.length;o++)e+=id.charCodeAt(o);var a=findRandomColor(e);return{fillColor:a,fillOpacity:.1,strokeColor:a,strokeWeight:2}})}.bind(this))}function removeCountries(){this.map.data.forEach(function(t){map.data.remove(t)})}function handleCountryClick(t){this.clear();var e=t.feature;this.map.data.overrideStyle(e,{strokeWeight:4,fillOpacity:.5}),this.title=e.f.name;var o="https://en.wikipedia.org/wiki/"+this.title;$("#panel-wiki").show().attr("href",o);var a=e.j,i=$("#input-save-map").val();this.getDetails(a,i)}function getDetails(t,e){$("#spinner").show();var o=this;this.getStatic(t,e)||$.get("/details/"+e+"/"+t).done(function(t){$("#spinner").hide(),t&&sessionStorage.setItem("data",t),o.reloadChart(e,t)}.bind(this)).fail(function(t,e,o){console.log("Error getDetails: "+o+" status: "+e),$("#spinner").hide(),$("#dialog-text").text("Request error"),$("#dialog").show()})}function getAllStatic(t){localStorage.removeItem("map_data"),$.get("/static/details/mapid_"+t+".json").done(function(t){if(t)try{localStorage.setItem("map_data",JSON.stringify(t))}catch(t){}}.bind(this)).fail(function(t,e,o){console.log("Error getAllDetails Static: "+o+" status: "+e)})}function getStatic(t,e){var o=JSON.parse(localStorage.getItem("map_data"));if(o){$("#spinner").hide();var a=o[t];return a&&sessionStorage.setItem("data",JSON.stringify(a)),this.reloadChart(e,a),!0}return!1}function getStaticAllDetails(t){var e=JSON.parse(localStorage.getItem("map_data"));return!!e&&(this.showAllCharts(t,e),!0)}function getAllDetails(t){$("#spinner").show(),getStaticAllDetails(t)||$.get("/details/"+t).done(function(e){var o=JSON.parse(e);o.error?($("#dialog-text").text(o.error),$("#dialog").show()):this.showAllCharts(t,o)}.bind(this)).fail(function(t,e,o){console.log("Error getAllDetails: "+o+" status: "+e),$("#spinner").hide(),$("#dialog-text").text("Request error"),$("#dialog").show()})}function clear(){$("#panel-title").empty().hide(),$("#panel-wiki").hide().attr("href",""),$("#panel-chart").empty().hide(),$("#panel").hide(),$("#panel-chart-line").hide(),$("#panel-chart-bar").hide(),$("#panel-chart-geo").hide(),$("#panel-chart-histogram").hide(),$("#panel-chart-pie").hide(),$("#show-all-countries").hide(),this.map.data.revertStyle()}function getMap(t){$("#spinner").show(),this.clear(),$.get("/map/"+t).done(function(t){$("#map").append(t),$("#spinner").hide()}).fail(function(t,e,o){console.log("Error getMap: "+o+" status: "+e),$("#spinner").hide(),$("#dialog-text").text("Request error"),$("#dialog").show()})}function saveCountriesCache(t){setTimeout(function(){$.get("/save/"+t).done(function(t){var e=JSON.parse(t);e.status&&e[!1]}.bind(this)).fail(function(t,e,o){console.log("Error saveCountries: "+o+" status: "+e),$("#spinner").hide(),$("#dialog-text").text("Request error"),$("#dialog").show()})},3e3)}function saveCountriesStatic(t){setTimeout(function(){$.get("/static/"+t).done(function(t){var e=JSON.parse(t);e.status&&e[!1]}.bind(this)).fail(function(t,e,o){console.log("Error saveCountries: "+o+" status: "+e),$("#spinner").hide(),$("#dialog-text").text("Request error"),$("#dialog").show()})},3e3)}function reloadChart(t,e){$("#spinner").hide(),$("#dialog").hide();var o=!1;try{var a=JSON.parse(e)}catch(t){var a=e}var i;a?a.timeSeries&&a.timeSeries?this.showCharts(t,a.timeSeries):a.elevation&&a.elevation?($("#show-all-countries").show(),this.showGeoChart(this.title,a.elevation)):a.histogram&&a.histogram?this.showHistogram(this.title,a.histogram):a.forestChange&&a.forestChange?this.showPieChart(this.title,a.forestChange):a.error?(o=!0,i=a.error):(o=!0,i="Sorry, there is no data available"):(o=!0,i="Undefined error"),o?($("#panel-wiki").hide(),$("#dialog-text").text(i),$("#dialog").show()):($("#panel").fadeIn(500),$("#panel-title").show().text(this.title),"Custom"!==this.title?$("#panel-wiki").show():$("#panel-wiki").hide())}function showCharts(t,e){for(var o=0;o<e.length;o++){var a=e[o];if(null!=a){if(o+1<e.length){var i=e[o+1];null!=i&&a[0]==i[0]&&(e.splice(o+1,1),a[1]=(a[1]+i[1])/2)}a[0]=new Date(parseInt(a[0],10))}}this.data=new google.visualization.DataTable,this.data.addColumn("date"),this.data.addColumn("number"),this.data.addRows(e),"0"==t?this.options={title:"High",hAxis:"Date",vAxis:"Elevation"}:"1"==t?this.options={title:"Lights",hAxis:"Date",vAxis:"Luminosity"}:"2"==t?this.options={title:"Temperature",hAxis:"Date",vAxis:"Celsius Degrees"}:"3"==t?this.options={title:"Water Occurrence Change Intensity",hAxis:"Date",vAxis:"Water"}:"4"==t?this.options={title:"Water Change",hAxis:"Date",vAxis:"Water",legend:"0: 'No observations', 1: 'Not water', 2: 'Seasonal water', 3: 'Permanent water'"}:"5"==t?this.options={title:"Forest Change",hAxis:"Date",vAxis:"Pixels representing loss"}:"6"==t&&(this.options={title:"Vegetation Index",hAxis:"Date",vAxis:"NDVI"}),this.columnNames=[this.options.hAxis,this.options.vAxis],1!=t&&4!=t?this.showLineChart(this.options,this.data):this.showBarChart(this.options,this.data)}function showAllCharts(t,e){if($("#panel-title").text("All countries"),"0"==t&&(this.columnNames=["Country","Elevation"]),elems=[this.columnNames],Array.isArray(e))e.forEach(function(e){if(null!=e&&void 0!=e){var o=[];o[0]=e.name;var a=JSON.parse(e.data);"0"==t&&(o[1]=a.elevation),null!=o[1]&&elems.push(o)}}),"0"==t&&this.showAllGeoChart(elems);else if(this.countries){var o=this.countries.length,a=0;this.countries.forEach(function(i){$.get("/country/"+i).done(function(n){a++;try{var s=e[i];if(null!=s&&void 0!=s){var r=[];r[0]=n,"0"==t&&(r[1]=s.elevation),null!=r[1]&&elems.push(r),"0"==t&&this.showAllGeoChart(elems)}}catch(s){}a==o&&$("#spinner").hide()}.bind(this)).fail(function(t,e,i){a++,a==o&&$("#spinner").hide(),console.log("Error getCountryName: "+i+" status: "+e),$("#dialog-text").text("Request error"),$("#dialog").show()})})}}function showGeoChart(t,e){this.type="GeoChart",this.getScreenDimensions(),this.columnNames=["Country","Elevation"],this.data=google.visualization.arrayToDataTable([this.columnNames,[t,e]]),this.options={title:"Elevation Average",width:this.width,height:this.height,colorAxis:{colors:["blue"]}},this.chart=new google.visualization.GeoChart(document.getElementById("panel-chart-geo")),this.chart.draw(this.data,this.options),$("#panel-wide").css("width",this.width),$("#button-panel-line").hide(),$("#button-panel-bar").hide(),$("#panel-chart-geo").show(),this.prepareChartLink()}function showAllGeoChart(t){this.type="GeoChart",this.getScreenDimensions(),this.data=google.visualization.arrayToDataTable(t),this.options={title:"Elevation Average",width:this.width,height:this.height,colorAxis:{colors:["white","blue","black"]}},this.chart=new google.visualization.GeoChart(document.getElementById("panel-chart-geo")),this.chart.draw(this.data,this.options),this.zoom=!0,$("#panel-wide").css("width",this.width),$("#button-panel-line").hide(),$("#button-panel-bar").hide(),$("#panel-chart-geo").show(),$("#show-all-countries").hide(),this.prepareChartLink()}function showLineChart(t,e,o,a){this.type="LineChart",o&&a||(this.getScreenDimensions(),o=this.width,a=this.height),$("#panel-wide").css("width",o);var i=t.title;t.legend&&(i=i+" - "+t.legend),this.chart=new google.visualization.ChartWrapper({chartType:"LineChart",dataTable:e,options:{title:i,curveType:"function",legend:{position:"none"},titletextStyle:{fontName:"Roboto"},width:o,height:a,hAxis:{title:t.hAxis},vAxis:{title:t.vAxis}}}),$("#panel-chart-line").show(),$("#panel-chart-bar").hide(),$("#button-panel-line").hide(),$("#button-panel-bar").show();var n=$("#panel-chart-line").get(0);this.chart.setContainerId(n),this.chart.draw(),this.prepareChartLink(!0)}function showBarChart(t,e,o,a){this.type="BarChart",o&&a||(this.getScreenDimensions(),o=this.width,a=this.height),$("#panel-wide").css("width",o);var i=t.title;t.legend&&(i=i+" - "+t.legend),this.chart=new google.visualization.ChartWrapper({chartType:"ColumnChart",dataTable:e,options:{title:i,legend:{position:"none"},titleTextStyle:{fontName:"Roboto"},width:o,height:a,hAxis:{title:t.hAxis},vAxis:{title:t.vAxis}}}),$("#panel-chart-line").hide(),$("#panel-chart-bar").show(),$("#button-panel-line").show(),$("#button-panel-bar").hide();var n=$("#panel-chart-bar").get(0);this.chart.setContainerId(n),this.chart.draw(),this.prepareChartLink(!0)}function showHistogram(t,e){this.type="Histogram",this.getScreenDimensions(),this.columnNames=["Country","Water Occurence"];var o=[this.columnNames];e.forEach(function(e){var a=[];a[0]=t,a[1]=e,o.push(a)}),this.data=google.visualization.arrayToDataTable(o),this.options={title:"Water Occurrence Change Intensity",width:this.width,height:this.height,colorAxis:{colors:["blue"]},legend:{position:"none"}},this.chart=new google.visualization.Histogram(document.getElementById("panel-chart-histogram")),this.chart.draw(this.data,this.options),$("#panel-wide").css("width",this.width),$("#button-panel-line").hide(),$("#button-panel-bar").hide(),$("#panel-chart-histogram").show(),this.prepareChartLink()}function showPieChart(t,e){this.type="PieChart",this.getScreenDimensions(),this.columnNames=["Status","Percentage"],e[1]||e[2]||($("#dialog-text").text("There is not enough forest data to create a chart"),$("#dialog").show()),this.data=google.visualization.arrayToDataTable([this.columnNames,["Gain",100*e[1]],["Loss",100*e[2]]]),this.options={title:"Forest change - Total forest in area: "+(e[0]/255*100).toFixed(3)+"%",width:this.width,height:this.height,pieSliceText:"none"},this.width>this.height&&(this.options.legend={position:"labeled"}),this.chart=new google.visualization.PieChart(document.getElementById("panel-chart-pie")),this.chart.draw(this.data,this.options),$("#panel-wide").css("width",this.width),$("#button-panel-line").hide(),$("#button-panel-bar").hide(),$("#panel-chart-pie").show(),this.prepareChartLink()}function getScreenDimensions(){var t=$(window).width(),e=$(window).height();t>800?this.zoom?(this.width=1e3,this.height=500):(this.width=800,this.height=350):(this.height=e-90,this.width=t)}function showMapInfo(t){$("#map-title").text(MapTitle[t]),$("#map-info span").text(MapInfo[t]),$("#map-info").show()}function prepareChartLink(t){setTimeout(function(){if(t)try{this.chart=this.chart.getChart()}catch(t){}if(null!=this.chart)try{var e=this.chart.getImageURI();$("#open-chart").attr("href",e);var o=this.options.title+" in "+$("#panel-title").text()+" Chart Image.png";$("#open-chart").attr("download",o)}catch(t){}},1e3)}function dataTableToCSV(){for(var t,e=this.data.getNumberOfColumns(),o=this.data.getNumberOfRows(),a=[],i=0;i<e;i++)a.push(this.columnNames[i].replace(/;/g,""));for(t=a.join(";")+"\r\n",i=0;i<o;i++){for(var n=[],s=0;s<e;s++)n.push(this.data.getFormattedValue(i,s).replace(/;/g,""));t+=n.join(";")+"\r\n"}return t}function downloadCSV(t,e){var o=new Blob([t],{type:"text/csv;charset=utf-8"}),a=window.URL||window.webkitURL,i=document.createElement("a");i.href=a.createObjectURL(o),i.download=e+".csv",document.body.appendChild(i),i.click()}function polygonDraw(t){var e=this;$("#menu-draw-color").children("i").css("color",t),this.drawingManager=new google.maps.drawing.DrawingManager({drawingMode:google.maps.drawing.OverlayType.POLYGON,drawingControl:!1,polygonOptions:{fillColor:t,strokeColor:t}}),google.maps.event.addListener(this.drawingManager,"overlaycomplete",function(t){e.polygon=t.overlay,e.stopDrawing(),e.saveStorage()}),this.drawingManager.setMap(this.map)}function stopDrawing(){this.drawingManager.setOptions({drawingMode:null}),this.drawingManager.setMap(null)}function saveStorage(){sessionStorage.setItem("zoom",JSON.stringify(this.map.getZoom()));var t=this.map.getCenter().lat(),e=this.map.getCenter().lng();sessionStorage.setItem("lat",t),sessionStorage.setItem("lng",e)}function clearStorage(){sessionStorage.removeItem("zoom"),sessionStorage.removeItem("lat"),sessionStorage.removeItem("lng"),sessionStorage.removeItem("data"),localStorage.removeItem("map_data")}function allowDrawing(t){this.color&&!t||(this.color=this.findRandomColor()),$("#menu-draw-color").children("i").css("color",this.color),this.polygon?(this.polygon.setOptions({fillColor:this.color,strokeColor:this.color}),this.stopDrawing()):this.polygonDraw(this.color)}function getCoordinates(t){return t.getPath().getArray().map(function(t){return[t.lng(),t.lat()]})}function removePolygon(){this.polygon&&(this.polygon.setMap(null),this.polygon=null)}function sendPolygon(){var t=this;if(this.polygon){var e=getCoordinates(polygon),o={type:"FeatureCollection",features:[{type:"Feature",id:"EXA",properties:{name:"Custom"},geometry:{type:"Polygon",coordinates:[e]}}]},a=JSON.stringify(o);$("#spinner").show(),t.title="Custom";var i=$("#input-save-map").val(),n=t.map.getZoom();$.post("/custom/"+i+"/"+n,a).done(function(e){var o=JSON.parse(e);sessionStorage.setItem("data",JSON.stringify(o)),t.reloadChart(i,e)}.bind(this)).fail(function(t,e,o){console.log("Error sendPolygon: "+o+" status: "+e),$("#spinner").hide(),$("#dialog-text").text("Request error"),$("#dialog").show()})}else $("#dialog-text").text("You must create a polygon first"),$("#dialog").show()}function zoomChart(t){if(t.zoom){var e=800,o=350;t.zoom=!1}else{var e=1e3,o=500;t.zoom=!0}"GeoChart"==t.type?(t.chart=new google.visualization.GeoChart(document.getElementById("panel-chart-geo")),t.options.width=e,t.options.height=o,t.chart.draw(t.data,t.options),t.prepareChartLink()):"LineChart"==this.type?(1e3==e&&(e+=200),t.showLineChart(t.options,t.data,e,o)):"BarChart"==t.type?(1e3==e&&(e+=200),t.showBarChart(t.options,t.data,e,o)):"Histogram"==t.type?(t.chart=new google.visualization.Histogram(document.getElementById("panel-chart-histogram")),t.options.width=e,t.options.height=o,t.chart.draw(t.data,t.options),t.prepareChartLink()):(t.type="PieChart")&&(t.chart=new google.visualization.PieChart(document.getElementById("panel-chart-pie")),t.options.width=e,t.options.height=o,t.chart.draw(t.data,t.options),t.prepareChartLink()),$("#panel-wide").css("width",e)}function initSearchPlaces(t){var e=this,o=document.getElementById("search-input"),a=new google.maps.places.SearchBox(o);t.controls.push(o);var i=new google.maps.InfoWindow,n=new google.maps.Geocoder,s=new google.maps.Marker({map:t});t.addListener("bounds_changed",function(){a.setBounds(t.getBounds())}),this.markers&&this.markers.forEach(function(t){t.setMap(null)}),this.markers=[],a.addListener("places_changed",function(){i.close();var o=a.getPlaces();if(0!=o.length){e.markers.forEach(function(t){t.setMap(null)}),e.markers=[];var r=new google.maps.LatLngBounds;o.forEach(function(o){if(!o.geometry)return void console.log("Returned place contains no geometry");o.place_id&&n.geocode({placeId:o.place_id},function(e,a){if("OK"!==a)return void window.alert("Geocoder failed due to: "+a);s.setPlace({placeId:o.place_id,location:e[0].geometry.location}),s.setVisible(!0),document.getElementById("place-name").textContent=o.name,document.getElementById("place-id").textContent=o.place_id,document.getElementById("place-address").textContent=e[0].formatted_address,i.setContent(document.getElementById("place-content")),i.open(t,s)});var a={url:o.icon,size:new google.maps.Size(71,71),origin:new google.maps.Point(0,0),anchor:new google.maps.Point(17,34),scaledSize:new google.maps.Size(25,25)};s?e.markers.push(s):e.markers.push(new google.maps.Marker({map:t,icon:a,title:o.name,position:o.geometry.location})),o.geometry.viewport?r.union(o.geometry.viewport):r.extend(o.geometry.location)}),t.fitBounds(r),t.setZoom(14),$("#search-button").removeClass("search-button-show"),$("#search-input").hide(),$("#map-info").hide()}})}function handleAbout(){var t=document.querySelector("#snackbar-about");document.querySelector("#button-about").addEventListener("click",function(){var e={message:"Made by Mónica Pastor",timeout:4e3};t.MaterialSnackbar.showSnackbar(e)})}function attachListeners(){var t=this;t.zoom=!1,$(".change_map").click(function(){var e=$(this).attr("map_id");t.getMap(e),$("#panel").hide(),$("#input-save-map").val(e),$("#switch-draw").attr("cheched",!1)});var e=document.querySelector("dialog");e.showModal||dialogPolyfill.registerDialog(e),$("#dialog-close").click(function(){$("#dialog").hide()}),$("#panel-close").click(function(){$("#panel").hide()}),$("#panel-download").click(function(){var e=t.dataTableToCSV(),o=t.options.title+" in "+$("#panel-title").text();t.downloadCSV(e,o)}),$("#button-zoom-map").click(function(){t.zoomChart(t)}),$("#button-panel-line").click(function(){t.zoom=!1,$("#button-panel-line").hide(),$("#panel-chart-bar").hide(),$("#button-panel-bar").show(),t.showLineChart(t.options,t.data),$("#panel-chart-line").show()}),$("#button-panel-bar").click(function(){t.zoom=!1,$("#button-panel-bar").hide(),$("#panel-chart-line").hide(),$("#button-panel-line").show(),t.showBarChart(t.options,t.data),$("#panel-chart-bar").show()}),$("#close-map-info").click(function(){$(this).parent().hide(),$("#info-button").show(),$("#info-label").show()}),$("#show-all-countries").click(function(){var e=$("#input-save-map").val();t.getAllDetails(e)}),$("#switch-draw").change(function(){$(this).is(":checked")?(t.drawing=!0,$(this).attr("checked",!1),$("#menu-draw").show(),$("#panel").hide(),t.color="#ff0000",t.polygonDraw(t.color),t.removeCountries()):(t.drawing=!1,$(this).attr("checked",!0),$("#menu-draw").hide(),t.removePolygon(),t.stopDrawing(),t.addCountries(t.countries),t.clearStorage())}),$("#menu-draw-clear").click(function(){t.removePolygon();t.allowDrawing()}),$("#menu-draw-done").click(function(){t.sendPolygon()}),$("#show-menu-draw").click(function(){$("#menu-draw").show()}),$("#menu-draw-color").click(function(){t.allowDrawing(!0)}),$("#menu-draw-close").click(function(){$("#menu-draw").hide(),$("#button-draw").show(),$("#draw-label").show()}),$("#button-draw").click(function(){$(this).hide(),$("#menu-draw").show(),$("#draw-label").hide()}),$("#search-button").click(function(){$("#panel").hide(),$(this).hasClass("search-button-show")?($(this).removeClass("search-button-show"),$("#search-input").hide(),t.markers&&t.markers.forEach(function(t){t.setMap(null)})):($(this).addClass("search-button-show"),$("#search-input").show(),$("#search-input").focus(),t.map&&t.initSearchPlaces(t.map))}),$("#info-button").click(function(){$("#map-info").show(),$(this).hide(),$("#info-label").hide()}),$("#google-button-clear").click(function(){$("#map-info").hide(),$(this).hide(),$("#google-button-show").show(),$("#info-label-clear").hide(),$("#info-label-show").show(),t.mapPrev=t.map.overlayMapTypes.pop()}),$("#google-button-show").click(function(){$("#map-info").show(),$(this).hide(),$("#google-button-clear").show(),$("#info-label-show").hide(),$("#info-label-clear").show(),t.mapPrev&&t.map.overlayMapTypes.push(t.mapPrev)})}function removeListeners(){$(".change_map").off(),$("#dialog-close").off(),$("#panel-close").off(),$("#panel-download").off(),$("#button-zoom-map").off(),$("#button-panel-line").off(),$("#button-panel-bar").off(),$("#close-map-info").off(),$("#show-all-countries").off(),$("#switch-draw").off(),$("#menu-draw-clear").off(),$("#menu-draw-done").off(),$("#show-menu-draw").off(),$("#menu-draw-color").off(),$("#menu-draw-close").off(),$("#button-draw").off(),$("#search-button").off(),$("#info-button").off(),$("#google-button-clear").off(),$("#google-button-show").off()}var initialize=function(t,e,o,a,i){i&&(this.clearStorage(),this.data_map={}),this.removeListeners(),this.map=this.createMap(e,o),this.countries=JSON.parse(a),this.drawing?(this.polygon&&this.drawingManager&&(this.polygon.setMap(this.map),this.drawingManager.setMap(this.map)),this.allowDrawing(),$("#menu-draw").show()):this.addCountries(this.countries),this.map.data.addListener("click",handleCountryClick.bind(this)),this.attachListeners(),$("#input-save-map").val(t),this.showMapInfo(t),this.getAllStatic(t),$(window).on("load",function(){this.handleAbout()})},MapTitle=["Elevation","Lights","Temperature","Water Occurrence","Water Change","Forest Change","Vegetation"],MapInfo=["The SRTM elevation map uses a scale from 0 to 3000 using a spectrum palette of blue, green and red, where blue indicates less height and red the most","NOAA Lights map give us a representation of the brightness of each country","The MODIS Land\tSurface\tTemperature\tmap\truns on\ta scale\tof 0 to\t40°C, where\tblue indicates colder values and red indicates warmer values. White\tindicates values in\tthe middle of the spectrum, around 20°C","Water Occurrence provides a summary of where and how often surface water occurred over time, using red as minimum and blue as maximum","The Water Change map shows the places that water has reduced in red and in green where it has grown","The Forest Change map represents forest change, is green where there's forest, red where there's forest loss, blue where there's forest gain, and magenta where there's both gain and loss.","The MODIS Normalized Difference Vegetation Index (NDVI) map runs on a scale of 0 to 1, where white and brown indicate no to low vegetation, and green to black indicate medium to high vegetation."];$(function(){($(document).width()>1e3||$(document).height()>1e3)&&($("#panel").draggable(),$("#menu-draw").draggable(),$("#map-info").draggable()),$(window).on("orientationchange",function(t){if($(document).width()<800&&$("#panel").is(":visible")){var e=$("#input-save-map").val(),o=sessionStorage.getItem("data");this.reloadChart(e,o)}})});
\ No newline at end of file
+function createMap(t,e){var o=sessionStorage.getItem("lat"),a=sessionStorage.getItem("lng");o&&a||(o=49.61,a=6.13);var i=new google.maps.LatLng(parseFloat(o),parseFloat(a)),n=sessionStorage.getItem("zoom");n||(n=4);var s={center:i,zoom:parseInt(n),maxZoom:30,streetViewControl:!1},r=new google.maps.Map(document.getElementById("map"),s),h={getTileUrl:function(o,a){var i="https://earthengine.googleapis.com/map",n=[i,t,a,o.x,o.y].join("/");return n+="?token="+e},tileSize:new google.maps.Size(256,256)},l=new google.maps.ImageMapType(h);return r.overlayMapTypes.push(l),r}function useGeolocalization(t){var e=new google.maps.InfoWindow({map:t});navigator.geolocation?navigator.geolocation.getCurrentPosition(function(o){var a={lat:o.coords.latitude,lng:o.coords.longitude};e.setPosition(a),e.setContent("Location found"),t.setCenter(a)},function(){console.log("Error with geolocation current position"+e)}):console.log("Browser does not allow HTML geolocalization"+e)}function findRandomColor(t){t||(t=1+6*(1+Math.floor(Math.random()*100)));var e=["aqua","black","blue","fuchsia","gray","green","lime","maroon","navy","olive","orange","purple","red","silver","teal","white","yellow"];return e[t%e.length]}function addCountries(t){t.forEach(function(t){var e=sessionStorage.getItem(t);if(e)this.map.data.addGeoJson(JSON.parse(e));else{var o="static/countries/"+t+".geo.json";this.map.data.loadGeoJson(o),$.get(o,function(e){try{sessionStorage.setItem(t,JSON.stringify(e))}catch(o){}})}this.map.data.setStyle(function(t){id=t.j;for(var e=0,o=0;id.length>o;o++)e+=id.charCodeAt(o);var a=findRandomColor(e);return{fillColor:a,fillOpacity:.1,strokeColor:a,strokeWeight:2}})}.bind(this))}function removeCountries(){this.map.data.forEach(function(t){map.data.remove(t)})}function handleCountryClick(t){this.clear();var e=t.feature;this.map.data.overrideStyle(e,{strokeWeight:4,fillOpacity:.5}),this.title=e.f.name;var o="https://en.wikipedia.org/wiki/"+this.title;$("#panel-wiki").show().attr("href",o);var a=e.j,i=$("#input-save-map").val();this.getDetails(a,i)}function getDetails(t,e){$("#spinner").show();var o=this,a=this.getStatic(t,e);a||$.get("/details/"+e+"/"+t,null,null,"text").done(function(t){$("#spinner").hide(),t&&sessionStorage.setItem("data",t),o.reloadChart(e,t)}.bind(this)).fail(function(t,e,o){console.log("Error getDetails: "+o+" status: "+e),$("#spinner").hide(),$("#dialog-text").text("Request error"),$("#dialog").show()})}function getAllStatic(t){localStorage.removeItem("map_data"),$.get("/static/details/mapid_"+t+".json").done(function(t){if(t)try{localStorage.setItem("map_data",JSON.stringify(t))}catch(e){}}.bind(this)).fail(function(t,e,o){console.log("Error getAllDetails Static: "+o+" status: "+e)})}function getStatic(t,e){var o=JSON.parse(localStorage.getItem("map_data"));if(o){$("#spinner").hide();var a=o[t];return a&&sessionStorage.setItem("data",JSON.stringify(a)),this.reloadChart(e,a),!0}return!1}function getStaticAllDetails(t){var e=JSON.parse(localStorage.getItem("map_data"));return e?(this.showAllCharts(t,e),!0):!1}function getAllDetails(t){$("#spinner").show();var e=getStaticAllDetails(t);if(!e){var o=this,a=[],i=0,n=new XMLHttpRequest,s=function(){var e=n.responseText,s=e.lastIndexOf("\n");i>s||(e.substring(i,s).split("\n").forEach(function(t){if(t){var e=JSON.parse(t);e.error&&!e.id?($("#dialog-text").text(e.error),$("#dialog").show()):e.error||a.push(e)}}),i=s+1,o.showAllCharts(t,a))};n.open("GET","/details/"+t+"?stream=1"),n.setRequestHeader("Accept","application/x-ndjson"),n.onprogress=s,n.onload=function(){s(),$("#spinner").hide()},n.onerror=function(){console.log("Error getAllDetails status: "+n.status),$("#spinner").hide(),$("#dialog-text").text("Request error"),$("#dialog").show()},n.send()}}function clear(){$("#panel-title").empty().hide(),$("#panel-wiki").hide().attr("href",""),$("#panel-chart").empty().hide(),$("#panel").hide(),$("#panel-chart-line").hide(),$("#panel-chart-bar").hide(),$("#panel-chart-geo").hide(),$("#panel-chart-histogram").hide(),$("#panel-chart-pie").hide(),$("#show-all-countries").hide(),this.map.data.revertStyle()}function getMap(t){$("#spinner").show(),this.clear(),$.get("/map/"+t).done(function(t){$("#map").append(t),$("#spinner").hide()}).fail(function(t,e,o){console.log("Error getMap: "+o+" status: "+e),$("#spinner").hide(),$("#dialog-text").text("Request error"),$("#dialog").show()})}function saveCountriesCache(t){setTimeout(function(){$.get("/save/"+t).done(function(t){var e=JSON.parse(t);e.status&&e[false]}.bind(this)).fail(function(t,e,o){console.log("Error saveCountries: "+o+" status: "+e),$("#spinner").hide(),$("#dialog-text").text("Request error"),$("#dialog").show()})},3e3)}function saveCountriesStatic(t){setTimeout(function(){$.get("/static/"+t).done(function(t){var e=JSON.parse(t);e.status&&e[false]}.bind(this)).fail(function(t,e,o){console.log("Error saveCountries: "+o+" status: "+e),$("#spinner").hide(),$("#dialog-text").text("Request error"),$("#dialog").show()})},3e3)}function reloadChart(t,e){$("#spinner").hide(),$("#dialog").hide();var o=!1;try{var a=JSON.parse(e)}catch(i){var a=e}var n;a?a.timeSeries&&a.timeSeries?this.showCharts(t,a.timeSeries):a.elevation&&a.elevation?($("#show-all-countries").show(),this.showGeoChart(this.title,a.elevation)):a.histogram&&a.histogram?this.showHistogram(this.title,a.histogram):a.forestChange&&a.forestChange?this.showPieChart(this.title,a.forestChange):a.error?(o=!0,n=a.error):(o=!0,n="Sorry, there is no data available"):(o=!0,n="Undefined error"),o?($("#panel-wiki").hide(),$("#dialog-text").text(n),$("#dialog").show()):($("#panel").fadeIn(500),$("#panel-title").show().text(this.title),this.title!=="Custom"?$("#panel-wiki").show():$("#panel-wiki").hide())}function showCharts(t,e){for(var o=0;e.length>o;o++){var a=e[o];if(a!=null){if(e.length>o+1){var i=e[o+1];i!=null&&a[0]==i[0]&&(e.splice(o+1,1),a[1]=(a[1]+i[1])/2)}a[0]=new Date(parseInt(a[0],10))}}this.data=new google.visualization.DataTable,this.data.addColumn("date"),this.data.addColumn("number"),this.data.addRows(e),t=="0"?this.options={title:"High",hAxis:"Date",vAxis:"Elevation"}:t=="1"?this.options={title:"Lights",hAxis:"Date",vAxis:"Luminosity"}:t=="2"?this.options={title:"Temperature",hAxis:"Date",vAxis:"Celsius Degrees"}:t=="3"?this.options={title:"Water Occurrence Change Intensity",hAxis:"Date",vAxis:"Water"}:t=="4"?this.options={title:"Water Change",hAxis:"Date",vAxis:"Water",legend:"0: 'No observations', 1: 'Not water', 2: 'Seasonal water', 3: 'Permanent water'"}:t=="5"?this.options={title:"Forest Change",hAxis:"Date",vAxis:"Pixels representing loss"}:t=="6"&&(this.options={title:"Vegetation Index",hAxis:"Date",vAxis:"NDVI"}),this.columnNames=[this.options.hAxis,this.options.vAxis],t!=1&&t!=4?this.showLineChart(this.options,this.data):this.showBarChart(this.options,this.data)}function showAllCharts(t,e){if($("#panel-title").text("All countries"),t=="0"&&(this.columnNames=["Country","Elevation"]),elems=[this.columnNames],Array.isArray(e))e.forEach(function(e){if(e!=null&&e!=void 0){var o=[];o[0]=e.name;var a=e.data;typeof a=="string"&&(a=JSON.parse(a)),t=="0"&&(o[1]=a.elevation),o[1]!=null&&elems.push(o)}}),t=="0"&&this.showAllGeoChart(elems);else if(this.countries){var o=this.countries.length,a=0;this.countries.forEach(function(i){$.get("/country/"+i).done(function(n){a++;try{var s=e[i];if(s!=null&&s!=void 0){var r=[];r[0]=n,t=="0"&&(r[1]=s.elevation),r[1]!=null&&elems.push(r),t=="0"&&this.showAllGeoChart(elems)}}catch(s){}a==o&&$("#spinner").hide()}.bind(this)).fail(function(t,e,i){a++,a==o&&$("#spinner").hide(),console.log("Error getCountryName: "+i+" status: "+e),$("#dialog-text").text("Request error"),$("#dialog").show()})})}}function showGeoChart(t,e){this.type="GeoChart",this.getScreenDimensions(),this.columnNames=["Country","Elevation"],this.data=google.visualization.arrayToDataTable([this.columnNames,[t,e]]),this.options={title:"Elevation Average",width:this.width,height:this.height,colorAxis:{colors:["blue"]}},this.chart=new google.visualization.GeoChart(document.getElementById("panel-chart-geo")),this.chart.draw(this.data,this.options),$("#panel-wide").css("width",this.width),$("#button-panel-line").hide(),$("#button-panel-bar").hide(),$("#panel-chart-geo").show(),this.prepareChartLink()}function showAllGeoChart(t){this.type="GeoChart",this.getScreenDimensions(),this.data=google.visualization.arrayToDataTable(t),this.options={title:"Elevation Average",width:this.width,height:this.height,colorAxis:{colors:["white","blue","black"]}},this.chart=new google.visualization.GeoChart(document.getElementById("panel-chart-geo")),this.chart.draw(this.data,this.options),this.zoom=!0,$("#panel-wide").css("width",this.width),$("#button-panel-line").hide(),$("#button-panel-bar").hide(),$("#panel-chart-geo").show(),$("#show-all-countries").hide(),this.prepareChartLink()}function showLineChart(t,e,o,a){this.type="LineChart",o&&a||(this.getScreenDimensions(),o=this.width,a=this.height),$("#panel-wide").css("width",o);var i=t.title;t.legend&&(i=i+" - "+t.legend),this.chart=new google.visualization.ChartWrapper({chartType:"LineChart",dataTable:e,options:{title:i,curveType:"function",legend:{position:"none"},titletextStyle:{fontName:"Roboto"},width:o,height:a,hAxis:{title:t.hAxis},vAxis:{title:t.vAxis}}}),$("#panel-chart-line").show(),$("#panel-chart-bar").hide(),$("#button-panel-line").hide(),$("#button-panel-bar").show();var n=$("#panel-chart-line").get(0);this.chart.setContainerId(n),this.chart.draw(),this.prepareChartLink(!0)}function showBarChart(t,e,o,a){this.type="BarChart",o&&a||(this.getScreenDimensions(),o=this.width,a=this.height),$("#panel-wide").css("width",o);var i=t.title;t.legend&&(i=i+" - "+t.legend),this.chart=new google.visualization.ChartWrapper({chartType:"ColumnChart",dataTable:e,options:{title:i,legend:{position:"none"},titleTextStyle:{fontName:"Roboto"},width:o,height:a,hAxis:{title:t.hAxis},vAxis:{title:t.vAxis}}}),$("#panel-chart-line").hide(),$("#panel-chart-bar").show(),$("#button-panel-line").show(),$("#button-panel-bar").hide();var n=$("#panel-chart-bar").get(0);this.chart.setContainerId(n),this.chart.draw(),this.prepareChartLink(!0)}function showHistogram(t,e){this.type="Histogram",this.getScreenDimensions(),this.columnNames=["Country","Water Occurence"];var o=[this.columnNames];e.forEach(function(e){var a=[];a[0]=t,a[1]=e,o.push(a)}),this.data=google.visualization.arrayToDataTable(o),this.options={title:"Water Occurrence Change Intensity",width:this.width,height:this.height,colorAxis:{colors:["blue"]},legend:{position:"none"}},this.chart=new google.visualization.Histogram(document.getElementById("panel-chart-histogram")),this.chart.draw(this.data,this.options),$("#panel-wide").css("width",this.width),$("#button-panel-line").hide(),$("#button-panel-bar").hide(),$("#panel-chart-histogram").show(),this.prepareChartLink()}function showPieChart(t,e){this.type="PieChart",this.getScreenDimensions(),this.columnNames=["Status","Percentage"],e[1]||e[2]||($("#dialog-text").text("There is not enough forest data to create a chart"),$("#dialog").show()),this.data=google.visualization.arrayToDataTable([this.columnNames,["Gain",e[1]*100],["Loss",e[2]*100]]),this.options={title:"Forest change - Total forest in area: "+(e[0]/255*100).toFixed(3)+"%",width:this.width,height:this.height,pieSliceText:"none"},this.width>this.height&&(this.options.legend={position:"labeled"}),this.chart=new google.visualization.PieChart(document.getElementById("panel-chart-pie")),this.chart.draw(this.data,this.options),$("#panel-wide").css("width",this.width),$("#button-panel-line").hide(),$("#button-panel-bar").hide(),$("#panel-chart-pie").show(),this.prepareChartLink()}function getScreenDimensions(){var t=$(window).width(),e=$(window).height();t>800?this.zoom?(this.width=1e3,this.height=500):(this.width=800,this.height=350):(this.height=e-90,this.width=t)}function showMapInfo(t){$("#map-title").text(MapTitle[t]),$("#map-info span").text(MapInfo[t]),$("#map-info").show()}function prepareChartLink(t){setTimeout(function(){if(t)try{this.chart=this.chart.getChart()}catch(e){}if(this.chart!=null)try{var o=this.chart.getImageURI();$("#open-chart").attr("href",o);var a=this.options.title+" in "+$("#panel-title").text()+" Chart Image.png";$("#open-chart").attr("download",a)}catch(e){}},1e3)}function dataTableToCSV(){for(var t,e=this.data.getNumberOfColumns(),o=this.data.getNumberOfRows(),a=[],i=0;e>i;i++)a.push(this.columnNames[i].replace(/;/g,""));for(t=a.join(";")+"\r\n",i=0;o>i;i++){for(var n=[],s=0;e>s;s++)n.push(this.data.getFormattedValue(i,s).replace(/;/g,""));t+=n.join(";")+"\r\n"}return t}function downloadCSV(t,e){var o=new Blob([t],{type:"text/csv;charset=utf-8"}),a=window.URL||window.webkitURL,i=document.createElement("a");i.href=a.createObjectURL(o),i.download=e+".csv",document.body.appendChild(i),i.click()}function polygonDraw(t){var e=this;$("#menu-draw-color").children("i").css("color",t),this.drawingManager=new google.maps.drawing.DrawingManager({drawingMode:google.maps.drawing.OverlayType.POLYGON,drawingControl:!1,polygonOptions:{fillColor:t,strokeColor:t}}),google.maps.event.addListener(this.drawingManager,"overlaycomplete",function(t){e.polygon=t.overlay,e.stopDrawing(),e.saveStorage()}),this.drawingManager.setMap(this.map)}function stopDrawing(){this.drawingManager.setOptions({drawingMode:null}),this.drawingManager.setMap(null)}function saveStorage(){sessionStorage.setItem("zoom",JSON.stringify(this.map.getZoom()));var t=this.map.getCenter().lat(),e=this.map.getCenter().lng();sessionStorage.setItem("lat",t),sessionStorage.setItem("lng",e)}function clearStorage(){sessionStorage.removeItem("zoom"),sessionStorage.removeItem("lat"),sessionStorage.removeItem("lng"),sessionStorage.removeItem("data"),localStorage.removeItem("map_data")}function allowDrawing(t){(!this.color||t)&&(this.color=this.findRandomColor()),$("#menu-draw-color").children("i").css("color",this.color),this.polygon?(this.polygon.setOptions({fillColor:this.color,strokeColor:this.color}),this.stopDrawing()):this.polygonDraw(this.color)}function getCoordinates(t){var e=t.getPath().getArray();return e.map(function(t){return[t.lng(),t.lat()]})}function removePolygon(){this.polygon&&(this.polygon.setMap(null),this.polygon=null)}function sendPolygon(){var t=this;if(this.polygon){var e=getCoordinates(polygon),o={type:"FeatureCollection",features:[{type:"Feature",id:"EXA",properties:{name:"Custom"},geometry:{type:"Polygon",coordinates:[e]}}]},a=JSON.stringify(o);$("#spinner").show(),t.title="Custom";var i=$("#input-save-map").val(),n=t.map.getZoom();$.post("/custom/"+i+"/"+n,a).done(function(e){var o=JSON.parse(e);sessionStorage.setItem("data",JSON.stringify(o)),t.reloadChart(i,e)}.bind(this)).fail(function(t,e,o){console.log("Error sendPolygon: "+o+" status: "+e),$("#spinner").hide(),$("#dialog-text").text("Request error"),$("#dialog").show()})}else $("#dialog-text").text("You must create a polygon first"),$("#dialog").show()}function zoomChart(t){if(t.zoom){var e=800,o=350;t.zoom=!1}else{var e=1e3,o=500;t.zoom=!0}t.type=="GeoChart"?(t.chart=new google.visualization.GeoChart(document.getElementById("panel-chart-geo")),t.options.width=e,t.options.height=o,t.chart.draw(t.data,t.options),t.prepareChartLink()):this.type=="LineChart"?(e==1e3&&(e+=200),t.showLineChart(t.options,t.data,e,o)):t.type=="BarChart"?(e==1e3&&(e+=200),t.showBarChart(t.options,t.data,e,o)):t.type=="Histogram"?(t.chart=new google.visualization.Histogram(document.getElementById("panel-chart-histogram")),t.options.width=e,t.options.height=o,t.chart.draw(t.data,t.options),t.prepareChartLink()):(t.type="PieChart")&&(t.chart=new google.visualization.PieChart(document.getElementById("panel-chart-pie")),t.options.width=e,t.options.height=o,t.chart.draw(t.data,t.options),t.prepareChartLink()),$("#panel-wide").css("width",e)}function initSearchPlaces(t){var e=this,o=document.getElementById("search-input"),a=new google.maps.places.SearchBox(o);t.controls.push(o);var i=new google.maps.InfoWindow,n=new google.maps.Geocoder,s=new google.maps.Marker({map:t});t.addListener("bounds_changed",function(){a.setBounds(t.getBounds())}),this.markers&&this.markers.forEach(function(t){t.setMap(null)}),this.markers=[],a.addListener("places_changed",function(){i.close();var o=a.getPlaces();if(o.length!=0){e.markers.forEach(function(t){t.setMap(null)}),e.markers=[];var r=new google.maps.LatLngBounds;o.forEach(function(o){if(!o.geometry)return console.log("Returned place contains no geometry"),void 0;o.place_id&&n.geocode({placeId:o.place_id},function(e,a){return a!=="OK"?(window.alert("Geocoder failed due to: "+a),void 0):(s.setPlace({placeId:o.place_id,location:e[0].geometry.location}),s.setVisible(!0),document.getElementById("place-name").textContent=o.name,document.getElementById("place-id").textContent=o.place_id,document.getElementById("place-address").textContent=e[0].formatted_address,i.setContent(document.getElementById("place-content")),i.open(t,s),void 0)});var a={url:o.icon,size:new google.maps.Size(71,71),origin:new google.maps.Point(0,0),anchor:new google.maps.Point(17,34),scaledSize:new google.maps.Size(25,25)};s?e.markers.push(s):e.markers.push(new google.maps.Marker({map:t,icon:a,title:o.name,position:o.geometry.location})),o.geometry.viewport?r.union(o.geometry.viewport):r.extend(o.geometry.location)}),t.fitBounds(r),t.setZoom(14),$("#search-button").removeClass("search-button-show"),$("#search-input").hide(),$("#map-info").hide()}})}function handleAbout(){var t=document.querySelector("#snackbar-about"),e=document.querySelector("#button-about");e.addEventListener("click",function(){var e={message:"Made by Mónica Pastor",timeout:4e3};t.MaterialSnackbar.showSnackbar(e)})}function attachListeners(){var t=this;t.zoom=!1,$(".change_map").click(function(){var e=$(this).attr("map_id");t.getMap(e),$("#panel").hide(),$("#input-save-map").val(e),$("#switch-draw").attr("cheched",!1)});var e=document.querySelector("dialog");e.showModal||dialogPolyfill.registerDialog(e),$("#dialog-close").click(function(){$("#dialog").hide()}),$("#panel-close").click(function(){$("#panel").hide()}),$("#panel-download").click(function(){var e=t.dataTableToCSV(),o=t.options.title+" in "+$("#panel-title").text();t.downloadCSV(e,o)}),$("#button-zoom-map").click(function(){t.zoomChart(t)}),$("#button-panel-line").click(function(){t.zoom=!1,$("#button-panel-line").hide(),$("#panel-chart-bar").hide(),$("#button-panel-bar").show(),t.showLineChart(t.options,t.data),$("#panel-chart-line").show()}),$("#button-panel-bar").click(function(){t.zoom=!1,$("#button-panel-bar").hide(),$("#panel-chart-line").hide(),$("#button-panel-line").show(),t.showBarChart(t.options,t.data),$("#panel-chart-bar").show()}),$("#close-map-info").click(function(){$(this).parent().hide(),$("#info-button").show(),$("#info-label").show()}),$("#show-all-countries").click(function(){var e=$("#input-save-map").val();t.getAllDetails(e)}),$("#switch-draw").change(function(){$(this).is(":checked")?(t.drawing=!0,$(this).attr("checked",!1),$("#menu-draw").show(),$("#panel").hide(),t.color="#ff0000",t.polygonDraw(t.color),t.removeCountries()):(t.drawing=!1,$(this).attr("checked",!0),$("#menu-draw").hide(),t.removePolygon(),t.stopDrawing(),t.addCountries(t.countries),t.clearStorage())}),$("#menu-draw-clear").click(function(){t.removePolygon(),t.allowDrawing()}),$("#menu-draw-done").click(function(){t.sendPolygon()}),$("#show-menu-draw").click(function(){$("#menu-draw").show()}),$("#menu-draw-color").click(function(){t.allowDrawing(!0)}),$("#menu-draw-close").click(function(){$("#menu-draw").hide(),$("#button-draw").show(),$("#draw-label").show()}),$("#button-draw").click(function(){$(this).hide(),$("#menu-draw").show(),$("#draw-label").hide()}),$("#search-button").click(function(){$("#panel").hide(),$(this).hasClass("search-button-show")?($(this).removeClass("search-button-show"),$("#search-input").hide(),t.markers&&t.markers.forEach(function(t){t.setMap(null)})):($(this).addClass("search-button-show"),$("#search-input").show(),$("#search-input").focus(),t.map&&t.initSearchPlaces(t.map))}),$("#info-button").click(function(){$("#map-info").show(),$(this).hide(),$("#info-label").hide()}),$("#google-button-clear").click(function(){$("#map-info").hide(),$(this).hide(),$("#google-button-show").show(),$("#info-label-clear").hide(),$("#info-label-show").show(),t.mapPrev=t.map.overlayMapTypes.pop()}),$("#google-button-show").click(function(){$("#map-info").show(),$(this).hide(),$("#google-button-clear").show(),$("#info-label-show").hide(),$("#info-label-clear").show(),t.mapPrev&&t.map.overlayMapTypes.push(t.mapPrev)})}function removeListeners(){$(".change_map").off(),$("#dialog-close").off(),$("#panel-close").off(),$("#panel-download").off(),$("#button-zoom-map").off(),$("#button-panel-line").off(),$("#button-panel-bar").off(),$("#close-map-info").off(),$("#show-all-countries").off(),$("#switch-draw").off(),$("#menu-draw-clear").off(),$("#menu-draw-done").off(),$("#show-menu-draw").off(),$("#menu-draw-color").off(),$("#menu-draw-close").off(),$("#button-draw").off(),$("#search-button").off(),$("#info-button").off(),$("#google-button-clear").off(),$("#google-button-show").off()}var initialize=function(t,e,o,a,i){i&&(this.clearStorage(),this.data_map={}),this.removeListeners(),this.map=this.createMap(e,o),this.countries=JSON.parse(a),this.drawing?(this.polygon&&this.drawingManager&&(this.polygon.setMap(this.map),this.drawingManager.setMap(this.map)),this.allowDrawing(),$("#menu-draw").show()):this.addCountries(this.countries),this.map.data.addListener("click",handleCountryClick.bind(this)),this.attachListeners(),$("#input-save-map").val(t),this.showMapInfo(t),this.getAllStatic(t),$(window).on("load",function(){this.handleAbout()})},MapTitle=["Elevation","Lights","Temperature","Water Occurrence","Water Change","Forest Change","Vegetation"],MapInfo=["The SRTM elevation map uses a scale from 0 to 3000 using a spectrum palette of blue, green and red, where blue indicates less height and red the most","NOAA Lights map give us a representation of the brightness of each country","The MODIS Land	Surface	Temperature	map	runs on	a scale	of 0 to	40°C, where	blue indicates colder values and red indicates warmer values. White	indicates values in	the middle of the spectrum, around 20°C","Water Occurrence provides a summary of where and how often surface water occurred over time, using red as minimum and blue as maximum","The Water Change map shows the places that water has reduced in red and in green where it has grown","The Forest Change map represents forest change, is green where there's forest, red where there's forest loss, blue where there's forest gain, and magenta where there's both gain and loss.","The MODIS Normalized Difference Vegetation Index (NDVI) map runs on a scale of 0 to 1, where white and brown indicate no to low vegetation, and green to black indicate medium to high vegetation."];$(function(){($(document).width()>1e3||$(document).height()>1e3)&&($("#panel").draggable(),$("#menu-draw").draggable(),$("#map-info").draggable()),$(window).on("orientationchange",function(){if(800>$(document).width()&&$("#panel").is(":visible")){var t=$("#input-save-map").val(),e=sessionStorage.getItem("data");this.reloadChart(t,e)}})});
\ No newline at end of file
@@ -4,8 +4,11 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from urllib2 import Request, urlopen
-from json import loads
+try:
+    from urllib.request import Request, urlopen
+except ImportError:
+    from urllib2 import Request, urlopen
+from json import loads, dumps
 
 URL = 'http://localhost:8080'
 DELAY = 200
@@ -102,6 +105,43 @@ class TestCase(unittest.TestCase):
         except Exception as e:
             self.assertIn('500', str(e))
 
+    def testCacheStats(self):
+        res = urlopen(URL + '/cache/stats')
+        self.assertEqual(res.code, 200)
+        stats = loads(res.read())
+        self.assertIn('local_hits', stats)
+        self.assertIn('misses', stats)
+
+    def testReadiness(self):
+        res = urlopen(URL + '/_ah/ready')
+        self.assertEqual(res.code, 200)
+        status = loads(res.read())
+        self.assertTrue(status['ready'])
+        self.assertEqual(len(status['workers']), status['expected'])
+        self.assertIn('map_ids', status['worker']['steps'])
+
+    def testMetrics(self):
+        urlopen(URL + '/country/ESP')
+        res = urlopen(URL + '/metrics')
+        self.assertEqual(res.code, 200)
+        body = res.read().decode('utf-8')
+        self.assertIn('# TYPE earthengine_app_request_seconds histogram', body)
+        self.assertIn('earthengine_app_cache_lookups_total', body)
+
+    def testCustomBatch(self):
+        square = lambda x: {'type': 'Polygon', 'coordinates': [[[x, 40], [x + 1, 40], [x + 1, 41], [x, 41], [x, 40]]]}
+        collection = {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'id': 'a', 'properties': {}, 'geometry': square(0)},
+            {'type': 'Feature', 'id': 'b', 'properties': {}, 'geometry': square(2)},
+            {'type': 'Feature', 'id': 'c', 'properties': {}, 'geometry': {'type': 'Point', 'coordinates': [0, 40]}}
+        ]}
+        res = urlopen(Request(URL + '/custom/0/4/batch', dumps(collection)))
+        self.assertEqual(res.code, 200)
+        batch = loads(res.read())
+        self.assertIn('elevation', batch['results']['a'])
+        self.assertIn('elevation', batch['results']['b'])
+        self.assertIn('c', batch['errors'])
+
 
 if __name__ == '__main__':
     unittest.main(verbosity = 2)
\ No newline at end of file
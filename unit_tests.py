@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+# Runs the app against the fake Earth Engine of the benchmark, no credentials
+# or browser needed, unlike tests.py
+REPO_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(REPO_PATH, 'benchmark'))
+os.chdir(REPO_PATH)
+
+import ee
+import main
+import jobs
+import numpy
+
+MAP_ID = '2'
+COUNTRY_IDS = ['AFG', 'ALB', 'DZA', 'AGO', 'ESP']
+
+class CheckpointTestCase(unittest.TestCase):
+
+    def setUp(self):
+        ee.configure(latency = 0, images = 5)
+        self.details_path = main.DETAILS_PATH
+        self.countries = main.COUNTRIES_ID
+        self.workdir = tempfile.mkdtemp()
+        main.DETAILS_PATH = self.workdir + os.sep
+        main.COUNTRIES_ID = COUNTRY_IDS
+
+    def tearDown(self):
+        main.DETAILS_PATH = self.details_path
+        main.COUNTRIES_ID = self.countries
+        shutil.rmtree(self.workdir, ignore_errors = True)
+
+    def precompute(self, resume = True):
+        computed = []
+        progress = main.PrecomputeDetailsFile(MAP_ID, lambda country_id, details: computed.append(country_id), resume)
+        return progress, computed
+
+    def readDetailsFile(self):
+        with open(main.DetailsFilePath(MAP_ID)) as f:
+            return json.load(f)
+
+    def readCheckpointLines(self):
+        with open(main.CheckpointPath(MAP_ID), 'rb') as f:
+            return f.read().decode('utf-8').split('\n')
+
+    def testResumeSkipsUnchangedCountries(self):
+        progress, computed = self.precompute(resume = False)
+        self.assertEqual(progress['failed'], 0)
+        self.assertEqual(sorted(computed), sorted(COUNTRY_IDS))
+        progress, computed = self.precompute()
+        self.assertEqual(progress['failed'], 0)
+        self.assertEqual(progress['skipped'], len(COUNTRY_IDS))
+        self.assertEqual(computed, [])
+        self.assertEqual(sorted(self.readDetailsFile()), sorted(COUNTRY_IDS))
+
+    def testResumeRecomputesChangedInputs(self):
+        self.precompute(resume = False)
+        # A new image changes the version of the layer
+        ee.configure(images = 6)
+        progress, computed = self.precompute()
+        self.assertEqual(progress['skipped'], 0)
+        self.assertEqual(sorted(computed), sorted(COUNTRY_IDS))
+        for details in self.readDetailsFile().values():
+            self.assertEqual(len(details['timeSeries']), 6)
+
+    def testResumeTruncatesCutLine(self):
+        self.precompute(resume = False)
+        lines = [line for line in self.readCheckpointLines() if line]
+        cut = json.loads(lines[-1])['country']
+        # A crash while the last country was written
+        with open(main.CheckpointPath(MAP_ID), 'w') as f:
+            f.write('\n'.join(lines[:-1]) + '\n' + lines[-1][:len(lines[-1]) // 2])
+        progress, computed = self.precompute()
+        self.assertEqual(progress['failed'], 0)
+        self.assertEqual(computed, [cut])
+        lines = self.readCheckpointLines()
+        self.assertEqual(lines[-1], '')
+        self.assertEqual(sorted(json.loads(line)['country'] for line in lines[:-1]), sorted(COUNTRY_IDS))
+        self.assertEqual(sorted(self.readDetailsFile()), sorted(COUNTRY_IDS))
+
+    def testFailsWhenCountryMissing(self):
+        precompute_layer = main.PrecomputeLayer
+        def losingPrecomputeLayer(map_id, store, countries, **kwargs):
+            # Loses the checkpoint line of the first country
+            return precompute_layer(map_id, lambda country_id, details: country_id != COUNTRY_IDS[0]
+                and store(country_id, details), countries, **kwargs)
+        main.PrecomputeLayer = losingPrecomputeLayer
+        try:
+            progress, computed = self.precompute(resume = False)
+        finally:
+            main.PrecomputeLayer = precompute_layer
+        self.assertEqual(progress['failed'], 1)
+        self.assertIn(COUNTRY_IDS[0], progress['message'])
+        self.assertFalse(os.path.exists(main.DetailsFilePath(MAP_ID)))
+
+
+def ms(date):
+    return int(numpy.datetime64(date, 'ms').astype(numpy.int64))
+
+class AggregationTestCase(unittest.TestCase):
+
+    def testDecodeTimeSeries(self):
+        times = [ms('2020-03-01'), ms('2020-01-01'), ms('2020-01-01'), ms('2020-02-01')]
+        values = [4.0, 1.0, 3.0, float('nan')]
+        self.assertEqual(main.DecodeTimeSeries({}, times, values),
+            [[ms('2020-01-01'), 2.0], [ms('2020-03-01'), 4.0]])
+        self.assertEqual(main.DecodeTimeSeries({'convert': lambda v: v * 10}, times, values),
+            [[ms('2020-01-01'), 20.0], [ms('2020-03-01'), 40.0]])
+        self.assertEqual(main.DecodeTimeSeries({}, [ms('2020-01-01')], [None]), [])
+
+    def testPeriodStarts(self):
+        times = numpy.array([ms('2019-12-15'), ms('2020-02-29'), ms('2020-03-01'), ms('2020-11-30')], dtype = numpy.float64)
+        self.assertEqual(main.PeriodStarts(times, 'monthly').tolist(),
+            [ms('2019-12-01'), ms('2020-02-01'), ms('2020-03-01'), ms('2020-11-01')])
+        self.assertEqual(main.PeriodStarts(times, 'yearly').tolist(),
+            [ms('2019-01-01'), ms('2020-01-01'), ms('2020-01-01'), ms('2020-01-01')])
+        # Winter starts in December of the previous year
+        self.assertEqual(main.PeriodStarts(times, 'seasonal').tolist(),
+            [ms('2019-12-01'), ms('2019-12-01'), ms('2020-03-01'), ms('2020-09-01')])
+
+    def testPeriodStartsBefore1970(self):
+        # Months before the epoch have negative indices
+        times = numpy.array([ms('1969-01-10'), ms('1969-11-10'), ms('1969-12-10'), ms('1970-02-10')], dtype = numpy.float64)
+        self.assertEqual(main.PeriodStarts(times, 'seasonal').tolist(),
+            [ms('1968-12-01'), ms('1969-09-01'), ms('1969-12-01'), ms('1969-12-01')])
+
+    def testDownsampleLTTB(self):
+        times = numpy.arange(100, dtype = numpy.float64)
+        values = numpy.zeros(100)
+        values[37] = 50.0
+        kept = main.DownsampleLTTB(times, values, 10)
+        self.assertEqual(len(kept), 10)
+        self.assertEqual(kept[0], 0)
+        self.assertEqual(kept[-1], 99)
+        self.assertIn(37, kept.tolist())
+        self.assertEqual(kept.tolist(), sorted(kept.tolist()))
+        self.assertEqual(main.DownsampleLTTB(times[:5], values[:5], 10).tolist(), [0, 1, 2, 3, 4])
+
+    def testAggregateDetails(self):
+        details = {'timeSeries': [[ms('2020-01-05'), 1.0], [ms('2020-01-20'), 3.0], [ms('2020-04-01'), 5.0]]}
+        self.assertEqual(main.AggregateDetails(details, 'monthly'),
+            {'timeSeries': [[ms('2020-01-01'), 2.0], [ms('2020-04-01'), 5.0]]})
+        self.assertEqual(main.AggregateDetails(details, 'yearly'), {'timeSeries': [[ms('2020-01-01'), 3.0]]})
+        self.assertEqual(main.AggregateDetails(details, '3'), details)
+        self.assertIs(main.AggregateDetails(details, None), details)
+        self.assertEqual(main.AggregateDetails({'elevation': 10}, 'yearly'), {'elevation': 10})
+        self.assertEqual(main.AggregateDetails({'timeSeries': []}, 'yearly'), {'timeSeries': []})
+
+
+class GeometryTestCase(unittest.TestCase):
+
+    def testNormalizeGeometry(self):
+        ring = [[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]
+        polygon = {'type': 'Polygon', 'coordinates': [ring]}
+        # Reversed, started from another vertex and not closed
+        other = {'type': 'Polygon', 'coordinates': [[[1, 1], [1, 0], [0, 0], [0, 1]]]}
+        self.assertEqual(main.normalizeGeometry(polygon), main.normalizeGeometry(other))
+        self.assertEqual(main.normalizeGeometry(polygon), [[[(0, 0), (1, 0), (1, 1), (0, 1)]]])
+        multi = {'type': 'MultiPolygon', 'coordinates': [[[[5, 5], [6, 5], [6, 6], [5, 5]]], [ring]]}
+        swapped = {'type': 'MultiPolygon', 'coordinates': list(reversed(multi['coordinates']))}
+        self.assertEqual(main.normalizeGeometry(multi), main.normalizeGeometry(swapped))
+        self.assertRaises(Exception, main.normalizeGeometry, {'type': 'Point', 'coordinates': [0, 0]})
+
+    def testNormalizeGeometryHoles(self):
+        outer = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+        hole = [[2, 2], [2, 4], [4, 4], [4, 2], [2, 2]]
+        normalized = main.normalizeGeometry({'type': 'Polygon', 'coordinates': [outer, list(reversed(hole))]})
+        self.assertEqual(normalized, main.normalizeGeometry({'type': 'Polygon', 'coordinates': [outer, hole]}))
+        # Holes are clockwise
+        self.assertEqual(normalized[0][1], [(2, 2), (2, 4), (4, 4), (4, 2)])
+
+
+class CompactTestCase(unittest.TestCase):
+
+    def testRoundTrip(self):
+        details = {'timeSeries': [[3000, 1.123456], [1000, 2.0], [2000, None], [2000, 5.0]]}
+        compact = main.CompactDetails(details)
+        # Sorted, delta encoded, duplicates dropped and rounded
+        self.assertEqual(compact, {'timeSeries': {'t': [1000, 1000, 1000], 'v': [2.0, None, 1.1235]}})
+        self.assertEqual(main.ExpandDetails(compact), {'timeSeries': [[1000, 2.0], [2000, None], [3000, 1.1235]]})
+
+    def testOtherKinds(self):
+        for details in ({'elevation': 1.234567}, {'forestChange': [1.0, 2.0, 3.0]}):
+            self.assertEqual(main.ExpandDetails(main.CompactDetails(details)), main.roundValues(details))
+
+
+class JobQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.queue = jobs.JobQueue(os.path.join(self.workdir, 'jobs.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors = True)
+
+    def testClaimInOrder(self):
+        first = self.queue.enqueue('static', {'map_id': '0'})
+        second = self.queue.enqueue('static', {'map_id': '1'})
+        # Equal to a queued job
+        self.assertEqual(self.queue.enqueue('static', {'map_id': '0'}), first)
+        job = self.queue.claim(worker = 1)
+        self.assertEqual((job['id'], job['state'], job['worker'], job['params']), (first, jobs.RUNNING, 1, {'map_id': '0'}))
+        self.assertEqual(self.queue.claim(worker = 2)['id'], second)
+        self.assertIsNone(self.queue.claim(worker = 3))
+        self.queue.finish(first, result = {'done': 1})
+        self.queue.finish(second, error = 'failed')
+        self.assertEqual(self.queue.get(first)['result'], {'done': 1})
+        self.assertEqual(self.queue.counts(), {jobs.QUEUED: 0, jobs.RUNNING: 0, jobs.DONE: 1, jobs.FAILED: 1})
+        # Finished jobs can be queued again
+        self.assertNotEqual(self.queue.enqueue('static', {'map_id': '0'}), first)
+
+    def testRequeueStale(self):
+        job_id = self.queue.enqueue('save', {'map_id': '0'})
+        self.queue.claim(worker = 1)
+        self.assertEqual(self.queue.requeueStale(60), 0)
+        self.assertEqual(self.queue.requeueStale(-1), 1)
+        job = self.queue.get(job_id)
+        self.assertEqual((job['state'], job['worker']), (jobs.QUEUED, None))
+        self.assertEqual(self.queue.claim(worker = 2)['id'], job_id)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity = 2)
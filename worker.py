@@ -0,0 +1,58 @@
+"""Runs the precompute jobs queued by the web app, see JobQueue in jobs.py.
+
+  python worker.py /tmp/psq.pid
+
+Writes its PID to the given file, checked by the health check of
+monitor.py, then claims queued jobs one at a time until it is stopped.
+"""
+import os
+import sys
+import time
+import signal
+import logging
+
+import main
+
+logger = logging.getLogger(main.LOGGER_TYPE)
+
+PID_FILE = '/tmp/psq.pid'
+
+stopping = False
+
+def stop(signum, frame):
+  global stopping
+  logger.info('Worker stopping after the current job')
+  stopping = True
+
+def writePidFile(path):
+  with open(path, 'w') as f:
+    f.write(str(os.getpid()))
+
+def runJob(queue, job):
+  logger.info('Job ' + str(job['id']) + ' ' + job['kind'] + ' ' + str(job['params']) + ' started')
+  result, error = main.RunJob(job, lambda progress: queue.update(job['id'], progress))
+  queue.finish(job['id'], result, error)
+  logger.info('Job ' + str(job['id']) + (' failed: ' + error if error is not None else ' done'))
+
+def run(queue):
+  requeued = queue.requeueStale(main.JOB_STALE_AGE)
+  if requeued:
+    logger.info('Requeued ' + str(requeued) + ' stale jobs')
+  queue.purge(main.JOB_KEEP_AGE)
+  while not stopping:
+    job = queue.claim(os.getpid())
+    if job is None:
+      time.sleep(main.JOB_POLL_INTERVAL)
+      continue
+    runJob(queue, job)
+
+if __name__ == '__main__':
+  if len(sys.argv) > 1:
+    PID_FILE = sys.argv[1]
+  signal.signal(signal.SIGTERM, stop)
+  signal.signal(signal.SIGINT, stop)
+  writePidFile(PID_FILE)
+  try:
+    run(main.jobs)
+  finally:
+    os.remove(PID_FILE)